@@ -6,354 +6,97 @@ Simple Flask app with embedded database initialization and AI query processing
 
 import os
 import json
+import time
 import logging
-import sqlite3
-from flask import Flask, render_template_string, request, jsonify
-import google.generativeai as genai
-import pandas as pd
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, g, render_template_string, request, jsonify, stream_with_context
+import db
+import cache
+import pagination
+import similarity
+import formatter
+import llm
+import router
+import digest
+import metrics
+import queryplan
+import bootstrap
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Configure Gemini AI
-genai.configure(api_key=os.environ.get("GEMINI_API_KEY"))
-
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key")
 
 # Database path
-DB_PATH = "ecommerce.db"
+DB_PATH = db.DB_PATH
 
 # Function definitions need to be before initialization
 def init_database():
     """Initialize database with tables and sample data"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Create tables
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS products (
-        id INTEGER PRIMARY KEY,
-        product_id TEXT UNIQUE,
-        product_name TEXT,
-        category TEXT,
-        brand TEXT,
-        price REAL
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS total_sales_metrics (
-        id INTEGER PRIMARY KEY,
-        product_id TEXT,
-        total_sales REAL,
-        units_sold INTEGER,
-        revenue REAL,
-        date TEXT,
-        FOREIGN KEY (product_id) REFERENCES products (product_id)
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS ad_sales_metrics (
-        id INTEGER PRIMARY KEY,
-        product_id TEXT,
-        ad_spend REAL,
-        ad_sales REAL,
-        clicks INTEGER,
-        impressions INTEGER,
-        cpc REAL,
-        date TEXT,
-        FOREIGN KEY (product_id) REFERENCES products (product_id)
-    )
-    """)
-    
-    # Check if data exists
-    cursor.execute("SELECT COUNT(*) FROM total_sales_metrics")
-    if cursor.fetchone()[0] == 0:
+    # One process at a time; later ones find the schema current and the workbooks unchanged
+    with db.write_lock(DB_PATH):
+        conn = db.connect(DB_PATH)
+        cursor = conn.cursor()
+        
+        # Create tables and apply schema migrations
+        db.create_schema(conn)
+        
+        # Load new or changed Excel workbooks
         load_excel_data(cursor)
-    
-    conn.commit()
-    conn.close()
+        
+        conn.commit()
+        conn.close()
     logger.info("Database initialized successfully")
 
-def load_excel_data(cursor):
-    """Load data from Excel files"""
+def load_excel_data(cursor, workbooks=None, force=False, mode=None):
+    """Load data from Excel files that changed since the last ingest"""
+    # Imported here: ingest pulls in pandas, which nothing else needs
+    import ingest
+    import rollups
+    
     try:
-        records_loaded = 0
+        summary = ingest.sync_workbooks(cursor, workbooks, force=force, mode=mode)
+        records_loaded = sum(result['rows'] for result in summary.values())
         
-        # Load Total Sales data
-        sales_file = "data/Product-Level Total Sales and Metrics (mapped).xlsx"
-        if os.path.exists(sales_file):
-            df_sales = pd.read_excel(sales_file)
-            logger.info(f"Found sales file with {len(df_sales)} rows, columns: {list(df_sales.columns)}")
-            
-            # Direct mapping for your Excel files
-            actual_cols = {
-                'Product ID': 'item_id',
-                'Total Sales': 'total_sales', 
-                'Units Sold': 'total_units_ordered',
-                'Revenue': 'total_sales',  # Using total_sales as revenue
-                'Date': 'date'
-            }
-            
-            logger.info(f"Mapped columns: {actual_cols}")
-            
-            for _, row in df_sales.iterrows():
-                try:
-                    cursor.execute("""
-                    INSERT INTO total_sales_metrics 
-                    (product_id, total_sales, units_sold, revenue, date) 
-                    VALUES (?, ?, ?, ?, ?)
-                    """, (
-                        str(row.get(actual_cols.get('Product ID', ''), '')),
-                        float(row.get(actual_cols.get('Total Sales', ''), 0)) if pd.notna(row.get(actual_cols.get('Total Sales', ''))) else 0,
-                        int(row.get(actual_cols.get('Units Sold', ''), 0)) if pd.notna(row.get(actual_cols.get('Units Sold', ''))) else 0,
-                        float(row.get(actual_cols.get('Revenue', ''), 0)) if pd.notna(row.get(actual_cols.get('Revenue', ''))) else 0,
-                        str(row.get(actual_cols.get('Date', ''), '2024-01-01'))
-                    ))
-                    records_loaded += 1
-                except Exception as e:
-                    logger.warning(f"Error inserting sales row: {e}")
-                    continue
-        
-        # Load Ad Sales data  
-        ads_file = "data/Product-Level Ad Sales and Metrics (mapped).xlsx"
-        if os.path.exists(ads_file):
-            df_ads = pd.read_excel(ads_file)
-            logger.info(f"Found ads file with {len(df_ads)} rows")
-            
-            # Direct mapping for ad sales data
-            actual_ad_cols = {
-                'Product ID': 'item_id',
-                'Ad Spend': 'ad_spend',
-                'Ad Sales': 'ad_sales', 
-                'Clicks': 'clicks',
-                'Impressions': 'impressions',
-                'CPC': 'ad_spend'  # Will calculate CPC as ad_spend/clicks
-            }
-            
-            for _, row in df_ads.iterrows():
-                try:
-                    cursor.execute("""
-                    INSERT INTO ad_sales_metrics 
-                    (product_id, ad_spend, ad_sales, clicks, impressions, cpc, date) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        str(row.get(actual_ad_cols.get('Product ID', ''), '')),
-                        float(row.get(actual_ad_cols.get('Ad Spend', ''), 0)) if pd.notna(row.get(actual_ad_cols.get('Ad Spend', ''))) else 0,
-                        float(row.get(actual_ad_cols.get('Ad Sales', ''), 0)) if pd.notna(row.get(actual_ad_cols.get('Ad Sales', ''))) else 0,
-                        int(row.get(actual_ad_cols.get('Clicks', ''), 0)) if pd.notna(row.get(actual_ad_cols.get('Clicks', ''))) else 0,
-                        int(row.get(actual_ad_cols.get('Impressions', ''), 0)) if pd.notna(row.get(actual_ad_cols.get('Impressions', ''))) else 0,
-                        (row.get('ad_spend', 0) / row.get('clicks', 1)) if row.get('clicks', 0) > 0 else 0,
-                        '2024-01-01'
-                    ))
-                    records_loaded += 1
-                except Exception as e:
-                    logger.warning(f"Error inserting ad row: {e}")
-                    continue
-        
-        # Load Product data
-        products_file = "data/Product-Level Eligibility Table (mapped).xlsx"
-        if os.path.exists(products_file):
-            df_products = pd.read_excel(products_file)
-            logger.info(f"Found products file with {len(df_products)} rows")
-            
-            for _, row in df_products.iterrows():
-                try:
-                    # Map eligibility data to products
-                    cursor.execute("""
-                    INSERT OR IGNORE INTO products 
-                    (product_id, product_name, category, brand, price) 
-                    VALUES (?, ?, ?, ?, ?)
-                    """, (
-                        str(row.get('item_id', '')),
-                        f"Product {row.get('item_id', '')}",
-                        'General',
-                        'Unknown',
-                        0
-                    ))
-                    records_loaded += 1
-                except Exception as e:
-                    logger.warning(f"Error inserting product row: {e}")
-                    continue
+        # Fold new rows into the rollup tables (built in full the first time)
+        rollup_action = rollups.refresh(cursor, summary)
+        
+        # Refresh planner statistics and invalidate cached query results when any table changed
+        if rollup_action != 'unchanged' or any(result['action'] in ('appended', 'reloaded') for result in summary.values()):
+            cursor.execute("ANALYZE")
+            db.bump_data_version(cursor.connection)
+            result_cache.invalidate()
         
         logger.info(f"Successfully loaded {records_loaded} records from Excel files")
         
-        if records_loaded == 0:
+        cursor.execute("SELECT COUNT(*) FROM total_sales_metrics")
+        if records_loaded == 0 and cursor.fetchone()[0] == 0:
             raise Exception("No records were loaded from Excel files")
         
+        return summary
+        
     except Exception as e:
         logger.error(f"Error loading Excel data: {e}")
         raise Exception(f"Excel data loading failed: {str(e)}")
 
-# Initialize database on startup
-logger.info("Initializing database...")
-init_database()
+# Warm, read-only connections for answering questions
+pool = db.ConnectionPool(DB_PATH)
 
-def init_database():
-    """Initialize database with tables and sample data"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Create tables
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS products (
-        id INTEGER PRIMARY KEY,
-        product_id TEXT UNIQUE,
-        product_name TEXT,
-        category TEXT,
-        brand TEXT,
-        price REAL
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS total_sales_metrics (
-        id INTEGER PRIMARY KEY,
-        product_id TEXT,
-        total_sales REAL,
-        units_sold INTEGER,
-        revenue REAL,
-        date TEXT,
-        FOREIGN KEY (product_id) REFERENCES products (product_id)
-    )
-    """)
-    
-    cursor.execute("""
-    CREATE TABLE IF NOT EXISTS ad_sales_metrics (
-        id INTEGER PRIMARY KEY,
-        product_id TEXT,
-        ad_spend REAL,
-        ad_sales REAL,
-        clicks INTEGER,
-        impressions INTEGER,
-        cpc REAL,
-        date TEXT,
-        FOREIGN KEY (product_id) REFERENCES products (product_id)
-    )
-    """)
-    
-    # Check if data exists
-    cursor.execute("SELECT COUNT(*) FROM total_sales_metrics")
-    if cursor.fetchone()[0] == 0:
-        load_excel_data(cursor)
-    
-    conn.commit()
-    conn.close()
-    logger.info("Database initialized successfully")
+# Paginated result handles returned by /api/ask
+result_store = pagination.ResultStore()
 
-def load_excel_data(cursor):
-    """Load data from Excel files"""
-    try:
-        records_loaded = 0
-        
-        # Load Total Sales data
-        sales_file = "data/Product-Level Total Sales and Metrics (mapped)_1753162181292.xlsx"
-        if os.path.exists(sales_file):
-            df_sales = pd.read_excel(sales_file)
-            logger.info(f"Found sales file with {len(df_sales)} rows, columns: {list(df_sales.columns)}")
-            
-            # Direct mapping for your Excel files
-            actual_cols = {
-                'Product ID': 'item_id',
-                'Total Sales': 'total_sales', 
-                'Units Sold': 'total_units_ordered',
-                'Revenue': 'total_sales',  # Using total_sales as revenue
-                'Date': 'date'
-            }
-            
-            logger.info(f"Mapped columns: {actual_cols}")
-            
-            for _, row in df_sales.iterrows():
-                try:
-                    cursor.execute("""
-                    INSERT INTO total_sales_metrics 
-                    (product_id, total_sales, units_sold, revenue, date) 
-                    VALUES (?, ?, ?, ?, ?)
-                    """, (
-                        str(row.get(actual_cols.get('Product ID', ''), '')),
-                        float(row.get(actual_cols.get('Total Sales', ''), 0)) if pd.notna(row.get(actual_cols.get('Total Sales', ''))) else 0,
-                        int(row.get(actual_cols.get('Units Sold', ''), 0)) if pd.notna(row.get(actual_cols.get('Units Sold', ''))) else 0,
-                        float(row.get(actual_cols.get('Revenue', ''), 0)) if pd.notna(row.get(actual_cols.get('Revenue', ''))) else 0,
-                        str(row.get(actual_cols.get('Date', ''), '2024-01-01'))
-                    ))
-                    records_loaded += 1
-                except Exception as e:
-                    logger.warning(f"Error inserting sales row: {e}")
-                    continue
-        
-        # Load Ad Sales data  
-        ads_file = "data/Product-Level Ad Sales and Metrics (mapped)_1753162181290.xlsx"
-        if os.path.exists(ads_file):
-            df_ads = pd.read_excel(ads_file)
-            logger.info(f"Found ads file with {len(df_ads)} rows")
-            
-            # Direct mapping for ad sales data
-            actual_ad_cols = {
-                'Product ID': 'item_id',
-                'Ad Spend': 'ad_spend',
-                'Ad Sales': 'ad_sales', 
-                'Clicks': 'clicks',
-                'Impressions': 'impressions',
-                'CPC': 'ad_spend'  # Will calculate CPC as ad_spend/clicks
-            }
-            
-            for _, row in df_ads.iterrows():
-                try:
-                    cursor.execute("""
-                    INSERT INTO ad_sales_metrics 
-                    (product_id, ad_spend, ad_sales, clicks, impressions, cpc, date) 
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                    """, (
-                        str(row.get(actual_ad_cols.get('Product ID', ''), '')),
-                        float(row.get(actual_ad_cols.get('Ad Spend', ''), 0)) if pd.notna(row.get(actual_ad_cols.get('Ad Spend', ''))) else 0,
-                        float(row.get(actual_ad_cols.get('Ad Sales', ''), 0)) if pd.notna(row.get(actual_ad_cols.get('Ad Sales', ''))) else 0,
-                        int(row.get(actual_ad_cols.get('Clicks', ''), 0)) if pd.notna(row.get(actual_ad_cols.get('Clicks', ''))) else 0,
-                        int(row.get(actual_ad_cols.get('Impressions', ''), 0)) if pd.notna(row.get(actual_ad_cols.get('Impressions', ''))) else 0,
-                        (row.get('ad_spend', 0) / row.get('clicks', 1)) if row.get('clicks', 0) > 0 else 0,
-                        '2024-01-01'
-                    ))
-                    records_loaded += 1
-                except Exception as e:
-                    logger.warning(f"Error inserting ad row: {e}")
-                    continue
-        
-        # Load Product data
-        products_file = "data/Product-Level Eligibility Table (mapped)_1753162181291.xlsx"
-        if os.path.exists(products_file):
-            df_products = pd.read_excel(products_file)
-            logger.info(f"Found products file with {len(df_products)} rows")
-            
-            for _, row in df_products.iterrows():
-                try:
-                    # Map eligibility data to products
-                    cursor.execute("""
-                    INSERT OR IGNORE INTO products 
-                    (product_id, product_name, category, brand, price) 
-                    VALUES (?, ?, ?, ?, ?)
-                    """, (
-                        str(row.get('item_id', '')),
-                        f"Product {row.get('item_id', '')}",
-                        'General',
-                        'Unknown',
-                        0
-                    ))
-                    records_loaded += 1
-                except Exception as e:
-                    logger.warning(f"Error inserting product row: {e}")
-                    continue
-        
-        logger.info(f"Successfully loaded {records_loaded} records from Excel files")
-        
-        if records_loaded == 0:
-            raise Exception("No records were loaded from Excel files")
-        
-    except Exception as e:
-        logger.error(f"Error loading Excel data: {e}")
-        raise Exception(f"Excel data loading failed: {str(e)}")
+# NL-to-SQL translations, in memory and persisted in the database
+translation_cache = cache.TranslationCache(DB_PATH)
+
+# Query results, valid until the next ingest changes the data
+result_cache = cache.ResultCache(DB_PATH)
+
+# EXPLAIN QUERY PLAN checks before queries run, and the slow-query log
+plan_inspector = queryplan.PlanInspector(DB_PATH)
 
 def get_database_schema():
     """Get database schema information for AI context"""
@@ -361,109 +104,344 @@ def get_database_schema():
     Database Schema:
     
     1. products: product_id, product_name, category, brand, price
-    2. total_sales_metrics: product_id, total_sales, units_sold, revenue, date
-    3. ad_sales_metrics: product_id, ad_spend, ad_sales, clicks, impressions, cpc, date
+    2. total_sales_metrics: product_id, total_sales, units_sold, revenue, date, date_key
+    3. ad_sales_metrics: product_id, ad_spend, ad_sales, clicks, impressions, cpc, date, date_key
+    
+    Precomputed rollups (prefer these over the raw tables above; they are much smaller):
+    4. product_daily_metrics: one row per product and day with sales and ad metrics side by side
+    5. product_summary: one row per product over all days (plus days, first_date_key, last_date_key)
+    6. daily_summary: one row per day over all products (plus products)
+    Rollup columns: total_sales, units_sold, revenue, ad_spend, ad_sales, clicks, impressions,
+    and the precomputed ratios roas, cpc, ctr_percent, acos_percent (NULL when the denominator is 0).
+    Only re-aggregate ratios from sums, e.g. SUM(ad_sales) / SUM(ad_spend), never AVG(roas).
+    
+    date is display text ('2025-06-01 00:00:00'); date_key is the same day as an
+    indexed integer (20250601). Filter, group, sort and join on date_key and product_id.
     
     Sample queries:
-    - Total sales: SELECT SUM(total_sales) FROM total_sales_metrics
-    - RoAS calculation: SELECT ad_sales/ad_spend AS roas FROM ad_sales_metrics
+    - Total sales: SELECT SUM(total_sales) FROM daily_summary
+    - RoAS by product: SELECT product_id, roas FROM product_summary ORDER BY roas DESC
+    - Daily sales: SELECT date_key, total_sales FROM daily_summary ORDER BY date_key
+    - Sales and ad spend in June: SELECT SUM(total_sales), SUM(ad_spend) FROM daily_summary WHERE date_key BETWEEN 20250601 AND 20250630
     """
 
-def convert_question_to_sql(question):
-    """Convert natural language question to SQL using Gemini AI"""
-    try:
-        model = genai.GenerativeModel("gemini-1.5-flash")
-        
-        prompt = f"""
+# Previously answered questions whose SQL ran successfully, for paraphrase reuse
+paraphrase_index = similarity.ParaphraseIndex()
+
+def load_paraphrases():
+    """Index the validated questions from the translation cache"""
+    for key, known_question, known_sql in translation_cache.validated_entries(get_database_schema()):
+        paraphrase_index.add(key, known_question, known_sql)
+
+def warm_up_llm():
+    """Connect the shared model client before the first question arrives"""
+    llm.get_client().warm_up()
+
+# Startup work, run by startup.start() or the first request rather than at import
+startup = bootstrap.Bootstrap([
+    ('database', init_database),
+    ('paraphrases', load_paraphrases),
+    ('llm', warm_up_llm),
+])
+
+# Steps whose results live on disk, so a pre-fork server runs them once before
+# forking; the others open connections and clients that must not cross a fork
+SHARED_STARTUP_STEPS = ('database',)
+
+def cached_translation(question, schema):
+    """SQL for a question from the translation cache or a validated paraphrase, or None"""
+    cached = translation_cache.get(question, schema)
+    if cached is not None:
+        logger.info(f"Translation cache hit for: {question}")
+        return dict(cached, cached=True)
+    
+    match = paraphrase_index.match(question)
+    if match is not None:
+        entry, score = match
+        logger.info(f"Paraphrase match for: {question} -> {entry['question']} (score {score:.3f})")
+        return dict(entry['sql_info'], cached=True, paraphrase_of={
+            'question': entry['question'], 'key': entry['key'], 'score': round(score, 4)})
+    
+    return None
+
+# Rules shared by the single and batch translation prompts
+SQL_RULES = """Rules:
+        - Use proper SQLite syntax
+        - For total sales, use SUM(total_sales) FROM daily_summary
+        - For per-product or per-day totals, read product_summary or daily_summary instead of aggregating the raw tables
+        - For RoAS, use the roas column of a rollup row, or SUM(ad_sales) / SUM(ad_spend) across rows
+        - Return valid JSON only"""
+
+def sql_prompt(question, schema):
+    """Prompt asking the model to translate a question into SQL"""
+    return f"""
         You are a SQL expert. Convert this question to a valid SQLite query.
         
-        {get_database_schema()}
+        {schema}
         
         Question: {question}
         
         Return only a JSON object with:
         {{"sql": "your SQL query", "explanation": "brief explanation"}}
         
-        Rules:
-        - Use proper SQLite syntax
-        - For total sales, use SUM(total_sales) FROM total_sales_metrics
-        - For RoAS, use ad_sales/ad_spend
-        - Return valid JSON only
+        {SQL_RULES}
         """
+
+def parse_sql_reply(response_text):
+    """Extract the {"sql", "explanation"} JSON object from a model reply"""
+    response_text = response_text.strip()
+    
+    # Extract JSON from response
+    if "```json" in response_text:
+        start = response_text.find("```json") + 7
+        end = response_text.find("```", start)
+        response_text = response_text[start:end].strip()
+    elif "```" in response_text:
+        start = response_text.find("```") + 3
+        end = response_text.find("```", start)
+        response_text = response_text[start:end].strip()
+    
+    return json.loads(response_text)
+
+# Total sales over every day, for the fast path and the fallback translation
+TOTAL_SALES_SQL = "SELECT SUM(total_sales) AS total_sales FROM daily_summary"
+
+def translation_failed(question, e):
+    """Fallback translation when the model call or its reply failed"""
+    logger.error(f"Error converting question: {e}")
+    # Fallback for common questions
+    if "total sales" in question.lower():
+        return {
+            "sql": TOTAL_SALES_SQL,
+            "explanation": "Calculate total sales from the daily rollup"
+        }
+    return {"sql": None, "explanation": f"Error: {str(e)}"}
+
+def routed_translation(question):
+    """Parameterized SQL from the local intent router, or None when it is not confident"""
+    routed = router.route(question)
+    if routed is not None:
+        logger.info(f"Routed locally (confidence {routed['confidence']}): {question}")
+    return routed
+
+@metrics.timed("translate")
+def convert_question_to_sql(question):
+    """Convert natural language question to SQL using Gemini AI"""
+    routed = routed_translation(question)
+    if routed is not None:
+        return routed
+    
+    schema = get_database_schema()
+    cached = cached_translation(question, schema)
+    if cached is not None:
+        return cached
+    
+    try:
+        reply = llm.get_client().generate(sql_prompt(question, schema))
         
-        response = model.generate_content(prompt)
-        response_text = response.text.strip()
-        
-        # Extract JSON from response
-        if "```json" in response_text:
-            start = response_text.find("```json") + 7
-            end = response_text.find("```", start)
-            response_text = response_text[start:end].strip()
-        elif "```" in response_text:
-            start = response_text.find("```") + 3
-            end = response_text.find("```", start)
-            response_text = response_text[start:end].strip()
-        
-        return json.loads(response_text)
+        return parse_sql_reply(reply)
         
     except Exception as e:
-        logger.error(f"Error converting question: {e}")
-        # Fallback for common questions
-        if "total sales" in question.lower():
-            return {
-                "sql": "SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics",
-                "explanation": "Calculate total sales from all records"
-            }
-        return {"sql": None, "explanation": f"Error: {str(e)}"}
+        return translation_failed(question, e)
 
-def execute_sql_query(sql):
+def record_outcome(question, sql_info, succeeded):
+    """Cache a translation once its SQL has run successfully, or forget a cached
+    one whose SQL failed; successful ones become available for paraphrase matching"""
+    if 'paraphrase_of' in sql_info or 'intent' in sql_info:
+        return
+    schema = get_database_schema()
+    key = translation_cache.key(question, schema)
+    if not succeeded:
+        if sql_info.get('cached'):
+            logger.info(f"Dropping cached translation that failed for: {question}")
+            translation_cache.delete(question, schema)
+            paraphrase_index.remove(key)
+        return
+    if not sql_info.get('cached'):
+        translation_cache.put(question, schema, sql_info, validated=True)
+    elif not translation_cache.mark_validated(question, schema):
+        return
+    if key not in paraphrase_index:
+        paraphrase_index.add(key, cache.normalize_question(question), sql_info)
+
+def caching_batches(sql, batches, params=()):
+    """Pass result batches through, caching the full result when it is small enough"""
+    version = result_cache.version()
+    rows = []
+    for batch in batches:
+        if rows is not None:
+            rows.extend(batch)
+            if len(rows) > db.QUERY_MAX_ROWS:
+                rows = None
+        yield batch
+    if rows is not None:
+        result_cache.put(sql, rows, version, params)
+
+@metrics.timed("execute")
+def execute_sql_query(sql, params=()):
     """Execute SQL query and return results"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(sql)
+        results = result_cache.get(sql, params)
+        if results is not None:
+            metrics.rows_returned.observe("cache", len(results))
+            return results
         
-        results = []
-        for row in cursor.fetchall():
-            results.append(dict(row))
+        version = result_cache.version()
+        with pool.connection() as conn, plan_inspector.inspect(conn, sql, params, version) as run:
+            results = db.run_guarded(conn, sql, params)
+            run.rows = len(results)
+        result_cache.put(sql, results, version, params)
+        metrics.rows_returned.observe("database", len(results))
         
-        conn.close()
         return results
         
+    except db.QueryTooExpensive:
+        raise
     except Exception as e:
         logger.error(f"SQL execution error: {e}")
         return []
 
-def format_response(question, results, sql_info):
-    """Format the results into a human-readable response"""
-    if not results:
-        return "No data found for your question."
-    
+@metrics.timed("execute")
+def execute_sql_paged(sql, page_size=pagination.PAGE_SIZE, params=()):
+    """Execute SQL into a result handle and return its first page; raises
+    db.QueryFailed when the SQL cannot be run"""
     try:
-        # Use AI to format the response
-        model = genai.GenerativeModel("gemini-1.5-flash")
+        rows = result_cache.get(sql, params)
+        if rows is not None:
+            page = result_store.page(result_store.create([rows]), page_size=page_size)
+        else:
+            with pool.connection() as conn, plan_inspector.inspect(conn, sql, params, result_cache.version()) as run:
+                batches = db.iter_guarded(conn, sql, params, max_rows=pagination.MAX_ROWS)
+                result_id = result_store.create(caching_batches(sql, batches, params))
+                page = result_store.page(result_id, page_size=page_size)
+                run.rows = page['total_rows']
+        metrics.rows_returned.observe("cache" if rows is not None else "database", page['total_rows'])
+        return page
+        
+    except db.QueryTooExpensive:
+        raise
+    except Exception as e:
+        logger.error(f"SQL execution error: {e}")
+        raise db.QueryFailed(str(e)) from e
+
+def replan_prompt(question, schema, sql_info, summary):
+    """Prompt asking the model for a cheaper query than one the plan check refused"""
+    return f"""
+        You are a SQL expert. This SQLite query answers the question below, but its
+        plan is too expensive to run.
+        
+        {schema}
+        
+        Question: {question}
+        Query: {sql_info['sql']}
+        Plan: {'; '.join(summary['steps'])}
+        Estimated rows visited: {summary['cost']:,}; full scans of: {', '.join(summary['full_scans']) or 'none'}
         
-        prompt = f"""
+        Rewrite it to read the precomputed rollup tables, or to filter and join on the
+        indexed product_id and date_key columns, so it visits far fewer rows.
+        
+        Return only a JSON object with:
+        {{"sql": "your SQL query", "explanation": "brief explanation"}}
+        """
+
+def replan(question, sql_info, e):
+    """Cheaper SQL from the model for a translation whose plan was refused"""
+    logger.info(f"Re-prompting for a cheaper query for '{question}': {e}")
+    schema = get_database_schema()
+    try:
+        replanned = parse_sql_reply(llm.get_client().generate(replan_prompt(question, schema, sql_info, e.summary)))
+    except Exception as failure:
+        logger.warning(f"Re-prompt failed for '{question}': {failure}")
+        raise e
+    if not isinstance(replanned, dict) or not replanned.get('sql'):
+        raise e
+    plan_inspector.reprompts += 1
+    return dict(replanned, replanned_from=sql_info['sql'])
+
+def execute_translation(question, sql_info, page_size=pagination.PAGE_SIZE):
+    """Run a translation's SQL, returning (sql_info, first page).
+    
+    A model translation whose plan the policy wants re-prompted is replaced
+    once by a cheaper one; the returned sql_info is the one that ran.
+    """
+    try:
+        try:
+            page = execute_sql_paged(sql_info['sql'], page_size, sql_info.get('params', ()))
+        except queryplan.PlanTooExpensive as e:
+            if e.action != 'reprompt' or 'intent' in sql_info:
+                raise
+            sql_info = replan(question, sql_info, e)
+            page = execute_sql_paged(sql_info['sql'], page_size, sql_info.get('params', ()))
+    except db.QueryFailed:
+        record_outcome(question, sql_info, False)
+        raise
+    record_outcome(question, sql_info, True)
+    return sql_info, page
+
+def local_answer(results, total_rows=None, policy=None):
+    """Locally formatted answer, or None when the model should write it"""
+    policy = formatter.resolve_policy(policy)
+    if policy != "llm" or not results:
+        answer = formatter.format_locally(results, total_rows)
+        if answer is not None:
+            return answer
+        if policy == "local":
+            return formatter.fallback(results, total_rows)
+    return None
+
+def digest_rows(results, total_rows=None, result_id=None):
+    """Rows to describe in a prompt: the whole result (up to DIGEST_MAX_ROWS) read
+    back from its handle when results is only its first page"""
+    if result_id is None or not total_rows or total_rows <= len(results):
+        return results
+    try:
+        return result_store.page(result_id, page_size=digest.MAX_ROWS)['rows']
+    except KeyError:
+        return results
+
+def prompt_results(question, results, total_rows=None, result_id=None):
+    """Results as prompt text, replaced by a digest when larger than PROMPT_RESULT_TOKENS"""
+    results = digest_rows(results, total_rows, result_id)
+    total = max(total_rows or 0, len(results))
+    data, digested = digest.fit_digest(results, total_rows)
+    if digested:
+        logger.info(f"Sending a result digest for '{question}' ({len(results)} rows)")
+        covered = f"all {total}" if len(results) == total else f"the first {len(results)} of {total}"
+        return f"(digest of {covered} rows: counts, column stats, top/bottom rows, histograms) {data}"
+    if total > len(results):
+        return f"(first {len(results)} of {total} rows) {data}"
+    return data
+
+def format_prompt(question, results, sql_info, total_rows=None, result_id=None):
+    """Prompt asking the model to phrase query results as an answer"""
+    return f"""
         Format this data into a clear answer. Remove currency symbols.
         
         Question: {question}
         SQL: {sql_info.get('sql', '')}
-        Results: {results}
+        Results: {prompt_results(question, results, total_rows, result_id)}
         
         Provide a clear, concise answer with numbers formatted with commas.
         """
-        
-        response = model.generate_content(prompt)
-        return response.text.strip()
+
+@metrics.timed("format")
+def format_response(question, results, sql_info, total_rows=None, policy=None, result_id=None):
+    """Format the results into a human-readable response.
+    
+    Recognized result shapes are formatted locally; Gemini is only called for
+    other shapes, or for every answer when the policy is "llm".
+    """
+    answer = local_answer(results, total_rows, policy)
+    if answer is not None:
+        return answer
+    
+    try:
+        # Use AI to format the response
+        return llm.get_client().generate(format_prompt(question, results, sql_info, total_rows, result_id)).strip()
         
     except Exception as e:
-        # Simple fallback formatting
-        if len(results) == 1 and len(results[0]) == 1:
-            value = list(results[0].values())[0]
-            if isinstance(value, (int, float)):
-                return f"The result is {value:,.2f}"
-        return f"Found {len(results)} results: {results}"
+        logger.warning(f"AI formatting failed: {e}")
+        return formatter.fallback(results, total_rows)
 
 # HTML Template
 HTML_TEMPLATE = """
@@ -477,6 +455,7 @@ HTML_TEMPLATE = """
     <style>
         .chat-container { max-height: 400px; overflow-y: auto; }
         .loading { display: none; }
+        .chat-container .alert { white-space: pre-wrap; }
     </style>
 </head>
 <body>
@@ -525,7 +504,7 @@ HTML_TEMPLATE = """
             }
         }
 
-        async function askQuestion() {
+        function askQuestion() {
             const input = document.getElementById('questionInput');
             const question = input.value.trim();
             
@@ -536,32 +515,52 @@ HTML_TEMPLATE = """
             
             // Add user question to chat
             addMessage('You: ' + question, 'alert-secondary');
+            input.value = '';
             
-            try {
-                const response = await fetch('/api/ask', {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({ question: question })
-                });
-                
-                const data = await response.json();
-                
-                if (data.success) {
-                    addMessage('AI: ' + data.formatted_response, 'alert-success');
-                    if (data.sql_query) {
-                        addMessage('SQL: ' + data.sql_query, 'alert-info small');
-                    }
-                } else {
-                    addMessage('Error: ' + (data.error || 'Unknown error'), 'alert-danger');
-                }
-                
-            } catch (error) {
-                addMessage('Error: Failed to process question', 'alert-danger');
+            // Stages arrive as server-sent events and are shown as they come
+            const answer = addMessage('AI: ...', 'alert-success');
+            let text = '';
+            const source = new EventSource('/api/ask/stream?question=' + encodeURIComponent(question));
+            
+            function finish() {
+                source.close();
+                document.getElementById('loading').style.display = 'none';
             }
             
-            // Hide loading and clear input
-            document.getElementById('loading').style.display = 'none';
-            input.value = '';
+            source.addEventListener('sql', function(event) {
+                const data = JSON.parse(event.data);
+                if (data.sql_query) {
+                    addMessage('SQL: ' + data.sql_query, 'alert-info small');
+                }
+            });
+            
+            source.addEventListener('rows', function(event) {
+                const data = JSON.parse(event.data);
+                const preview = data.results.slice(0, 5).map(function(row) {
+                    return Object.values(row).join(' | ');
+                });
+                answer.textContent = 'AI: Found ' + data.total_rows + ' rows' +
+                    (preview.length ? '\\n' + preview.join('\\n') : '');
+            });
+            
+            source.addEventListener('token', function(event) {
+                text += JSON.parse(event.data).text;
+                answer.textContent = 'AI: ' + text;
+            });
+            
+            source.addEventListener('answer', function(event) {
+                answer.textContent = 'AI: ' + JSON.parse(event.data).formatted_response;
+            });
+            
+            source.addEventListener('done', finish);
+            
+            source.addEventListener('error', function(event) {
+                // Server-sent error events carry data; connection failures do not
+                const data = event.data ? JSON.parse(event.data) : {};
+                answer.className = 'alert alert-danger mb-2';
+                answer.textContent = 'Error: ' + (data.error || 'Failed to process question');
+                finish();
+            });
         }
 
         function addMessage(message, className) {
@@ -571,6 +570,7 @@ HTML_TEMPLATE = """
             div.textContent = message;
             container.appendChild(div);
             container.scrollTop = container.scrollHeight;
+            return div;
         }
     </script>
 </body>
@@ -580,14 +580,153 @@ HTML_TEMPLATE = """
 @app.route('/')
 def index():
     """Main page"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM total_sales_metrics")
-    total_records = cursor.fetchone()[0]
-    conn.close()
+    with pool.connection() as conn:
+        total_records = conn.execute("SELECT COUNT(*) FROM total_sales_metrics").fetchone()[0]
     
     return render_template_string(HTML_TEMPLATE, stats={'total_records': total_records})
 
+def wants_ndjson(data):
+    """Whether the client asked for newline-delimited JSON results"""
+    return data.get('stream') == 'ndjson' or 'application/x-ndjson' in request.headers.get('Accept', '')
+
+def stream_ndjson(header, sql=None, rows=None, params=(), on_done=None):
+    """Stream a response as NDJSON: a header line, one line per row, then a trailer line.
+    
+    Rows come either from running sql on a pooled connection, batch by batch,
+    or from an already computed list or the result cache. on_done, when given,
+    is called with whether the SQL ran to completion or failed with an error.
+    """
+    def generate():
+        yield json.dumps(header) + "\n"
+        row_count = 0
+        try:
+            cached = rows if sql is None else result_cache.get(sql, params)
+            if cached is not None:
+                yield "".join(pagination.encode_row(row) for row in cached)
+                row_count = len(cached)
+            else:
+                with pool.connection() as conn, plan_inspector.inspect(conn, sql, params, result_cache.version()) as run:
+                    batches = db.iter_guarded(conn, sql, params, timeout_ms=pagination.STREAM_TIMEOUT_MS,
+                                              max_rows=pagination.STREAM_MAX_ROWS)
+                    for batch in caching_batches(sql, batches, params):
+                        yield "".join(pagination.encode_row(row) for row in batch)
+                        row_count += len(batch)
+                    run.rows = row_count
+            if on_done is not None:
+                on_done(True)
+            yield json.dumps({'done': True, 'row_count': row_count}) + "\n"
+        except db.QueryTooExpensive as e:
+            logger.warning(f"Stopped expensive streamed query: {e}")
+            yield json.dumps({'done': False, 'row_count': row_count, 'error': str(e),
+                              'error_type': 'query_too_expensive', 'details': e.to_dict()}) + "\n"
+        except Exception as e:
+            logger.error(f"SQL streaming error: {e}")
+            if on_done is not None:
+                on_done(False)
+            yield json.dumps({'done': False, 'row_count': row_count, 'error': str(e)}) + "\n"
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def respond(data, payload):
+    """Return a computed answer as JSON, or as NDJSON when the client asked for it"""
+    if wants_ndjson(data):
+        header = {key: value for key, value in payload.items() if key != 'results'}
+        return stream_ndjson(header, rows=payload['results'])
+    return jsonify(payload)
+
+@metrics.timed("direct")
+def direct_answer(question):
+    """Answer common questions with fixed SQL, without the AI; None for other questions"""
+    # Breakdowns and filters ("total sales by product") are left to the router
+    if router.is_specific(question):
+        return None
+    
+    if "total sales" in question.lower():
+        results = execute_sql_query(TOTAL_SALES_SQL)
+        if results and results[0]['total_sales'] is not None:
+            total = results[0]['total_sales']
+            return {
+                'success': True,
+                'question': question,
+                'sql_query': TOTAL_SALES_SQL,
+                'explanation': 'Calculate total sales from the daily rollup',
+                'results': results,
+                'formatted_response': f"Your total sales are {total:,.2f}."
+            }
+    
+    elif "roas" in question.lower() or "return on ad spend" in question.lower():
+        results = execute_sql_query("SELECT AVG(ad_sales / ad_spend) AS avg_roas FROM ad_sales_metrics WHERE ad_spend > 0")
+        if results:
+            roas = results[0]['avg_roas']
+            return {
+                'success': True,
+                'question': question,
+                'sql_query': 'SELECT AVG(ad_sales / ad_spend) AS avg_roas FROM ad_sales_metrics WHERE ad_spend > 0',
+                'explanation': 'Calculate average Return on Ad Spend',
+                'results': results,
+                'formatted_response': f"Your average RoAS is {roas:.2f}"
+            }
+    
+    elif "records" in question.lower() or "data" in question.lower():
+        sales_count = execute_sql_query("SELECT COUNT(*) AS count FROM total_sales_metrics")[0]['count']
+        ad_count = execute_sql_query("SELECT COUNT(*) AS count FROM ad_sales_metrics")[0]['count']
+        return {
+            'success': True,
+            'question': question,
+            'sql_query': 'Database record counts',
+            'explanation': 'Show loaded data statistics',
+            'results': [{'sales_records': sales_count, 'ad_records': ad_count}],
+            'formatted_response': f"Loaded {sales_count} sales records and {ad_count} ad records from your Excel files."
+        }
+    
+    return None
+
+def answer_header(question, sql_info):
+    """Fields describing how a question was translated"""
+    header = {
+        'success': True,
+        'question': question,
+        'sql_query': sql_info['sql'],
+        'explanation': sql_info.get('explanation', '')
+    }
+    if 'paraphrase_of' in sql_info:
+        header['paraphrase_of'] = sql_info['paraphrase_of']
+    if 'replanned_from' in sql_info:
+        header['replanned_from'] = sql_info['replanned_from']
+    if 'intent' in sql_info:
+        header.update(sql_params=sql_info['params'], intent=sql_info['intent'], confidence=sql_info['confidence'])
+    return header
+
+def answer_payload(question, sql_info, page, formatted_response):
+    """Full /api/ask response for an AI-translated question"""
+    return dict(answer_header(question, sql_info),
+                results=page['rows'],
+                result_id=page['result_id'],
+                next_page_token=page['next_page_token'],
+                total_rows=page['total_rows'],
+                formatted_response=formatted_response)
+
+def failed_query_error(question, e):
+    """Structured error for generated SQL that could not be run"""
+    logger.warning(f"Query failed for '{question}': {e}")
+    return {
+        'success': False,
+        'error': f"The generated query could not be run: {e}",
+        'error_type': 'query_failed'
+    }
+
+def expensive_query_error(question, e):
+    """Structured error for a query stopped by its budget"""
+    logger.warning(f"Stopped expensive query for '{question}': {e}")
+    return {
+        'success': False,
+        'error': str(e),
+        'error_type': 'query_too_expensive',
+        'details': e.to_dict()
+    }
+
+AI_UNAVAILABLE = "AI service temporarily unavailable. Try asking 'total sales', 'RoAS', or 'records' for now."
+
 @app.route('/api/ask', methods=['POST'])
 def ask_question():
     """Process natural language questions"""
@@ -601,43 +740,9 @@ def ask_question():
         logger.info(f"Processing question: {question}")
         
         # Handle common questions directly to avoid AI API issues
-        if "total sales" in question.lower():
-            results = execute_sql_query("SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics")
-            if results:
-                total = results[0]['total_sales']
-                return jsonify({
-                    'success': True,
-                    'question': question,
-                    'sql_query': 'SELECT SUM(total_sales) AS total_sales FROM total_sales_metrics',
-                    'explanation': 'Calculate total sales from all records',
-                    'results': results,
-                    'formatted_response': f"Your total sales are {total:,.2f} from {len(results)} records loaded from Excel files."
-                })
-        
-        elif "roas" in question.lower() or "return on ad spend" in question.lower():
-            results = execute_sql_query("SELECT AVG(ad_sales / ad_spend) AS avg_roas FROM ad_sales_metrics WHERE ad_spend > 0")
-            if results:
-                roas = results[0]['avg_roas']
-                return jsonify({
-                    'success': True,
-                    'question': question,
-                    'sql_query': 'SELECT AVG(ad_sales / ad_spend) AS avg_roas FROM ad_sales_metrics WHERE ad_spend > 0',
-                    'explanation': 'Calculate average Return on Ad Spend',
-                    'results': results,
-                    'formatted_response': f"Your average RoAS is {roas:.2f}"
-                })
-        
-        elif "records" in question.lower() or "data" in question.lower():
-            sales_count = execute_sql_query("SELECT COUNT(*) AS count FROM total_sales_metrics")[0]['count']
-            ad_count = execute_sql_query("SELECT COUNT(*) AS count FROM ad_sales_metrics")[0]['count']
-            return jsonify({
-                'success': True,
-                'question': question,
-                'sql_query': 'Database record counts',
-                'explanation': 'Show loaded data statistics',
-                'results': [{'sales_records': sales_count, 'ad_records': ad_count}],
-                'formatted_response': f"Loaded {sales_count} sales records and {ad_count} ad records from your Excel files."
-            })
+        payload = direct_answer(question)
+        if payload is not None:
+            return respond(data, payload)
         
         # For other questions, try AI (with fallback)
         try:
@@ -649,32 +754,377 @@ def ask_question():
                     'error': sql_info.get('explanation', 'Could not generate SQL')
                 })
             
-            results = execute_sql_query(sql_info['sql'])
-            formatted_response = format_response(question, results, sql_info)
+            if wants_ndjson(data):
+                return stream_ndjson(answer_header(question, sql_info), sql_info['sql'],
+                                     params=sql_info.get('params', ()),
+                                     on_done=lambda succeeded: record_outcome(question, sql_info, succeeded))
             
-            return jsonify({
-                'success': True,
-                'question': question,
-                'sql_query': sql_info['sql'],
-                'explanation': sql_info.get('explanation', ''),
-                'results': results,
-                'formatted_response': formatted_response
-            })
+            sql_info, page = execute_translation(question, sql_info, pagination.page_size_from(data.get('page_size')))
+            formatted_response = format_response(question, page['rows'], sql_info,
+                                                 page['total_rows'], data.get('format'), page['result_id'])
+            
+            return jsonify(answer_payload(question, sql_info, page, formatted_response))
+            
+        except db.QueryTooExpensive as e:
+            return jsonify(expensive_query_error(question, e))
+            
+        except db.QueryFailed as e:
+            return jsonify(failed_query_error(question, e))
             
         except Exception as ai_error:
             logger.warning(f"AI processing failed: {ai_error}, trying direct SQL")
-            return jsonify({
-                'success': False,
-                'error': f"AI service temporarily unavailable. Try asking 'total sales', 'RoAS', or 'records' for now."
-            })
+            return jsonify({'success': False, 'error': AI_UNAVAILABLE})
         
     except Exception as e:
         logger.error(f"Error processing question: {e}")
         return jsonify({'success': False, 'error': str(e)})
 
+def sse_event(event, data):
+    """One server-sent event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.route('/api/ask/stream')
+def ask_stream():
+    """Answer a question as server-sent events, each stage as soon as it finishes.
+    
+    Events: sql, rows, token (answer text from the model, as it arrives),
+    answer (the complete text), then done; or error at any point.
+    """
+    question = request.args.get('question', '')
+    page_size = pagination.page_size_from(request.args.get('page_size'))
+    policy = request.args.get('format')
+    
+    def generate():
+        try:
+            if not question:
+                yield sse_event('error', {'success': False, 'error': 'No question provided'})
+                return
+            
+            logger.info(f"Streaming answer for: {question}")
+            
+            payload = direct_answer(question)
+            if payload is not None:
+                yield sse_event('sql', {key: payload[key] for key in ('success', 'question', 'sql_query', 'explanation')})
+                yield sse_event('rows', {'results': payload['results'], 'total_rows': len(payload['results'])})
+                yield sse_event('answer', {'formatted_response': payload['formatted_response']})
+                yield sse_event('done', {'success': True})
+                return
+            
+            sql_info = convert_question_to_sql(question)
+            if not sql_info.get('sql'):
+                yield sse_event('error', {'success': False,
+                                          'error': sql_info.get('explanation', 'Could not generate SQL')})
+                return
+            yield sse_event('sql', answer_header(question, sql_info))
+            
+            executed, page = execute_translation(question, sql_info, page_size)
+            if executed is not sql_info:
+                sql_info = executed
+                yield sse_event('sql', answer_header(question, sql_info))
+            yield sse_event('rows', {'results': page['rows'], 'result_id': page['result_id'],
+                                     'next_page_token': page['next_page_token'], 'total_rows': page['total_rows']})
+            
+            started = time.perf_counter()
+            answer = local_answer(page['rows'], page['total_rows'], policy)
+            if answer is None:
+                chunks = []
+                try:
+                    for chunk in llm.get_client().stream(format_prompt(question, page['rows'], sql_info,
+                                                                     page['total_rows'], page['result_id'])):
+                        chunks.append(chunk)
+                        yield sse_event('token', {'text': chunk})
+                    answer = "".join(chunks).strip()
+                except Exception as e:
+                    logger.warning(f"AI formatting failed: {e}")
+                    answer = formatter.fallback(page['rows'], page['total_rows'])
+            metrics.observe_stage('format', time.perf_counter() - started)
+            
+            yield sse_event('answer', {'formatted_response': answer})
+            yield sse_event('done', {'success': True})
+            
+        except db.QueryTooExpensive as e:
+            yield sse_event('error', expensive_query_error(question, e))
+        except db.QueryFailed as e:
+            yield sse_event('error', failed_query_error(question, e))
+        except Exception as e:
+            logger.error(f"Error streaming answer: {e}")
+            yield sse_event('error', {'success': False, 'error': str(e)})
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+# Questions accepted per batch, and threads running their SQL on the pool
+BATCH_MAX_QUESTIONS = int(os.environ.get("BATCH_MAX_QUESTIONS", "100"))
+batch_executor = ThreadPoolExecutor(max_workers=db.POOL_SIZE, thread_name_prefix="batch")
+
+def batch_sql_prompt(questions, schema):
+    """Prompt asking the model to translate several questions in one reply"""
+    numbered = "\n".join(f"        Question {i}: {question}" for i, question in enumerate(questions, 1))
+    return f"""
+        You are a SQL expert. Convert each question below to a valid SQLite query.
+        
+        {schema}
+        
+{numbered}
+        
+        Return only a JSON array with one object per question, in the same order:
+        [{{"sql": "your SQL query", "explanation": "brief explanation"}}, ...]
+        
+        {SQL_RULES}
+        """
+
+@metrics.timed("translate")
+def translate_batch(questions):
+    """SQL for each question: the router and caches first, then one model call for all misses"""
+    schema = get_database_schema()
+    translations = {}
+    misses = []
+    for question in questions:
+        found = routed_translation(question) or cached_translation(question, schema)
+        if found is not None:
+            translations[question] = found
+        else:
+            misses.append(question)
+    
+    if len(misses) == 1:
+        translations[misses[0]] = convert_question_to_sql(misses[0])
+    elif misses:
+        try:
+            replies = parse_sql_reply(llm.get_client().generate(batch_sql_prompt(misses, schema)))
+            if not isinstance(replies, list) or len(replies) != len(misses):
+                raise ValueError(f"Expected {len(misses)} translations in a JSON array")
+            for question, sql_info in zip(misses, replies):
+                translations[question] = sql_info
+        except Exception as e:
+            for question in misses:
+                translations[question] = translation_failed(question, e)
+    
+    logger.info(f"Batch translation: {len(questions) - len(misses)} local or cached, {len(misses)} from the model")
+    return translations
+
+def batch_format_prompt(items):
+    """Prompt asking the model to phrase several results in one reply"""
+    sections = "\n".join(
+        f"""
+        Question {i}: {question}
+        SQL {i}: {sql_info.get('sql', '')}
+        Results {i}: {prompt_results(question, page['rows'], page['total_rows'], page['result_id'])}"""
+        for i, (question, sql_info, page) in enumerate(items, 1))
+    return f"""
+        Format each question's data into a clear answer. Remove currency symbols.
+        {sections}
+        
+        Return only a JSON array of answer strings, one per question, in the same order.
+        Each answer should be clear and concise, with numbers formatted with commas.
+        """
+
+@metrics.timed("format")
+def format_batch(items, policy=None):
+    """Answers for (question, sql_info, page) items, with one model call for those not formatted locally"""
+    answers = [local_answer(page['rows'], page['total_rows'], policy) for _, _, page in items]
+    pending = [i for i, answer in enumerate(answers) if answer is None]
+    if pending:
+        try:
+            replies = parse_sql_reply(llm.get_client().generate(batch_format_prompt([items[i] for i in pending])))
+            if not isinstance(replies, list) or len(replies) != len(pending):
+                raise ValueError(f"Expected {len(pending)} answers in a JSON array")
+            for i, reply in zip(pending, replies):
+                answers[i] = str(reply).strip()
+        except Exception as e:
+            logger.warning(f"AI batch formatting failed: {e}")
+            for i in pending:
+                _, _, page = items[i]
+                answers[i] = formatter.fallback(page['rows'], page['total_rows'])
+    return answers
+
+def run_batch_question(question, sql_info, page_size):
+    """(sql_info, first page) for one batch question, or an error payload"""
+    try:
+        return execute_translation(question, sql_info, page_size)
+    except db.QueryTooExpensive as e:
+        return expensive_query_error(question, e)
+    except db.QueryFailed as e:
+        return failed_query_error(question, e)
+
+@app.route('/api/ask_batch', methods=['POST'])
+def ask_batch():
+    """Answer several questions at once.
+    
+    Duplicate questions are answered once, translation and formatting each
+    take at most one model call for the whole batch, and the SQL runs in
+    parallel on the connection pool. Answers come back in question order.
+    """
+    try:
+        data = request.get_json(silent=True) or {}
+        questions = data.get('questions') or []
+        
+        if not isinstance(questions, list) or not all(isinstance(q, str) and q.strip() for q in questions):
+            return jsonify({'success': False, 'error': 'Provide "questions" as a list of non-empty strings'})
+        if len(questions) > BATCH_MAX_QUESTIONS:
+            return jsonify({'success': False, 'error': f'At most {BATCH_MAX_QUESTIONS} questions per batch'})
+        
+        # One entry per normalized question, keeping the first wording
+        unique = {}
+        for question in questions:
+            unique.setdefault(cache.normalize_question(question), question)
+        logger.info(f"Processing batch of {len(questions)} questions ({len(unique)} unique)")
+        
+        answers = {}
+        remaining = []
+        for question in unique.values():
+            payload = direct_answer(question)
+            if payload is not None:
+                answers[question] = payload
+            else:
+                remaining.append(question)
+        
+        translations = translate_batch(remaining)
+        page_size = pagination.page_size_from(data.get('page_size'))
+        futures = {}
+        for question in remaining:
+            sql_info = translations[question]
+            if sql_info.get('sql'):
+                # In this request's context, so execute timings reach its Server-Timing header
+                futures[question] = batch_executor.submit(contextvars.copy_context().run, run_batch_question,
+                                                          question, sql_info, page_size)
+            else:
+                answers[question] = {'success': False, 'question': question,
+                                     'error': sql_info.get('explanation', 'Could not generate SQL')}
+        
+        items = []
+        for question, future in futures.items():
+            result = future.result()
+            if isinstance(result, tuple):
+                items.append((question, *result))
+            else:
+                answers[question] = result
+        for (question, sql_info, page), formatted_response in zip(items, format_batch(items, data.get('format'))):
+            answers[question] = answer_payload(question, sql_info, page, formatted_response)
+        
+        return jsonify({
+            'success': True,
+            'unique_questions': len(unique),
+            'answers': [dict(answers[unique[cache.normalize_question(q)]], question=q) for q in questions]
+        })
+        
+    except Exception as e:
+        logger.error(f"Error processing batch: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/ingest', methods=['POST'])
+def ingest_data():
+    """Re-ingest changed Excel workbooks on demand"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        with db.write_lock(DB_PATH):
+            conn = db.connect(DB_PATH)
+            cursor = conn.cursor()
+            summary = load_excel_data(cursor, data.get('workbooks'), force=bool(data.get('force')),
+                                      mode=data.get('mode'))
+            conn.close()
+        
+        return jsonify({'success': True, 'workbooks': summary})
+        
+    except Exception as e:
+        logger.error(f"Error ingesting data: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/api/results/<result_id>')
+def result_page(result_id):
+    """Fetch a further page of an /api/ask result"""
+    try:
+        page = result_store.page(result_id, request.args.get('page_token'),
+                                 pagination.page_size_from(request.args.get('page_size')))
+        return jsonify({'success': True, **page})
+        
+    except KeyError:
+        return jsonify({'success': False, 'error': 'Result not found or expired; ask the question again'})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+def component_stats():
+    """Connection pool, result handle, cache and LLM statistics"""
+    return {
+        'pool': pool.stats(),
+        'results': result_store.stats(),
+        'translation_cache': translation_cache.stats(),
+        'result_cache': result_cache.stats(),
+        'paraphrase_index': paraphrase_index.stats(),
+        'query_plans': plan_inspector.stats(),
+        'llm': llm.get_client().stats(),
+        'startup': startup.status()
+    }
+
+@app.route('/api/stats')
+def stats():
+    """Connection pool, result handle and cache statistics"""
+    return jsonify(component_stats())
+
+@app.route('/api/slow_queries')
+def slow_queries():
+    """Logged slow, costly or refused queries with their plans, the most total time first"""
+    try:
+        limit = int(request.args.get('limit', 20))
+        return jsonify({'success': True, 'queries': plan_inspector.slow_queries(limit)})
+        
+    except Exception as e:
+        logger.error(f"Error reading slow-query log: {e}")
+        return jsonify({'success': False, 'error': str(e)})
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """Stage latency and row histograms plus component statistics in Prometheus text format"""
+    return Response(metrics.render(component_stats()), mimetype='text/plain; version=0.0.4')
+
+@app.route('/healthz')
+def liveness():
+    """Liveness: the process is up and serving, whether or not startup has finished"""
+    return jsonify({'status': 'alive'})
+
+@app.route('/readyz')
+def readiness():
+    """Readiness: 200 once startup has finished, 503 while it runs or after it failed"""
+    status = startup.status()
+    return jsonify(status), 200 if startup.ready else 503
+
+# Endpoints that answer without the database being initialized
+STARTUP_EXEMPT = {'liveness', 'readiness', 'stats', 'prometheus_metrics', 'static'}
+
+@app.before_request
+def start_timing():
+    """Start the request clock and stage timings"""
+    g.started = time.perf_counter()
+    metrics.begin_request()
+
+@app.before_request
+def wait_for_startup():
+    """Hold requests that need the data until startup finishes, running it if nothing has"""
+    if startup.ready or request.endpoint in STARTUP_EXEMPT:
+        return None
+    try:
+        if startup.ensure(timeout=bootstrap.WAIT_SECONDS):
+            return None
+        error = 'The service is starting up; try again shortly'
+    except Exception as e:
+        error = f'Startup failed: {e}'
+    response = jsonify({'success': False, 'error': error, 'startup': startup.status()})
+    response.headers['Retry-After'] = '5'
+    return response, 503
+
+@app.after_request
+def add_server_timing(response):
+    """Report stage durations in a Server-Timing header and record the request latency"""
+    total = time.perf_counter() - g.started
+    metrics.request_seconds.observe(request.endpoint or 'unknown', total)
+    response.headers['Server-Timing'] = metrics.server_timing(total)
+    return response
+
 if __name__ == '__main__':
-    # Initialize database on startup
-    init_database()
+    # Initialize in the background while the server starts accepting requests;
+    # the reloader's watcher process never serves, so it skips this
+    if os.environ.get('WERKZEUG_RUN_MAIN'):
+        startup.start()
     
     # Check for API key
     if not os.environ.get('GEMINI_API_KEY'):
@@ -0,0 +1,337 @@
+"""
+E-commerce AI Agent - ASGI entry point
+/api/ask and /api/ask/stream run on asyncio: model calls are awaited and
+SQLite work runs in a bounded thread pool, so slow LLM round trips do not
+hold worker threads. Every other route is served by the Flask app.
+Run: uvicorn asgi:app
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import contextvars
+import logging
+from urllib.parse import parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import llm
+import metrics
+import pagination
+import app as web
+
+logger = logging.getLogger(__name__)
+
+# Threads for SQLite work and Flask routes; more than the pool size only adds waiting
+DB_THREADS = int(os.environ.get("ASGI_DB_THREADS", str(db.POOL_SIZE)))
+
+# Questions processed at once; further requests wait for a slot
+MAX_IN_FLIGHT = int(os.environ.get("ASGI_MAX_IN_FLIGHT", "500"))
+
+executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="sqlite")
+in_flight = asyncio.Semaphore(MAX_IN_FLIGHT)
+
+
+async def run_blocking(func, *args):
+    """Run blocking (SQLite) work on the bounded executor, in the caller's context"""
+    context = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, context.run, func, *args)
+
+
+@metrics.timed("translate")
+async def convert_question_to_sql(question):
+    """Async counterpart of app.convert_question_to_sql"""
+    routed = web.routed_translation(question)
+    if routed is not None:
+        return routed
+
+    schema = web.get_database_schema()
+    cached = await run_blocking(web.cached_translation, question, schema)
+    if cached is not None:
+        return cached
+
+    try:
+        reply = await llm.get_client().generate_async(web.sql_prompt(question, schema))
+
+        return web.parse_sql_reply(reply)
+
+    except Exception as e:
+        return web.translation_failed(question, e)
+
+
+@metrics.timed("format")
+async def format_response(question, results, sql_info, total_rows=None, policy=None, result_id=None):
+    """Async counterpart of app.format_response"""
+    answer = web.local_answer(results, total_rows, policy)
+    if answer is not None:
+        return answer
+
+    try:
+        # The prompt may read the whole result back from its handle
+        prompt = await run_blocking(web.format_prompt, question, results, sql_info, total_rows, result_id)
+        reply = await llm.get_client().generate_async(prompt)
+        return reply.strip()
+
+    except Exception as e:
+        logger.warning(f"AI formatting failed: {e}")
+        return web.formatter.fallback(results, total_rows)
+
+
+async def ask_question(data):
+    """Process a natural language question, returning the /api/ask payload"""
+    try:
+        question = data.get('question', '')
+
+        if not question:
+            return {'success': False, 'error': 'No question provided'}
+
+        logger.info(f"Processing question: {question}")
+
+        # Handle common questions directly to avoid AI API issues
+        payload = await run_blocking(web.direct_answer, question)
+        if payload is not None:
+            return payload
+
+        # For other questions, try AI (with fallback)
+        try:
+            sql_info = await convert_question_to_sql(question)
+
+            if not sql_info.get('sql'):
+                return {'success': False, 'error': sql_info.get('explanation', 'Could not generate SQL')}
+
+            sql_info, page = await run_blocking(web.execute_translation, question, sql_info,
+                                                pagination.page_size_from(data.get('page_size')))
+            formatted_response = await format_response(question, page['rows'], sql_info,
+                                                        page['total_rows'], data.get('format'), page['result_id'])
+
+            return web.answer_payload(question, sql_info, page, formatted_response)
+
+        except db.QueryTooExpensive as e:
+            return web.expensive_query_error(question, e)
+
+        except db.QueryFailed as e:
+            return web.failed_query_error(question, e)
+
+        except Exception as ai_error:
+            logger.warning(f"AI processing failed: {ai_error}")
+            return {'success': False, 'error': web.AI_UNAVAILABLE}
+
+    except Exception as e:
+        logger.error(f"Error processing question: {e}")
+        return {'success': False, 'error': str(e)}
+
+
+async def ask_stream(question, page_size, policy, emit):
+    """Async counterpart of app.ask_stream; emit(event, data) sends one server-sent event"""
+    try:
+        if not question:
+            await emit('error', {'success': False, 'error': 'No question provided'})
+            return
+
+        logger.info(f"Streaming answer for: {question}")
+
+        payload = await run_blocking(web.direct_answer, question)
+        if payload is not None:
+            await emit('sql', {key: payload[key] for key in ('success', 'question', 'sql_query', 'explanation')})
+            await emit('rows', {'results': payload['results'], 'total_rows': len(payload['results'])})
+            await emit('answer', {'formatted_response': payload['formatted_response']})
+            await emit('done', {'success': True})
+            return
+
+        sql_info = await convert_question_to_sql(question)
+        if not sql_info.get('sql'):
+            await emit('error', {'success': False, 'error': sql_info.get('explanation', 'Could not generate SQL')})
+            return
+        await emit('sql', web.answer_header(question, sql_info))
+
+        executed, page = await run_blocking(web.execute_translation, question, sql_info, page_size)
+        if executed is not sql_info:
+            sql_info = executed
+            await emit('sql', web.answer_header(question, sql_info))
+        await emit('rows', {'results': page['rows'], 'result_id': page['result_id'],
+                            'next_page_token': page['next_page_token'], 'total_rows': page['total_rows']})
+
+        started = time.perf_counter()
+        answer = web.local_answer(page['rows'], page['total_rows'], policy)
+        if answer is None:
+            prompt = await run_blocking(web.format_prompt, question, page['rows'], sql_info, page['total_rows'],
+                                        page['result_id'])
+            chunks = []
+            try:
+                async for chunk in llm.get_client().stream_async(prompt):
+                    chunks.append(chunk)
+                    await emit('token', {'text': chunk})
+                answer = "".join(chunks).strip()
+            except Exception as e:
+                logger.warning(f"AI formatting failed: {e}")
+                answer = web.formatter.fallback(page['rows'], page['total_rows'])
+        metrics.observe_stage('format', time.perf_counter() - started)
+
+        await emit('answer', {'formatted_response': answer})
+        await emit('done', {'success': True})
+
+    except db.QueryTooExpensive as e:
+        await emit('error', web.expensive_query_error(question, e))
+    except db.QueryFailed as e:
+        await emit('error', web.failed_query_error(question, e))
+    except Exception as e:
+        logger.error(f"Error streaming answer: {e}")
+        await emit('error', {'success': False, 'error': str(e)})
+
+
+async def serve_ask_stream(scope, send):
+    """Serve GET /api/ask/stream as server-sent events"""
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+
+    def param(name):
+        return query.get(name, [None])[0]
+
+    started = time.perf_counter()
+    metrics.begin_request()
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", b"text/event-stream; charset=utf-8"),
+                            (b"cache-control", b"no-cache"), (b"x-accel-buffering", b"no")]})
+    metrics.request_seconds.observe("ask_stream", time.perf_counter() - started)
+
+    async def emit(event, data):
+        await send({"type": "http.response.body", "body": web.sse_event(event, data).encode("utf-8"),
+                    "more_body": True})
+
+    async with in_flight:
+        try:
+            page_size = pagination.page_size_from(param('page_size'))
+        except ValueError as e:
+            await emit('error', {'success': False, 'error': str(e)})
+        else:
+            await ask_stream(param('question') or '', page_size, param('format'), emit)
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def read_body(receive):
+    """Collect the full request body"""
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body"):
+            return b"".join(chunks)
+
+
+async def send_json(send, payload, status=200, headers=()):
+    body = json.dumps(payload).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"),
+                            (b"content-length", str(len(body)).encode("ascii")), *headers]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def wsgi_environ(scope, body):
+    """WSGI environ for an ASGI HTTP scope"""
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope.get("headers", []):
+        name, value = name.decode("latin-1").upper().replace("-", "_"), value.decode("latin-1")
+        if name in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            environ[name] = value
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    # The body has already been read in full, so its length is known even for chunked uploads
+    environ["CONTENT_LENGTH"] = str(len(body))
+    environ.pop("HTTP_TRANSFER_ENCODING", None)
+    return environ
+
+
+async def serve_wsgi(scope, body, send):
+    """Serve a request with the Flask app on the executor, streaming its body"""
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in headers]
+
+    # Flask's streamed responses keep their request context in context
+    # variables, so every step must run in the same context
+    context = contextvars.copy_context()
+    response = await run_blocking(context.run, web.app, wsgi_environ(scope, body), start_response)
+    chunks = iter(response)
+    try:
+        chunk = await run_blocking(context.run, next, chunks, None)
+        await send({"type": "http.response.start", "status": started["status"], "headers": started["headers"]})
+        while chunk is not None:
+            if chunk:
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            chunk = await run_blocking(context.run, next, chunks, None)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(response, "close"):
+            await run_blocking(context.run, response.close)
+
+
+def wants_ndjson(data, scope):
+    """Whether the client asked for newline-delimited JSON results"""
+    accept = dict(scope.get("headers", [])).get(b"accept", b"").decode("latin-1")
+    return data.get('stream') == 'ndjson' or 'application/x-ndjson' in accept
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            # Startup finishes in the background; /readyz reports when it has
+            web.startup.start()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """ASGI application"""
+    if scope["type"] == "lifespan":
+        return await lifespan(receive, send)
+    if scope["type"] != "http":
+        return
+
+    body = await read_body(receive)
+    # Requests during startup go to the Flask app, which holds them until it finishes
+    if scope["path"] == "/api/ask/stream" and scope["method"] == "GET" and web.startup.ready:
+        return await serve_ask_stream(scope, send)
+    if scope["path"] == "/api/ask" and scope["method"] == "POST":
+        try:
+            data = json.loads(body or b"{}")
+        except ValueError:
+            data = None
+        # NDJSON streaming stays on the Flask view, which writes rows as they are read;
+        # so do requests during startup, which the Flask app holds until it finishes
+        if isinstance(data, dict) and not wants_ndjson(data, scope) and web.startup.ready:
+            async with in_flight:
+                started = time.perf_counter()
+                metrics.begin_request()
+                payload = await ask_question(data)
+                total = time.perf_counter() - started
+                metrics.request_seconds.observe("ask_question", total)
+                timing = metrics.server_timing(total).encode("latin-1")
+                return await send_json(send, payload, headers=[(b"server-timing", timing)])
+
+    await serve_wsgi(scope, body, send)
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the E-commerce AI Agent
+Run: python benchmark.py ingest | queries | pipeline | compare
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import logging
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+
+def timed(func, repeat):
+    """Run func repeat times, returning (median seconds, last result)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def bench_ingest(args):
+    """Compare xlsx parse time with columnar cache load time per workbook"""
+    import pandas as pd
+    import ingest
+    import workbook_cache
+
+    # Use a throwaway cache so the benchmark never touches the real one
+    workbook_cache.CACHE_DIR = tempfile.mkdtemp(prefix="ingest-cache-bench-")
+
+    print(f"{'workbook':<12} {'rows':>8} {'xlsx (s)':>10} {'cache (s)':>10} {'speedup':>8}")
+    for name, spec in ingest.WORKBOOKS.items():
+        if not os.path.exists(spec["path"]):
+            print(f"{name:<12} missing: {spec['path']}")
+            continue
+
+        sha256 = ingest.file_fingerprint(spec["path"])["sha256"]
+        parse_time, df = timed(lambda: pd.read_excel(spec["path"]), args.repeat)
+        workbook_cache.store(name, sha256, df)
+        cache_time, cached = timed(lambda: workbook_cache.load(name, sha256), args.repeat)
+
+        if not cached.equals(df):
+            print(f"{name}: cached frame differs from parsed frame", file=sys.stderr)
+        print(f"{name:<12} {len(df):>8} {parse_time:>10.4f} {cache_time:>10.4f} "
+              f"{parse_time / cache_time:>7.1f}x")
+
+
+# (label, SQL on the original schema, SQL on the current schema)
+QUERY_PAIRS = [
+    ("sales for one product",
+     "SELECT SUM(total_sales) FROM total_sales_metrics WHERE product_id = '42'",
+     "SELECT SUM(total_sales) FROM total_sales_metrics WHERE product_id = '42'"),
+    ("daily sales",
+     "SELECT date, SUM(total_sales) FROM total_sales_metrics GROUP BY date ORDER BY date",
+     "SELECT date_key, SUM(total_sales) FROM total_sales_metrics GROUP BY date_key ORDER BY date_key"),
+    ("sales in a date range",
+     "SELECT SUM(total_sales) FROM total_sales_metrics "
+     "WHERE date BETWEEN '2025-06-05' AND '2025-06-10 23:59:59'",
+     "SELECT SUM(total_sales) FROM total_sales_metrics WHERE date_key BETWEEN 20250605 AND 20250610"),
+    ("ad totals per product",
+     "SELECT product_id, SUM(ad_spend), SUM(ad_sales) FROM ad_sales_metrics GROUP BY product_id",
+     "SELECT product_id, SUM(ad_spend), SUM(ad_sales) FROM ad_sales_metrics GROUP BY product_id"),
+    ("sales joined with ads by product and day",
+     "SELECT s.product_id, SUM(s.total_sales), SUM(a.ad_spend) FROM total_sales_metrics s "
+     "JOIN ad_sales_metrics a ON a.product_id = s.product_id AND a.date = s.date "
+     "GROUP BY s.product_id",
+     "SELECT s.product_id, SUM(s.total_sales), SUM(a.ad_spend) FROM total_sales_metrics s "
+     "JOIN ad_sales_metrics a ON a.product_id = s.product_id AND a.date_key = s.date_key "
+     "GROUP BY s.product_id"),
+]
+
+
+def _copy_scaled(conn, source, scale, with_date_key):
+    """Copy sales and ad rows from source, replicated scale times under new product ids"""
+    conn.execute("ATTACH DATABASE ? AS source", (source,))
+    date_key = ", CAST(strftime('%Y%m%d', date) AS INTEGER)" if with_date_key else ""
+    key_column = ", date_key" if with_date_key else ""
+    for copy in range(scale):
+        suffix = f" || '-{copy}'" if copy else ""
+        conn.execute(f"""
+        INSERT INTO total_sales_metrics (product_id, total_sales, units_sold, revenue, date{key_column})
+        SELECT product_id{suffix}, total_sales, units_sold, revenue, date{date_key}
+        FROM source.total_sales_metrics
+        """)
+        conn.execute(f"""
+        INSERT INTO ad_sales_metrics (product_id, ad_spend, ad_sales, clicks, impressions, cpc, date{key_column})
+        SELECT product_id{suffix}, ad_spend, ad_sales, clicks, impressions, cpc, date{date_key}
+        FROM source.ad_sales_metrics
+        """)
+    conn.commit()
+    conn.execute("DETACH DATABASE source")
+
+
+def bench_queries(args):
+    """Compare common queries on the original schema and the current indexed schema"""
+    import sqlite3
+    import db
+
+    if not os.path.exists(db.DB_PATH):
+        sys.exit(f"{db.DB_PATH} not found; start the app once to create it")
+
+    workdir = tempfile.mkdtemp(prefix="query-bench-")
+
+    # Before: version 1 tables, no indexes, default connection settings
+    before = sqlite3.connect(os.path.join(workdir, "before.db"))
+    for statement in db.TABLES:
+        before.execute(statement)
+    _copy_scaled(before, db.DB_PATH, args.scale, with_date_key=False)
+
+    # After: current schema, migrations and PRAGMAs
+    after = db.connect(os.path.join(workdir, "after.db"))
+    db.create_schema(after)
+    _copy_scaled(after, db.DB_PATH, args.scale, with_date_key=True)
+    after.execute("ANALYZE")
+
+    rows = before.execute("SELECT COUNT(*) FROM ad_sales_metrics").fetchone()[0]
+    print(f"{rows} ad rows (scale {args.scale})")
+    print(f"{'query':<42} {'before (ms)':>12} {'after (ms)':>11} {'speedup':>8}")
+    for label, before_sql, after_sql in QUERY_PAIRS:
+        before_time, before_rows = timed(lambda: before.execute(before_sql).fetchall(), args.repeat)
+        after_time, after_rows = timed(lambda: after.execute(after_sql).fetchall(), args.repeat)
+        if len(before_rows) != len(after_rows):
+            print(f"{label}: result sizes differ ({len(before_rows)} vs {len(after_rows)})", file=sys.stderr)
+        print(f"{label:<42} {before_time * 1000:>12.2f} {after_time * 1000:>11.2f} "
+              f"{before_time / after_time:>7.1f}x")
+
+    before.close()
+    after.close()
+
+
+# Questions replayed by the pipeline benchmark: router templates, fixed
+# answers, canned fake-LLM translations, paraphrases and free-form questions
+QUESTIONS = [
+    "What is my total sales?",
+    "Calculate the RoAS",
+    "How many records are loaded?",
+    "top 5 products by sales",
+    "which 5 items sold the most",
+    "top 10 products by ad spend",
+    "bottom 3 products by cpc",
+    "daily sales",
+    "total sales by month",
+    "units sold",
+    "units sold for product 21",
+    "sales for product 27 last 7 days",
+    "acos for product 21 last week",
+    "ctr by product",
+    "click through rate by product",
+    "average cpc",
+    "ad spend by product",
+    "clicks and impressions by date",
+    "products with more than 100 clicks",
+    "roas by product",
+    "ad sales between 2025-06-01 and 2025-06-07",
+    "top 5 products by sales and roas",
+    "which products are eligible for advertising",
+    "how many products are in the eligibility table",
+    "why did sales drop on june 10",
+    "compare ad spend this week versus last week",
+]
+
+# Stage name -> app function timed during each request
+STAGES = {
+    "direct": "direct_answer",
+    "translate": "convert_question_to_sql",
+    "execute": "execute_sql_paged",
+    "format": "format_response",
+}
+
+
+def percentile(samples, q):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples):
+    """Latency percentiles in ms and throughput per second for a list of durations in seconds"""
+    total = sum(samples)
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 95) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(total / len(samples) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3),
+        "throughput_per_s": round(len(samples) / total, 2) if total else None,
+    }
+
+
+def instrument(module, samples):
+    """Wrap the STAGES functions of the app module so every call records its duration"""
+    for stage, name in STAGES.items():
+        original = getattr(module, name)
+
+        def wrapper(*args, _original=original, _stage=stage, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _original(*args, **kwargs)
+            finally:
+                samples[_stage].append(time.perf_counter() - start)
+
+        setattr(module, name, wrapper)
+
+
+def load_corpus(path):
+    """Questions from a JSON list or a text file with one question per line"""
+    if not path:
+        return QUESTIONS
+    with open(path) as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [line.strip() for line in text.splitlines() if line.strip()]
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_pipeline(args):
+    """Replay a question corpus through /api/ask with the fake LLM, timing every stage"""
+    questions = load_corpus(args.corpus)
+
+    # A throwaway database and ingest cache, and a deterministic offline model
+    workdir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    os.environ["DB_PATH"] = os.path.join(workdir, "bench.db")
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    import workbook_cache
+    workbook_cache.CACHE_DIR = os.path.join(workdir, "ingest-cache")
+
+    start = time.perf_counter()
+    import app as web
+    import_time = time.perf_counter() - start
+
+    # Startup creates the database and ingests the workbooks
+    start = time.perf_counter()
+    web.startup.ensure()
+    startup = time.perf_counter() - start
+
+    stages = {"ingest": []}
+    for _ in range(args.repeat):
+        conn = web.db.connect(web.DB_PATH)
+        start = time.perf_counter()
+        web.load_excel_data(conn.cursor(), force=True)
+        stages["ingest"].append(time.perf_counter() - start)
+        conn.close()
+
+    samples = {stage: [] for stage in STAGES}
+    instrument(web, samples)
+    client = web.app.test_client()
+    passes = []
+    for number in range(args.passes):
+        ask = []
+        failed = 0
+        start = time.perf_counter()
+        for question in questions:
+            began = time.perf_counter()
+            response = client.post("/api/ask", json={"question": question, "format": args.format})
+            ask.append(time.perf_counter() - began)
+            failed += not response.get_json().get("success")
+        elapsed = time.perf_counter() - start
+        # The first pass starts with empty translation and result caches
+        stages.setdefault("ask_cold" if number == 0 else "ask_warm", []).extend(ask)
+        passes.append({"pass": number + 1, "seconds": round(elapsed, 4), "failed": failed,
+                       "questions_per_s": round(len(questions) / elapsed, 2)})
+
+    stages.update(samples)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "config": {"questions": len(questions), "passes": args.passes, "repeat": args.repeat,
+                   "llm_latency_ms": args.llm_latency_ms, "format": args.format},
+        "import_s": round(import_time, 4),
+        "startup_s": round(startup, 4),
+        "passes": passes,
+        "stages": {stage: summarize(values) for stage, values in stages.items() if values},
+        "llm": web.llm.get_client().stats(),
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+
+def bench_compare(args):
+    """Show p50/p95/p99 changes per stage between two pipeline reports"""
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    print(f"{baseline.get('commit')} -> {current.get('commit')}")
+    print(f"{'stage':<12} {'p50 (ms)':>20} {'p95 (ms)':>20} {'p99 (ms)':>20}")
+    for stage, after in current["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before is None:
+            print(f"{stage:<12} (new)")
+            continue
+        cells = []
+        for key in ("p50_ms", "p95_ms", "p99_ms"):
+            change = (after[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            cells.append(f"{before[key]:.2f}->{after[key]:.2f} {change:+.0f}%")
+        print(f"{stage:<12} " + " ".join(f"{cell:>20}" for cell in cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="E-commerce AI Agent benchmarks")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per measurement (median is reported)")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    subparsers.add_parser("ingest", help="xlsx parsing vs columnar cache loading").set_defaults(func=bench_ingest)
+    queries = subparsers.add_parser("queries", help="original schema vs indexed schema")
+    queries.add_argument("--scale", type=int, default=20, help="copies of the data to load")
+    queries.set_defaults(func=bench_queries)
+    pipeline = subparsers.add_parser("pipeline", help="per-stage latency of /api/ask with a fake LLM")
+    pipeline.add_argument("--corpus", help="questions as a JSON list or one per line (default: built-in)")
+    pipeline.add_argument("--passes", type=int, default=3, help="times to replay the corpus; the first is cold")
+    pipeline.add_argument("--llm-latency-ms", type=float, default=0, help="simulated model latency")
+    pipeline.add_argument("--format", choices=("auto", "local", "llm"), default="auto", help="answer formatting policy")
+    pipeline.add_argument("--output", help="write the JSON report here instead of stdout")
+    pipeline.add_argument("--verbose", action="store_true", help="keep the app's INFO logging")
+    pipeline.set_defaults(func=bench_pipeline)
+    compare = subparsers.add_parser("compare", help="compare two pipeline reports")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.set_defaults(func=bench_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+E-commerce AI Agent - Application startup
+One-time startup work (schema migrations, Excel ingest, warm-up) run
+explicitly instead of at import: at most once per process, under a lock,
+optionally on a background thread, with the time each step took
+"""
+
+import os
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds a request waits for startup to finish before it is turned away
+WAIT_SECONDS = float(os.environ.get("STARTUP_WAIT_SECONDS", "30"))
+
+
+class Bootstrap:
+    """Named startup steps, run in order until they have all succeeded once.
+
+    ensure() runs them, or waits for the run already in progress, and may be
+    called from any thread; start() runs them on a background thread so the
+    server can accept connections meanwhile. Steps that succeeded are not run
+    again, so a failed run resumes at the failed step on the next call, and a
+    pre-fork server can run the shared steps once before its workers run the rest.
+    """
+
+    def __init__(self, steps):
+        self.steps = list(steps)
+        self.state = "pending"
+        self.error = None
+        self.timings = {}
+        self.done = set()
+        self.seconds = None
+        self.ready_after = None
+        self._created = time.perf_counter()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.state == "ready"
+
+    def ensure(self, timeout=None, only=None):
+        """Run the startup steps (or just those named in only) that have not
+        succeeded yet; False when timeout passed first"""
+        if self.ready:
+            return True
+        if not self._lock.acquire(timeout=-1 if timeout is None else timeout):
+            return False
+        try:
+            pending = [(name, step) for name, step in self.steps
+                       if name not in self.done and (only is None or name in only)]
+            if pending:
+                self._run(pending)
+        finally:
+            self._lock.release()
+        return True
+
+    def _run(self, pending):
+        self.state = "starting"
+        self.error = None
+        for name, step in pending:
+            step_started = time.perf_counter()
+            try:
+                step()
+            except Exception as e:
+                self.state, self.error = "failed", f"{name}: {e}"
+                raise
+            finally:
+                self.timings[name] = time.perf_counter() - step_started
+            self.done.add(name)
+        if len(self.done) < len(self.steps):
+            self.state = "pending"
+            return
+        self.seconds = sum(self.timings.values())
+        self.ready_after = time.perf_counter() - self._created
+        self.state = "ready"
+        steps = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items())
+        logger.info(f"Startup finished in {self.seconds:.2f}s ({steps}), "
+                    f"{self.ready_after:.2f}s after the app was created")
+
+    def start(self):
+        """Run the startup steps on a background thread, once"""
+        if self.ready or (self._thread is not None and self._thread.is_alive()):
+            return self._thread
+        self._thread = threading.Thread(target=self._background, name="startup", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def _background(self):
+        try:
+            self.ensure()
+        except Exception as e:
+            logger.error(f"Startup failed: {e}")
+
+    def status(self):
+        """State, error and per-step timings in seconds"""
+        return {
+            "state": self.state,
+            "error": self.error,
+            "pid": os.getpid(),
+            "steps": {name: round(seconds, 4) for name, seconds in self.timings.items()},
+            "startup_seconds": round(self.seconds, 4) if self.seconds is not None else None,
+            "ready_after_seconds": round(self.ready_after, 4) if self.ready_after is not None else None,
+        }
@@ -0,0 +1,312 @@
+"""
+E-commerce AI Agent - Caches
+In-memory LRU/TTL cache and the persistent NL-to-SQL translation cache
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+
+import db
+
+logger = logging.getLogger(__name__)
+
+# Translation cache sizing
+TRANSLATION_CACHE_SIZE = int(os.environ.get("TRANSLATION_CACHE_SIZE", "1000"))
+TRANSLATION_CACHE_TTL = int(os.environ.get("TRANSLATION_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Query result cache sizing; results larger than RESULT_CACHE_MAX_ENTRY_BYTES are not cached
+RESULT_CACHE_BYTES = int(os.environ.get("RESULT_CACHE_BYTES", str(64 * 1024 * 1024)))
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.environ.get("RESULT_CACHE_MAX_ENTRY_BYTES", str(4 * 1024 * 1024)))
+RESULT_CACHE_ENTRIES = int(os.environ.get("RESULT_CACHE_ENTRIES", "10000"))
+
+# Seconds between checks of the stored data version, so ingests by other
+# processes are noticed without a database read per request
+DATA_VERSION_CHECK_SECONDS = float(os.environ.get("DATA_VERSION_CHECK_SECONDS", "1"))
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache with a per-entry time to live.
+
+    Entries are evicted when there are more than max_entries of them or,
+    when max_bytes is set, when their combined size exceeds it.
+    """
+
+    def __init__(self, max_entries, ttl=None, max_bytes=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Return the cached value, or None on a miss or expiry"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, age=0.0, size=0):
+        """Store a value; age lets entries loaded from disk keep their original expiry"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() - age, size)
+            self.bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes and self.bytes > self.max_bytes and len(self._entries) > 1):
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def discard(self, key):
+        """Drop an entry if it is cached"""
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        """Drop one entry (lock held)"""
+        self.bytes -= self._entries.pop(key)[2]
+
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        """Entry count, hits, misses and hit rate"""
+        lookups = self.hits + self.misses
+        stats = {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+        if self.max_bytes:
+            stats.update(bytes=self.bytes, max_bytes=self.max_bytes, evictions=self.evictions)
+        return stats
+
+
+def normalize_question(question):
+    """Lowercase, drop punctuation and collapse whitespace so trivial variants share a key"""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+def schema_fingerprint(schema_prompt):
+    """Short hash of the schema prompt; a new schema invalidates old translations"""
+    return hashlib.sha256(schema_prompt.encode("utf-8")).hexdigest()[:16]
+
+
+class TranslationCache:
+    """NL-to-SQL translations keyed by normalized question and schema prompt.
+
+    Lookups hit the in-memory LRU first and fall back to the
+    translation_cache table, so translations survive restarts.
+    """
+
+    def __init__(self, path=None, max_entries=TRANSLATION_CACHE_SIZE, ttl=TRANSLATION_CACHE_TTL):
+        self.path = path or db.DB_PATH
+        self.ttl = ttl
+        self.memory = LRUCache(max_entries, ttl)
+        self.db_hits = 0
+        self.misses = 0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        """Writable connection for the translation_cache table, opened on first use"""
+        if self._conn is None:
+            self._conn = db.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA busy_timeout = 5000")
+        return self._conn
+
+    @staticmethod
+    def key(question, schema_prompt):
+        """Cache key for a question under a given schema prompt"""
+        normalized = normalize_question(question)
+        return hashlib.sha256(f"{normalized}\0{schema_fingerprint(schema_prompt)}".encode("utf-8")).hexdigest()
+
+    def get(self, question, schema_prompt):
+        """Return the cached {"sql", "explanation"} for a question, or None"""
+        key = self.key(question, schema_prompt)
+        sql_info = self.memory.get(key)
+        if sql_info is not None:
+            return sql_info
+
+        try:
+            with self._lock:
+                row = self._connection().execute(
+                    "SELECT sql, explanation, created_at FROM translation_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    self._connection().execute(
+                        "UPDATE translation_cache SET hits = hits + 1 WHERE key = ?", (key,))
+                    self._connection().commit()
+        except Exception as e:
+            logger.warning(f"Translation cache lookup failed: {e}")
+            row = None
+
+        age = time.time() - row[2] if row is not None else None
+        if row is None or (self.ttl and age > self.ttl):
+            self.misses += 1
+            return None
+
+        self.db_hits += 1
+        sql_info = {"sql": row[0], "explanation": row[1]}
+        self.memory.set(key, sql_info, age=age)
+        return sql_info
+
+    def put(self, question, schema_prompt, sql_info, validated=False):
+        """Remember a translation in memory and on disk"""
+        key = self.key(question, schema_prompt)
+        entry = {"sql": sql_info["sql"], "explanation": sql_info.get("explanation", "")}
+        self.memory.set(key, entry)
+        try:
+            with self._lock:
+                self._connection().execute("""
+                INSERT OR REPLACE INTO translation_cache
+                (key, question, schema_hash, sql, explanation, created_at, hits, validated)
+                VALUES (?, ?, ?, ?, ?, ?, 0, ?)
+                """, (key, normalize_question(question), schema_fingerprint(schema_prompt),
+                      entry["sql"], entry["explanation"], time.time(), int(validated)))
+                self._connection().commit()
+        except Exception as e:
+            logger.warning(f"Could not persist translation: {e}")
+
+    def delete(self, question, schema_prompt):
+        """Forget a translation, e.g. one whose SQL no longer runs"""
+        key = self.key(question, schema_prompt)
+        self.memory.discard(key)
+        try:
+            with self._lock:
+                self._connection().execute("DELETE FROM translation_cache WHERE key = ?", (key,))
+                self._connection().commit()
+        except Exception as e:
+            logger.warning(f"Could not delete translation: {e}")
+
+    def mark_validated(self, question, schema_prompt):
+        """Record that a cached translation executed successfully; False if it is not cached"""
+        try:
+            with self._lock:
+                updated = self._connection().execute(
+                    "UPDATE translation_cache SET validated = 1 WHERE key = ?",
+                    (self.key(question, schema_prompt),)).rowcount
+                self._connection().commit()
+            return updated > 0
+        except Exception as e:
+            logger.warning(f"Could not mark translation as validated: {e}")
+            return False
+
+    def validated_entries(self, schema_prompt):
+        """(key, question, sql_info) for every unexpired, validated translation under a schema"""
+        try:
+            with self._lock:
+                rows = self._connection().execute("""
+                SELECT key, question, sql, explanation, created_at FROM translation_cache
+                WHERE validated = 1 AND schema_hash = ?
+                """, (schema_fingerprint(schema_prompt),)).fetchall()
+        except Exception as e:
+            logger.warning(f"Could not load validated translations: {e}")
+            return []
+        now = time.time()
+        return [(key, question, {"sql": sql, "explanation": explanation})
+                for key, question, sql, explanation, created_at in rows
+                if not self.ttl or now - created_at <= self.ttl]
+
+    def stats(self):
+        """Hit counts for both tiers and the overall hit rate"""
+        memory_hits = self.memory.hits
+        lookups = memory_hits + self.db_hits + self.misses
+        return {
+            "entries_in_memory": len(self.memory),
+            "memory_hits": memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+def normalize_sql(sql):
+    """Collapse whitespace outside string literals and drop a trailing semicolon"""
+    parts = re.split(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\")", sql.strip().rstrip(";"))
+    return "".join(part if i % 2 else re.sub(r"\s+", " ", part) for i, part in enumerate(parts)).strip()
+
+
+class ResultCache:
+    """Query results keyed by normalized SQL, its parameters and the data version they were read at.
+
+    Ingest bumps the version stored in the data_version table, so cached
+    results are never served after the tables change. The stored version is
+    re-read at most every check_interval seconds, which also picks up ingests
+    run by other processes.
+    """
+
+    def __init__(self, path=None, max_bytes=RESULT_CACHE_BYTES,
+                 max_entry_bytes=RESULT_CACHE_MAX_ENTRY_BYTES, max_entries=RESULT_CACHE_ENTRIES,
+                 check_interval=DATA_VERSION_CHECK_SECONDS):
+        self.path = path or db.DB_PATH
+        self.memory = LRUCache(max_entries, max_bytes=max_bytes)
+        self.max_entry_bytes = max_entry_bytes
+        self.check_interval = check_interval
+        self.skipped = 0
+        self._version = None
+        self._checked = 0.0
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def version(self):
+        """Current data version, re-read when the last check is older than check_interval"""
+        with self._lock:
+            now = time.monotonic()
+            if self._version is None or now - self._checked >= self.check_interval:
+                if self._conn is None:
+                    self._conn = db.connect(self.path, check_same_thread=False)
+                version = db.read_data_version(self._conn)
+                if self._version is not None and version != self._version:
+                    logger.info(f"Data version changed {self._version} -> {version}; dropping cached results")
+                    self.memory.clear()
+                self._version = version
+                self._checked = now
+            return self._version
+
+    def invalidate(self):
+        """Force the next lookup to re-read the data version, e.g. right after an ingest"""
+        with self._lock:
+            self._checked = 0.0
+
+    def get(self, sql, params=()):
+        """Cached rows for sql and its parameters at the current data version, or None"""
+        return self.memory.get((self.version(), normalize_sql(sql), tuple(params)))
+
+    def put(self, sql, rows, version, params=()):
+        """Cache rows read at a data version; returns False when they are stale or too large"""
+        size = len(json.dumps(rows, default=str))
+        if size > self.max_entry_bytes or version != self.version():
+            self.skipped += 1
+            return False
+        self.memory.set((version, normalize_sql(sql), tuple(params)), rows, size=size)
+        return True
+
+    def stats(self):
+        """Entry count, bytes held, hit rate and the data version in use"""
+        return dict(self.memory.stats(), skipped=self.skipped, data_version=self._version)
@@ -0,0 +1,492 @@
+"""
+E-commerce AI Agent - Database schema
+Table definitions, versioned migrations and connection tuning for SQLite
+"""
+
+import os
+import time
+import sqlite3
+import logging
+import threading
+from pathlib import Path
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Database path
+DB_PATH = os.environ.get("DB_PATH", "ecommerce.db")
+
+# Performance settings applied to every connection
+MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+CACHE_SIZE_KB = int(os.environ.get("SQLITE_CACHE_SIZE_KB", str(64 * 1024)))
+
+# Read-only connection pool used to answer questions
+POOL_SIZE = int(os.environ.get("SQLITE_POOL_SIZE", "8"))
+POOL_TIMEOUT = float(os.environ.get("SQLITE_POOL_TIMEOUT", "30"))
+STATEMENT_CACHE_SIZE = int(os.environ.get("SQLITE_STATEMENT_CACHE", "256"))
+
+# Limits for generated SQL: wall-clock deadline, SQLite VM instructions
+# (a proxy for rows scanned) and rows returned. 0 disables a limit.
+QUERY_TIMEOUT_MS = int(os.environ.get("QUERY_TIMEOUT_MS", "5000"))
+QUERY_MAX_STEPS = int(os.environ.get("QUERY_MAX_STEPS", "200000000"))
+QUERY_MAX_ROWS = int(os.environ.get("QUERY_MAX_ROWS", "10000"))
+
+# VM instructions between progress handler calls
+PROGRESS_INTERVAL = 10000
+
+# Base tables (schema version 1). Later versions are applied by MIGRATIONS.
+TABLES = [
+    """
+    CREATE TABLE IF NOT EXISTS products (
+        id INTEGER PRIMARY KEY,
+        product_id TEXT UNIQUE,
+        product_name TEXT,
+        category TEXT,
+        brand TEXT,
+        price REAL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS total_sales_metrics (
+        id INTEGER PRIMARY KEY,
+        product_id TEXT,
+        total_sales REAL,
+        units_sold INTEGER,
+        revenue REAL,
+        date TEXT,
+        FOREIGN KEY (product_id) REFERENCES products (product_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ad_sales_metrics (
+        id INTEGER PRIMARY KEY,
+        product_id TEXT,
+        ad_spend REAL,
+        ad_sales REAL,
+        clicks INTEGER,
+        impressions INTEGER,
+        cpc REAL,
+        date TEXT,
+        FOREIGN KEY (product_id) REFERENCES products (product_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS ingest_manifest (
+        workbook TEXT PRIMARY KEY,
+        path TEXT,
+        size INTEGER,
+        mtime REAL,
+        sha256 TEXT,
+        rows_loaded INTEGER,
+        rows_hash TEXT,
+        loaded_at TEXT
+    )
+    """,
+]
+
+
+def _migrate_v2(cursor):
+    """Sortable integer day keys and covering indexes for product/date access"""
+    for table in ("total_sales_metrics", "ad_sales_metrics"):
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN date_key INTEGER")
+        cursor.execute(f"UPDATE {table} SET date_key = CAST(strftime('%Y%m%d', date) AS INTEGER)")
+
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_sales_product_date
+    ON total_sales_metrics (product_id, date_key, total_sales, units_sold, revenue)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_sales_date_product
+    ON total_sales_metrics (date_key, product_id, total_sales, units_sold, revenue)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_ads_product_date
+    ON ad_sales_metrics (product_id, date_key, ad_spend, ad_sales, clicks, impressions)
+    """)
+    cursor.execute("""
+    CREATE INDEX IF NOT EXISTS idx_ads_date_product
+    ON ad_sales_metrics (date_key, product_id, ad_spend, ad_sales, clicks, impressions)
+    """)
+
+
+def _migrate_v3(cursor):
+    """Persistent NL-to-SQL translation cache"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS translation_cache (
+        key TEXT PRIMARY KEY,
+        question TEXT,
+        schema_hash TEXT,
+        sql TEXT,
+        explanation TEXT,
+        created_at REAL,
+        hits INTEGER DEFAULT 0
+    )
+    """)
+
+
+def _migrate_v4(cursor):
+    """Mark translations whose SQL has run successfully, for paraphrase reuse"""
+    cursor.execute("ALTER TABLE translation_cache ADD COLUMN validated INTEGER DEFAULT 0")
+
+
+def _migrate_v5(cursor):
+    """Data version counter, bumped whenever ingest changes the tables"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS data_version (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL
+    )
+    """)
+    cursor.execute("INSERT OR IGNORE INTO data_version (id, version) VALUES (1, 0)")
+
+
+def _migrate_v6(cursor):
+    """Materialized rollups of the fact tables (filled by rollups.refresh at ingest)"""
+    measures = """
+        total_sales REAL, units_sold INTEGER, revenue REAL,
+        ad_spend REAL, ad_sales REAL, clicks INTEGER, impressions INTEGER,
+        roas REAL, cpc REAL, ctr_percent REAL, acos_percent REAL
+    """
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS product_daily_metrics (
+        product_id TEXT,
+        date_key INTEGER,
+        date TEXT,
+        {measures},
+        PRIMARY KEY (product_id, date_key)
+    )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_product_daily_date ON product_daily_metrics (date_key, product_id)")
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS product_summary (
+        product_id TEXT PRIMARY KEY,
+        days INTEGER,
+        first_date_key INTEGER,
+        last_date_key INTEGER,
+        {measures}
+    )
+    """)
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS daily_summary (
+        date_key INTEGER PRIMARY KEY,
+        date TEXT,
+        products INTEGER,
+        {measures}
+    )
+    """)
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS rollup_state (
+        source TEXT PRIMARY KEY,
+        max_id INTEGER
+    )
+    """)
+
+
+def _migrate_v7(cursor):
+    """Slow or costly generated queries with their plans, aggregated per normalized SQL"""
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS slow_query_log (
+        sql_hash TEXT PRIMARY KEY,
+        sql TEXT,
+        plan TEXT,
+        full_scans TEXT,
+        temp_btrees INTEGER,
+        cost INTEGER,
+        calls INTEGER,
+        total_ms REAL,
+        max_ms REAL,
+        last_rows INTEGER,
+        last_status TEXT,
+        first_seen TEXT,
+        last_seen TEXT
+    )
+    """)
+
+
+# Schema version -> migration that upgrades the previous version to it
+MIGRATIONS = {
+    2: _migrate_v2,
+    3: _migrate_v3,
+    4: _migrate_v4,
+    5: _migrate_v5,
+    6: _migrate_v6,
+    7: _migrate_v7,
+}
+
+SCHEMA_VERSION = max(MIGRATIONS)
+
+
+def _apply_read_pragmas(conn):
+    """Per-connection settings that also apply to read-only connections"""
+    conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    conn.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KB}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def apply_pragmas(conn):
+    """Tune a connection for read-heavy analytical queries"""
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    _apply_read_pragmas(conn)
+    return conn
+
+
+def connect(path=None, **kwargs):
+    """Open a tuned connection to the database"""
+    return apply_pragmas(sqlite3.connect(path or DB_PATH, **kwargs))
+
+
+def create_schema(conn):
+    """Create missing tables and bring the schema up to SCHEMA_VERSION"""
+    cursor = conn.cursor()
+    for statement in TABLES:
+        cursor.execute(statement)
+    conn.commit()
+
+    # Fresh databases and databases created before versioning report 0
+    version = conn.execute("PRAGMA user_version").fetchone()[0] or 1
+    for target in sorted(v for v in MIGRATIONS if v > version):
+        logger.info(f"Migrating database schema to version {target}")
+        try:
+            cursor.execute("BEGIN")
+            MIGRATIONS[target](cursor)
+            cursor.execute(f"PRAGMA user_version = {target}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+
+@contextmanager
+def write_lock(path=None):
+    """Hold an exclusive lock file next to the database, so only one process
+    at a time migrates or ingests; the others wait and then find it done"""
+    if fcntl is None:
+        yield
+        return
+    with open(f"{path or DB_PATH}.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def prewarm(path=None, max_bytes=MMAP_SIZE, chunk_size=1024 * 1024):
+    """Read the database file once so its pages are in the OS page cache,
+    which every process and memory map then shares; returns bytes read"""
+    total = 0
+    with open(path or DB_PATH, "rb") as f:
+        while total < max_bytes:
+            chunk = f.read(min(chunk_size, max_bytes - total))
+            if not chunk:
+                break
+            total += len(chunk)
+    return total
+
+
+def read_data_version(conn):
+    """Counter that changes whenever ingested data changes"""
+    return conn.execute("SELECT version FROM data_version WHERE id = 1").fetchone()[0]
+
+
+def bump_data_version(conn):
+    """Mark the data as changed, invalidating cached query results everywhere"""
+    conn.execute("UPDATE data_version SET version = version + 1 WHERE id = 1")
+    conn.commit()
+
+
+class QueryTooExpensive(Exception):
+    """Raised when a query exceeds its time, scan or row budget"""
+
+    def __init__(self, reason, limit, message):
+        super().__init__(message)
+        self.reason = reason
+        self.limit = limit
+
+    def to_dict(self):
+        return {'reason': self.reason, 'limit': self.limit, 'message': str(self)}
+
+
+class QueryFailed(Exception):
+    """Raised when a query could not be run, e.g. generated SQL with an error"""
+
+
+def iter_guarded(conn, sql, params=(), batch_size=1000, timeout_ms=QUERY_TIMEOUT_MS,
+                 max_steps=QUERY_MAX_STEPS, max_rows=QUERY_MAX_ROWS):
+    """Run a query under a deadline and work budget, yielding batches of dict rows.
+
+    SQLite calls the progress handler every PROGRESS_INTERVAL VM instructions;
+    returning non-zero interrupts the statement, which keeps one runaway
+    query (e.g. an accidental cartesian join) from pinning a worker. The
+    deadline is wall-clock time from the start of the query, including time
+    the consumer spends between batches, so a slow reader cannot hold the
+    connection past it either.
+    """
+    deadline = time.monotonic() + timeout_ms / 1000 if timeout_ms else None
+    state = {"steps": 0, "reason": None}
+
+    def check_budget():
+        state["steps"] += PROGRESS_INTERVAL
+        if deadline is not None and time.monotonic() > deadline:
+            state["reason"] = "timeout"
+            return 1
+        if max_steps and state["steps"] > max_steps:
+            state["reason"] = "scan_budget"
+            return 1
+        return 0
+
+    def timed_out():
+        return QueryTooExpensive("timeout", timeout_ms, f"Query took longer than {timeout_ms} ms and was stopped")
+
+    conn.set_progress_handler(check_budget, PROGRESS_INTERVAL)
+    cursor = None
+    try:
+        returned = 0
+        cursor = conn.execute(sql, params)
+        while True:
+            if deadline is not None and time.monotonic() > deadline:
+                raise timed_out()
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            returned += len(rows)
+            if max_rows and returned > max_rows:
+                raise QueryTooExpensive("row_limit", max_rows,
+                                        f"Query returned more than {max_rows} rows; "
+                                        f"try aggregating or adding a LIMIT")
+            yield [dict(row) for row in rows]
+    except sqlite3.OperationalError as e:
+        if state["reason"] == "timeout":
+            raise timed_out() from e
+        if state["reason"] == "scan_budget":
+            raise QueryTooExpensive("scan_budget", max_steps,
+                                    "Query scanned too much data and was stopped") from e
+        raise
+    finally:
+        if cursor is not None:
+            cursor.close()
+        conn.set_progress_handler(None, 0)
+
+
+def run_guarded(conn, sql, params=(), **limits):
+    """Run a query under the same limits as iter_guarded, returning all rows as dicts"""
+    results = []
+    for batch in iter_guarded(conn, sql, params, **limits):
+        results.extend(batch)
+    return results
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection became free within POOL_TIMEOUT"""
+
+
+class ConnectionPool:
+    """Bounded pool of warm, read-only SQLite connections.
+
+    Each thread gets back the connection it used last when that one is free,
+    so its page cache and prepared statement cache stay warm. When every
+    connection is busy and the pool is full, callers wait for one to be
+    released.
+    """
+
+    def __init__(self, path=None, size=POOL_SIZE, timeout=POOL_TIMEOUT,
+                 statement_cache=STATEMENT_CACHE_SIZE):
+        self.path = path or DB_PATH
+        self.size = size
+        self.timeout = timeout
+        self.statement_cache = statement_cache
+        self._idle = []
+        self._all = []
+        self._local = threading.local()
+        self._available = threading.Condition()
+        self._stats = {"hits": 0, "misses": 0, "waits": 0, "timeouts": 0}
+
+    def _open(self):
+        """Open a read-only connection with the tuned settings"""
+        uri = Path(self.path).absolute().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False,
+                               cached_statements=self.statement_cache)
+        conn.row_factory = sqlite3.Row
+        _apply_read_pragmas(conn)
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    def acquire(self):
+        """Check out a connection, preferring the one this thread used last"""
+        preferred = getattr(self._local, "conn", None)
+        deadline = time.monotonic() + self.timeout
+        with self._available:
+            waited = False
+            while True:
+                if preferred is not None and preferred in self._idle:
+                    self._idle.remove(preferred)
+                    self._stats["hits"] += 1
+                    return preferred
+                if self._idle:
+                    conn = self._idle.pop()
+                    self._stats["hits"] += 1
+                    self._local.conn = conn
+                    return conn
+                if len(self._all) < self.size:
+                    # Reserve the slot, then open outside the lock
+                    self._all.append(None)
+                    self._stats["misses"] += 1
+                    break
+                if not waited:
+                    self._stats["waits"] += 1
+                    waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._available.wait(remaining):
+                    self._stats["timeouts"] += 1
+                    raise PoolTimeout(f"No database connection free after {self.timeout}s")
+
+        try:
+            conn = self._open()
+        except Exception:
+            with self._available:
+                self._all.remove(None)
+                self._available.notify()
+            raise
+        with self._available:
+            self._all[self._all.index(None)] = conn
+        self._local.conn = conn
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool"""
+        if conn.in_transaction:
+            # Never hold a read snapshot while idle
+            conn.rollback()
+        with self._available:
+            self._idle.append(conn)
+            self._available.notify()
+
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and back in"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        """Hit/miss/wait counters and connection counts"""
+        with self._available:
+            opened = sum(1 for conn in self._all if conn is not None)
+            return dict(self._stats, open=opened, idle=len(self._idle),
+                        in_use=opened - len(self._idle), size=self.size)
+
+    def close(self):
+        """Close idle connections, e.g. before forking worker processes"""
+        with self._available:
+            for conn in self._idle:
+                self._all.remove(conn)
+                conn.close()
+            self._idle = []
@@ -0,0 +1,124 @@
+"""
+E-commerce AI Agent - Result digests
+Bounded summaries of query results for LLM prompts: small results are sent
+as they are, larger ones as row count, column statistics, top/bottom rows
+and histograms trimmed to a token budget
+"""
+
+import os
+import json
+import math
+import logging
+from collections import Counter
+
+from formatter import is_number, DATE_COLUMNS
+from llm import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Most tokens the results part of a prompt may take
+TOKEN_BUDGET = int(os.environ.get("PROMPT_RESULT_TOKENS", "1500"))
+
+# Rows kept from each end of the ordering, and histogram buckets per numeric column
+TOP_K = int(os.environ.get("DIGEST_TOP_K", "5"))
+HISTOGRAM_BINS = int(os.environ.get("DIGEST_HISTOGRAM_BINS", "8"))
+
+# Most rows of a paged result read back to compute a digest
+MAX_ROWS = int(os.environ.get("DIGEST_MAX_ROWS", "100000"))
+
+# Distinct values listed for a text column
+TOP_VALUES = 5
+
+
+def _dumps(value):
+    return json.dumps(value, default=str, separators=(",", ":"))
+
+
+def _round(value):
+    return round(value, 4) if isinstance(value, float) else value
+
+
+def numeric_columns(rows):
+    """Columns whose non-null values are all numbers"""
+    columns = list(rows[0]) if rows else []
+    return [c for c in columns
+            if any(row[c] is not None for row in rows)
+            and all(is_number(row[c]) or row[c] is None for row in rows)]
+
+
+def column_stats(rows, column, numeric):
+    """Nulls, then min/max for dates, min/max/mean/sum for numbers, or distinct and common values for text"""
+    values = [row[column] for row in rows if row[column] is not None]
+    stats = {"nulls": len(rows) - len(values)}
+    if not values:
+        return stats
+    if column in DATE_COLUMNS:
+        stats.update(min=min(values), max=max(values))
+    elif numeric:
+        stats.update(min=_round(min(values)), max=_round(max(values)),
+                     mean=_round(sum(values) / len(values)), sum=_round(sum(values)))
+    else:
+        counts = Counter(str(v) for v in values)
+        stats.update(distinct=len(counts), common=[value for value, _ in counts.most_common(TOP_VALUES)])
+    return stats
+
+
+def histogram(values, bins=HISTOGRAM_BINS):
+    """Equal-width buckets as [[low, high, count], ...]"""
+    low, high = min(values), max(values)
+    if low == high:
+        return [[_round(low), _round(high), len(values)]]
+    width = (high - low) / bins
+    counts = [0] * bins
+    for value in values:
+        counts[min(int((value - low) / width), bins - 1)] += 1
+    return [[_round(low + i * width), _round(low + (i + 1) * width), count] for i, count in enumerate(counts)]
+
+
+def summarize(rows, total_rows=None, k=TOP_K, histograms=True, max_columns=None):
+    """Digest of a result set; the knobs let fit_digest shrink it"""
+    digest = {"row_count": max(total_rows or 0, len(rows)), "rows_summarized": len(rows)}
+    if max_columns and len(rows[0]) > max_columns:
+        digest["columns_omitted"] = list(rows[0])[max_columns:]
+        rows = [dict(list(row.items())[:max_columns]) for row in rows]
+    numeric = numeric_columns(rows)
+    digest["columns"] = {c: column_stats(rows, c, c in numeric) for c in rows[0]}
+    # Order by the first measure that is not an id, falling back to result order
+    metric = next((c for c in numeric if not c.endswith("id") and c not in DATE_COLUMNS), None)
+    if metric:
+        ranked = sorted((row for row in rows if row[metric] is not None), key=lambda row: row[metric], reverse=True)
+        digest["ordered_by"] = metric
+        digest["top_rows"] = ranked[:k]
+        digest["bottom_rows"] = ranked[-k:][::-1] if len(ranked) > k else []
+    else:
+        digest["first_rows"] = rows[:k]
+        digest["last_rows"] = rows[-k:] if len(rows) > k else []
+    if histograms:
+        digest["histograms"] = {c: histogram([row[c] for row in rows if row[c] is not None])
+                                for c in numeric if c not in DATE_COLUMNS}
+    return digest
+
+
+def fit_digest(rows, total_rows=None, budget=TOKEN_BUDGET):
+    """Results as prompt text within budget tokens, and whether it is a digest.
+
+    The rows are sent unchanged when they fit; otherwise the digest is
+    shrunk step by step (fewer example rows, no histograms, fewer columns)
+    until it does.
+    """
+    if not rows:
+        return "[]", False
+    text = _dumps(rows)
+    if estimate_tokens(text) <= budget:
+        return text, False
+
+    columns = len(rows[0])
+    steps = [dict(k=k, histograms=True) for k in range(TOP_K, 0, -1)]
+    steps += [dict(k=1, histograms=False, max_columns=max(1, columns >> shift))
+              for shift in range(int(math.log2(columns)) + 1)]
+    for step in steps:
+        text = _dumps(summarize(rows, total_rows, **step))
+        if estimate_tokens(text) <= budget:
+            return text, True
+    logger.warning(f"Result digest still {estimate_tokens(text)} tokens over a {budget}-token budget")
+    return text, True
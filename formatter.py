@@ -0,0 +1,222 @@
+"""
+E-commerce AI Agent - Answer formatting
+Templated answers for common result shapes, so most questions need no
+second LLM call
+"""
+
+import os
+import re
+import logging
+
+logger = logging.getLogger(__name__)
+
+# auto: format recognized shapes locally and use the LLM for the rest
+# local: never call the LLM for formatting
+# llm: always call the LLM for formatting
+FORMAT_POLICY = os.environ.get("FORMAT_POLICY", "auto")
+POLICIES = ("auto", "local", "llm")
+
+# Longest top-N list or time series written out line by line
+MAX_LISTED_ROWS = int(os.environ.get("FORMAT_MAX_LISTED_ROWS", "20"))
+
+DATE_COLUMNS = {"date", "date_key", "day", "week", "month", "year", "period"}
+
+
+def humanize(column):
+    """Readable label for a column name, e.g. SUM(total_sales) -> sum of total sales,
+    COUNT(*) -> number of rows"""
+    match = re.fullmatch(r"(\w+)\((.*)\)", column.strip())
+    if match and match.group(1).lower() == "count":
+        argument = match.group(2).strip()
+        if argument == "*":
+            return "number of rows"
+        distinct = re.match(r"distinct\s+", argument, flags=re.I)
+        counted = pluralize(humanize(argument[distinct.end():] if distinct else argument))
+        return f"number of {'distinct ' if distinct else ''}{counted}"
+    if match:
+        return f"{match.group(1).lower()} of {humanize(match.group(2))}"
+    label = column.split(".")[-1].replace("_", " ").strip()
+    return re.sub(r"\broas\b|\bcpc\b|\bctr\b|\bid\b", lambda m: m.group(0).upper(), label, flags=re.I)
+
+
+def pluralize(label):
+    """Plural of a label's last word, e.g. product ID -> product IDs"""
+    return label if is_plural(label.split()[-1]) else label + "s"
+
+
+def is_plural(word):
+    """Whether a lowercase label word reads as a plural noun (sales, products, days)"""
+    return word.islower() and word.endswith("s") and not word.endswith(("ss", "us", "is"))
+
+
+def label_is_plural(label):
+    """Verb agreement for a label: its head is the part before "of" (sum of sales is
+    singular), where any plural word makes it plural (total sales, units sold)"""
+    return any(is_plural(word) for word in label.split(" of ")[0].split())
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def format_value(value):
+    """Numbers with thousands separators, floats to two decimals"""
+    if value is None:
+        return "n/a"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    if is_number(value):
+        return f"{value:,}"
+    return str(value)
+
+
+def format_date(value):
+    """Render a date_key (20250601) or timestamp text as YYYY-MM-DD"""
+    if value is None:
+        return format_value(value)
+    if is_number(value) and 19000101 <= value <= 29991231:
+        value = str(int(value))
+        return f"{value[:4]}-{value[4:6]}-{value[6:]}"
+    text = str(value)
+    return text[:10] if re.match(r"\d{4}-\d{2}-\d{2} 00:00:00$", text) else text
+
+
+def _date_column(rows, columns):
+    """Name of the column holding periods, if any"""
+    for column in columns:
+        if column.split(".")[-1].lower() in DATE_COLUMNS:
+            return column
+    for column in columns:
+        if all(isinstance(row[column], str) and re.match(r"\d{4}-\d{2}(-\d{2})?", row[column]) for row in rows):
+            return column
+    return None
+
+
+def classify(rows):
+    """Result shape: empty, scalar, single_row, time_series, top_n, or None when unrecognized"""
+    if not rows:
+        return "empty"
+    columns = list(rows[0])
+    if len(rows) == 1:
+        return "scalar" if len(columns) == 1 else "single_row"
+
+    numeric = [c for c in columns if all(is_number(row[c]) or row[c] is None for row in rows)]
+    date_column = _date_column(rows, columns)
+    if date_column:
+        others = [c for c in columns if c not in numeric and c != date_column]
+        if not others and [c for c in numeric if c != date_column]:
+            return "time_series"
+        return None
+    labels = [c for c in columns if c not in numeric]
+    if numeric and len(labels) <= 1 and len(columns) - len(numeric) <= 1:
+        return "top_n"
+    return None
+
+
+def _listing_note(shown, total):
+    if total and total > shown:
+        return f" (showing {shown} of {total:,})"
+    return ""
+
+
+def _scalar(rows):
+    column, value = next(iter(rows[0].items()))
+    label = humanize(column)
+    # A count named after what it counts: "There are 337 products."
+    if isinstance(value, int) and not isinstance(value, bool) and " " not in label and is_plural(label):
+        if value == 1:
+            return f"There is 1 {label[:-1]}."
+        return f"There are {format_value(value)} {label}."
+    verb = "are" if label_is_plural(label) else "is"
+    return f"The {label} {verb} {format_value(value)}."
+
+
+def _single_row(rows):
+    date_column = _date_column(rows, list(rows[0]))
+    fields = "; ".join(f"{humanize(c)}: {format_date(v) if c == date_column else format_value(v)}"
+                       for c, v in rows[0].items())
+    return f"Here is the result: {fields}."
+
+
+def _time_series(rows, total_rows):
+    columns = list(rows[0])
+    date_column = _date_column(rows, columns)
+    metrics = [c for c in columns if c != date_column and all(is_number(r[c]) or r[c] is None for r in rows)]
+    metric = metrics[0]
+    values = [(row[date_column], row[metric]) for row in rows if row[metric] is not None]
+    first, last = format_date(rows[0][date_column]), format_date(rows[-1][date_column])
+
+    summary = f"{humanize(metric).capitalize()} from {first} to {last} over {len(rows)} periods"
+    if values:
+        total = sum(v for _, v in values)
+        peak_date, peak = max(values, key=lambda item: item[1])
+        summary += (f": total {format_value(total)}, average {format_value(total / len(values))}, "
+                    f"peak {format_value(peak)} on {format_date(peak_date)}")
+    lines = [summary + _listing_note(len(rows), total_rows) + "."]
+    for row in rows[:MAX_LISTED_ROWS]:
+        fields = ", ".join(f"{humanize(c)} {format_value(row[c])}" for c in metrics)
+        lines.append(f"{format_date(row[date_column])}: {fields}")
+    if len(rows) > MAX_LISTED_ROWS:
+        lines.append(f"... {len(rows) - MAX_LISTED_ROWS} more")
+    return "\n".join(lines)
+
+
+def _top_n(rows, total_rows):
+    columns = list(rows[0])
+    numeric = [c for c in columns if all(is_number(row[c]) or row[c] is None for row in rows)]
+    labels = [c for c in columns if c not in numeric]
+    # Without a text column, an id-like first column is the label
+    label = labels[0] if labels else (columns[0] if len(columns) > 1 else None)
+    metrics = [c for c in numeric if c != label]
+    metric = metrics[0]
+
+    count = max(total_rows or 0, len(rows))
+    ordered = [row[metric] for row in rows if row[metric] is not None]
+    if ordered == sorted(ordered, reverse=True):
+        heading = f"Top {count:,} by {humanize(metric)}"
+    elif ordered == sorted(ordered):
+        heading = f"Bottom {count:,} by {humanize(metric)}"
+    else:
+        heading = f"{count:,} results"
+    lines = [heading + _listing_note(len(rows), total_rows) + ":"]
+    for i, row in enumerate(rows[:MAX_LISTED_ROWS], 1):
+        fields = ", ".join(f"{humanize(c)} {format_value(row[c])}" for c in metrics)
+        lines.append(f"{i}. {format_value(row[label])} - {fields}" if label else f"{i}. {fields}")
+    if len(rows) > MAX_LISTED_ROWS:
+        lines.append(f"... {len(rows) - MAX_LISTED_ROWS} more")
+    return "\n".join(lines)
+
+
+def format_locally(rows, total_rows=None):
+    """Templated answer for a recognized result shape, or None"""
+    shape = classify(rows)
+    if shape == "empty":
+        return "No data found for your question."
+    if shape == "scalar":
+        return _scalar(rows)
+    if shape == "single_row":
+        return _single_row(rows)
+    if shape == "time_series":
+        return _time_series(rows, total_rows)
+    if shape == "top_n":
+        return _top_n(rows, total_rows)
+    return None
+
+
+def fallback(rows, total_rows=None):
+    """Plain answer for any shape, used when the LLM is unavailable or not allowed"""
+    answer = format_locally(rows, total_rows)
+    if answer is not None:
+        return answer
+    count = total_rows or len(rows)
+    shown = rows[:MAX_LISTED_ROWS]
+    lines = [f"Found {count:,} results{_listing_note(len(shown), count)}:"]
+    lines.extend("; ".join(f"{humanize(c)}: {format_value(v)}" for c, v in row.items()) for row in shown)
+    return "\n".join(lines)
+
+
+def resolve_policy(requested=None):
+    """Policy for one request: the caller's choice when valid, else FORMAT_POLICY"""
+    if requested in POLICIES:
+        return requested
+    return FORMAT_POLICY if FORMAT_POLICY in POLICIES else "auto"
@@ -0,0 +1,573 @@
+"""
+E-commerce AI Agent - Excel ingestion
+Column-wise type coercion and batched bulk inserts for the data/ workbooks,
+with an ingest manifest so only changed workbooks are re-parsed
+"""
+
+import os
+import sys
+import time
+import hashlib
+import logging
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import workbook_cache
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Source workbooks
+DATA_DIR = "data"
+SALES_FILE = os.path.join(DATA_DIR, "Product-Level Total Sales and Metrics (mapped).xlsx")
+ADS_FILE = os.path.join(DATA_DIR, "Product-Level Ad Sales and Metrics (mapped).xlsx")
+PRODUCTS_FILE = os.path.join(DATA_DIR, "Product-Level Eligibility Table (mapped).xlsx")
+
+# Rows per executemany call
+BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", "5000"))
+
+# "bulk" reads whole sheets (through the columnar cache); "stream" reads
+# read-only row chunks so memory stays flat regardless of file size
+INGEST_MODE = os.environ.get("INGEST_MODE", "bulk")
+CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", "10000"))
+
+# Worker processes used to parse changed workbooks in parallel
+WORKERS = int(os.environ.get("INGEST_WORKERS", str(os.cpu_count() or 1)))
+
+# Used when a workbook has no usable date
+DEFAULT_DATE = "2024-01-01"
+
+
+def _numbers(df, column, dtype):
+    """Coerce a column to numbers, treating missing or invalid values as zero"""
+    if column not in df:
+        return pd.Series(np.zeros(len(df), dtype=dtype), index=df.index)
+    return pd.to_numeric(df[column], errors="coerce").fillna(0).astype(dtype)
+
+
+def _ids(df, column):
+    """Render an identifier column as text ('12', not '12.0')"""
+    if column not in df:
+        return pd.Series("", index=df.index, dtype=object)
+    values = df[column]
+    if pd.api.types.is_float_dtype(values) and (values.dropna() % 1 == 0).all():
+        values = values.astype("Int64")
+    return values.astype(str).where(values.notna(), "").astype(object)
+
+
+def _dates(df, column):
+    """Render a date column as 'YYYY-MM-DD HH:MM:SS' text and YYYYMMDD day keys"""
+    if column not in df:
+        values = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    else:
+        values = pd.to_datetime(df[column], errors="coerce")
+    values = values.fillna(pd.Timestamp(DEFAULT_DATE))
+    text = values.dt.strftime("%Y-%m-%d %H:%M:%S").astype(object)
+    keys = (values.dt.year * 10000 + values.dt.month * 100 + values.dt.day).astype("int64")
+    return text, keys
+
+
+def prepare_sales(df):
+    """Map the total sales workbook onto total_sales_metrics columns"""
+    total_sales = _numbers(df, "total_sales", "float64")
+    dates, date_keys = _dates(df, "date")
+    return pd.DataFrame({
+        "product_id": _ids(df, "item_id"),
+        "total_sales": total_sales,
+        "units_sold": _numbers(df, "total_units_ordered", "int64"),
+        "revenue": total_sales,  # Using total_sales as revenue
+        "date": dates,
+        "date_key": date_keys,
+    })
+
+
+def prepare_ads(df):
+    """Map the ad sales workbook onto ad_sales_metrics columns"""
+    ad_spend = _numbers(df, "ad_spend", "float64")
+    clicks = _numbers(df, "clicks", "int64")
+
+    dates, date_keys = _dates(df, "date")
+
+    # CPC = ad_spend / clicks, zero when there were no clicks
+    cpc = np.divide(ad_spend.to_numpy(), clicks.to_numpy(),
+                    out=np.zeros(len(df)), where=clicks.to_numpy() > 0)
+
+    return pd.DataFrame({
+        "product_id": _ids(df, "item_id"),
+        "ad_spend": ad_spend,
+        "ad_sales": _numbers(df, "ad_sales", "float64"),
+        "clicks": clicks,
+        "impressions": _numbers(df, "impressions", "int64"),
+        "cpc": cpc,
+        "date": dates,
+        "date_key": date_keys,
+    }, index=df.index)
+
+
+def prepare_products(df):
+    """Map the eligibility workbook onto products columns"""
+    product_ids = _ids(df, "item_id")
+    return pd.DataFrame({
+        "product_id": product_ids,
+        "product_name": "Product " + product_ids,
+        "category": "General",
+        "brand": "Unknown",
+        "price": 0.0,
+    })
+
+
+# Workbook name -> source file, target table, column mapping and insert verb
+WORKBOOKS = {
+    "sales": {
+        "path": SALES_FILE,
+        "table": "total_sales_metrics",
+        "prepare": prepare_sales,
+        "verb": "INSERT",
+    },
+    "ads": {
+        "path": ADS_FILE,
+        "table": "ad_sales_metrics",
+        "prepare": prepare_ads,
+        "verb": "INSERT",
+    },
+    "eligibility": {
+        "path": PRODUCTS_FILE,
+        "table": "products",
+        "prepare": prepare_products,
+        "verb": "INSERT OR IGNORE",
+    },
+}
+
+
+def _rows(frame):
+    """Yield row tuples of plain Python values, which sqlite3 can bind"""
+    return zip(*(frame[column].tolist() for column in frame.columns))
+
+
+def bulk_insert(cursor, table, frame, verb="INSERT", log=True):
+    """Insert a prepared frame with batched executemany, returning rows written.
+
+    Rows skipped by INSERT OR IGNORE are not counted.
+    """
+    columns = list(frame.columns)
+    sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    start = time.perf_counter()
+    rows = list(_rows(frame))
+    written = 0
+    for offset in range(0, len(rows), BATCH_SIZE):
+        cursor.executemany(sql, rows[offset:offset + BATCH_SIZE])
+        written += max(cursor.rowcount, 0)
+    elapsed = time.perf_counter() - start
+
+    if log:
+        rate = len(rows) / elapsed if elapsed > 0 else float("inf")
+        logger.info(f"Inserted {written} of {len(rows)} rows into {table} in {elapsed:.3f}s "
+                    f"({rate:,.0f} rows/sec)")
+    return written
+
+
+def iter_workbook_chunks(path, chunk_rows=CHUNK_ROWS):
+    """Yield the first sheet of a workbook as DataFrames of at most chunk_rows rows"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                yield pd.DataFrame(chunk, columns=header)
+                chunk = []
+        if chunk:
+            yield pd.DataFrame(chunk, columns=header)
+    finally:
+        workbook.close()
+
+
+def current_rss_mb():
+    """Resident set size of this process right now in MB, or None where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1 << 20)
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def peak_rss_mb():
+    """Highest resident set size this process ever reached, in MB, or None if unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+class RssWatch:
+    """Resident memory of this process sampled while one workbook is parsed.
+
+    ru_maxrss is the highest RSS the process ever reached, which an earlier,
+    larger workbook may have set; sampling the current RSS at every chunk
+    gives the peak for this file alone.
+    """
+
+    def __init__(self):
+        self.start = current_rss_mb()
+        self.peak = self.start
+
+    def sample(self):
+        rss = current_rss_mb()
+        if rss is not None and rss > self.peak:
+            self.peak = rss
+
+    def report(self):
+        """(RSS at start, peak) in MB, or (None, process-wide peak) where current RSS is unknown"""
+        if self.start is None:
+            return None, peak_rss_mb()
+        self.sample()
+        return self.start, self.peak
+
+
+def file_fingerprint(path):
+    """Size, modification time and SHA-256 of a source file"""
+    stat = os.stat(path)
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "sha256": digest.hexdigest()}
+
+
+def _row_hashes(frame):
+    """One uint64 hash per prepared row"""
+    return pd.util.hash_pandas_object(frame, index=False).to_numpy()
+
+
+def rows_digest(frame):
+    """Order-sensitive hash of prepared rows, used to detect append-only changes"""
+    return hashlib.sha256(_row_hashes(frame).tobytes()).hexdigest()
+
+
+def _manifest_entry(cursor, name):
+    """Return the manifest row for a workbook, or None if it was never loaded"""
+    cursor.execute("""
+    SELECT size, mtime, sha256, rows_loaded, rows_hash
+    FROM ingest_manifest WHERE workbook = ?
+    """, (name,))
+    row = cursor.fetchone()
+    if row is None:
+        return None
+    return dict(zip(("size", "mtime", "sha256", "rows_loaded", "rows_hash"), row))
+
+
+def _record_manifest(cursor, name, path, fingerprint, rows_loaded, rows_hash):
+    """Upsert the manifest row for a workbook"""
+    cursor.execute("""
+    INSERT OR REPLACE INTO ingest_manifest
+    (workbook, path, size, mtime, sha256, rows_loaded, rows_hash, loaded_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        name, path, fingerprint["size"], fingerprint["mtime"], fingerprint["sha256"],
+        rows_loaded, rows_hash, datetime.now().isoformat(timespec="seconds")
+    ))
+
+
+def _bulk_batches(name, spec, entry, sha256):
+    """Read the whole sheet (through the cache) and yield it as one batch.
+
+    Like every batch producer this yields ("begin", action), then
+    ("rows", frame) messages, then ("end", (total_rows, rows_hash, rss)) with
+    rss from RssWatch.report.
+    """
+    watch = RssWatch()
+    start = time.perf_counter()
+    df = workbook_cache.read_workbook(name, spec["path"], sha256)
+    logger.info(f"Read {name} workbook: {len(df)} rows, columns: {list(df.columns)} "
+                f"in {time.perf_counter() - start:.3f}s")
+    frame = spec["prepare"](df)
+    watch.sample()
+
+    previous = entry["rows_loaded"] if entry else 0
+    appended = (
+        entry is not None
+        and len(frame) >= previous
+        and rows_digest(frame.iloc[:previous]) == entry["rows_hash"]
+    )
+    if appended:
+        yield "begin", "appended"
+        yield "rows", frame.iloc[previous:]
+    else:
+        yield "begin", "reloaded"
+        yield "rows", frame
+    yield "end", (len(frame), rows_digest(frame), watch.report())
+
+
+def _stream_batches(name, spec, entry):
+    """Yield read-only row chunks of the sheet as they are parsed.
+
+    When the workbook was loaded before, the first pass hashes the previously
+    loaded rows and, if they are unchanged, yields only what follows them.
+    Otherwise the file is streamed again from the top as a reload.
+    """
+    watch = RssWatch()
+    if entry is not None:
+        previous = entry["rows_loaded"]
+        digest = hashlib.sha256()
+        seen = 0
+        prefix_ok = previous == 0 and digest.hexdigest() == entry["rows_hash"]
+        if prefix_ok:
+            yield "begin", "appended"
+        for chunk in iter_workbook_chunks(spec["path"]):
+            frame = spec["prepare"](chunk)
+            watch.sample()
+            hashes = _row_hashes(frame)
+            if not prefix_ok:
+                take = min(previous - seen, len(frame))
+                digest.update(hashes[:take].tobytes())
+                seen += take
+                if seen < previous:
+                    continue
+                prefix_ok = digest.hexdigest() == entry["rows_hash"]
+                if not prefix_ok:
+                    break
+                yield "begin", "appended"
+                frame, hashes = frame.iloc[take:], hashes[take:]
+            digest.update(hashes.tobytes())
+            seen += len(frame)
+            yield "rows", frame
+        if prefix_ok:
+            yield "end", (seen, digest.hexdigest(), watch.report())
+            return
+        logger.info(f"Workbook {name} changed before row {previous}, reloading")
+
+    yield "begin", "reloaded"
+    digest = hashlib.sha256()
+    total = 0
+    for chunk in iter_workbook_chunks(spec["path"]):
+        frame = spec["prepare"](chunk)
+        watch.sample()
+        digest.update(_row_hashes(frame).tobytes())
+        total += len(frame)
+        yield "rows", frame
+    yield "end", (total, digest.hexdigest(), watch.report())
+
+
+def _batches(name, mode, entry, sha256):
+    """Batch producer for a workbook in the given mode"""
+    spec = WORKBOOKS[name]
+    if mode == "stream":
+        return _stream_batches(name, spec, entry)
+    return _bulk_batches(name, spec, entry, sha256)
+
+
+def _plan(cursor, name, force):
+    """Decide whether a workbook needs parsing.
+
+    Returns (summary, None) when there is nothing to parse, otherwise
+    (None, (entry, fingerprint)).
+    """
+    path = WORKBOOKS[name]["path"]
+    if not os.path.exists(path):
+        logger.warning(f"Skipping {name}: {path} not found")
+        return {"action": "missing", "rows": 0}, None
+
+    entry = None if force else _manifest_entry(cursor, name)
+    stat = os.stat(path)
+    if entry and entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime:
+        return {"action": "unchanged", "rows": 0}, None
+
+    fingerprint = file_fingerprint(path)
+    if entry and entry["sha256"] == fingerprint["sha256"]:
+        # Touched but not modified: remember the new mtime so we skip hashing next time
+        _record_manifest(cursor, name, path, fingerprint, entry["rows_loaded"], entry["rows_hash"])
+        cursor.connection.commit()
+        return {"action": "unchanged", "rows": 0}, None
+
+    return None, (entry, fingerprint)
+
+
+def _apply(cursor, name, kind, payload, state):
+    """Writer side: apply one batch message for a workbook to the database"""
+    spec = WORKBOOKS[name]
+    if kind == "begin":
+        state["action"] = payload
+        if payload == "reloaded":
+            cursor.execute(f"DELETE FROM {spec['table']}")
+    elif kind == "rows":
+        state["rows"] += bulk_insert(cursor, spec["table"], payload, spec["verb"], log=False)
+    elif kind == "end":
+        total_rows, rows_hash, state["rss"] = payload
+        _record_manifest(cursor, name, spec["path"], state["fingerprint"], total_rows, rows_hash)
+
+
+def _log_sync(name, mode, state):
+    """Log throughput and parsing memory for one synced workbook"""
+    elapsed = time.perf_counter() - state["start"]
+    rate = state["rows"] / elapsed if elapsed > 0 else float("inf")
+    start, peak = state.get("rss", (None, None))
+    if start is not None:
+        memory = f"peak RSS {peak:.1f} MB while parsing (+{peak - start:.1f} MB)"
+    elif peak is not None:
+        memory = f"process peak RSS {peak:.1f} MB"
+    else:
+        memory = "RSS unknown"
+    logger.info(f"Workbook {name} {state['action']} ({mode}): {state['rows']} rows applied "
+                f"in {elapsed:.3f}s ({rate:,.0f} rows/sec), {memory}")
+
+
+def _check_mode(mode):
+    """Resolve the ingest mode, defaulting to INGEST_MODE"""
+    mode = mode or INGEST_MODE
+    if mode not in ("bulk", "stream"):
+        raise ValueError(f"Unknown ingest mode: {mode}. Expected 'bulk' or 'stream'")
+    return mode
+
+
+def sync_workbook(cursor, name, force=False, mode=None):
+    """Bring one table up to date with its workbook.
+
+    Unchanged files (same size and mtime, or same content hash) are skipped
+    without parsing. If the previously loaded rows are an unchanged prefix of
+    the new file only the new rows are inserted; otherwise the table is
+    reloaded. Returns a summary dict with the action taken.
+    """
+    mode = _check_mode(mode)
+    summary, work = _plan(cursor, name, force)
+    if summary is not None:
+        return summary
+    return _sync_serial(cursor, name, mode, *work)
+
+
+def _sync_serial(cursor, name, mode, entry, fingerprint):
+    """Parse and write one workbook in this process, committing at the end"""
+    state = {"fingerprint": fingerprint, "rows": 0, "start": time.perf_counter()}
+    for kind, payload in _batches(name, mode, entry, fingerprint["sha256"]):
+        _apply(cursor, name, kind, payload, state)
+    cursor.connection.commit()
+
+    _log_sync(name, mode, state)
+    return {"action": state["action"], "rows": state["rows"]}
+
+
+# Parallel ingestion: worker processes parse and prepare workbooks and put
+# batch messages on a bounded queue; this process is the only writer.
+_worker_queue = None
+_worker_cancel = None
+
+
+def _init_worker(queue, cancel):
+    """Process pool initializer, handing each worker the batch queue and cancel flag"""
+    global _worker_queue, _worker_cancel
+    _worker_queue, _worker_cancel = queue, cancel
+    # The writer has consumed every batch before it shuts the pool down, and on
+    # failure unsent batches are not wanted, so never block exit on flushing them
+    queue.cancel_join_thread()
+
+
+def _produce(name, mode, entry, sha256):
+    """Worker task: parse one workbook and send its batches to the writer"""
+    try:
+        for kind, payload in _batches(name, mode, entry, sha256):
+            if _worker_cancel.is_set():
+                return
+            _worker_queue.put((name, kind, payload))
+    except Exception as e:
+        _worker_queue.put((name, "error", f"{type(e).__name__}: {e}"))
+
+
+def _sync_parallel(cursor, work, mode, workers):
+    """Parse workbooks in a process pool while this process writes every batch.
+
+    All workbooks are applied in one transaction, so a failure in any worker
+    leaves the database as it was. Each workbook is parsed by a single worker:
+    an .xlsx sheet can only be read from its first row, so splitting one file
+    across workers would parse it repeatedly, and a run is never faster than
+    its largest workbook.
+    """
+    import multiprocessing
+    from queue import Empty
+    from concurrent.futures import ProcessPoolExecutor
+
+    # Spawned, not forked: the server's background threads (startup, pool
+    # connections) may hold locks that a forked child would inherit held
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue(maxsize=2 * workers)
+    cancel = context.Event()
+    states = {
+        name: {"fingerprint": fingerprint, "rows": 0, "start": time.perf_counter()}
+        for name, (entry, fingerprint) in work.items()
+    }
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(queue, cancel)) as pool:
+        futures = [
+            pool.submit(_produce, name, mode, entry, fingerprint["sha256"])
+            for name, (entry, fingerprint) in work.items()
+        ]
+        try:
+            remaining = set(work)
+            while remaining:
+                try:
+                    name, kind, payload = queue.get(timeout=1)
+                except Empty:
+                    # Surface worker processes that died without reporting
+                    for future in futures:
+                        if future.done() and future.exception():
+                            raise future.exception()
+                    continue
+                if kind == "error":
+                    raise RuntimeError(f"Parsing {name} failed: {payload}")
+                _apply(cursor, name, kind, payload, states[name])
+                if kind == "end":
+                    remaining.discard(name)
+                    _log_sync(name, mode, states[name])
+            cursor.connection.commit()
+        except Exception:
+            cursor.connection.rollback()
+            cancel.set()
+            for future in futures:
+                future.cancel()
+            raise
+
+    return {name: {"action": state["action"], "rows": state["rows"]} for name, state in states.items()}
+
+
+def sync_workbooks(cursor, names=None, force=False, mode=None, workers=None):
+    """Sync the given workbooks (default: all), returning a summary per workbook.
+
+    With more than one changed workbook and more than one worker, parsing
+    runs in a process pool (INGEST_WORKERS, default: CPU count).
+    """
+    mode = _check_mode(mode)
+    names = list(WORKBOOKS) if names is None else names
+    unknown = [name for name in names if name not in WORKBOOKS]
+    if unknown:
+        raise ValueError(f"Unknown workbooks: {unknown}. Expected some of {list(WORKBOOKS)}")
+
+    summary = {}
+    work = {}
+    for name in names:
+        summary[name], planned = _plan(cursor, name, force)
+        if planned is not None:
+            work[name] = planned
+
+    workers = min(workers or WORKERS, len(work))
+    if workers > 1:
+        start = time.perf_counter()
+        summary.update(_sync_parallel(cursor, work, mode, workers))
+        logger.info(f"Parallel ingest of {len(work)} workbooks with {workers} workers "
+                    f"took {time.perf_counter() - start:.3f}s")
+    else:
+        for name, (entry, fingerprint) in work.items():
+            summary[name] = _sync_serial(cursor, name, mode, entry, fingerprint)
+    return summary
@@ -0,0 +1,319 @@
+"""
+E-commerce AI Agent - LLM client
+One shared, warmed-up client in front of a pluggable model backend, plus a
+deterministic fake backend for offline load tests and benchmarks
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import asyncio
+import logging
+import threading
+
+import metrics
+from cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+# Backend name (see BACKENDS) and model
+LLM_BACKEND = os.environ.get("LLM_BACKEND", "gemini")
+LLM_MODEL = os.environ.get("LLM_MODEL", "gemini-1.5-flash")
+
+# Fake backend: simulated latency, and a JSON file of canned question -> SQL mappings
+FAKE_LLM_LATENCY_MS = float(os.environ.get("FAKE_LLM_LATENCY_MS", "0"))
+FAKE_LLM_JITTER_MS = float(os.environ.get("FAKE_LLM_JITTER_MS", "0"))
+FAKE_LLM_MAPPINGS = os.environ.get("FAKE_LLM_MAPPINGS", "")
+
+# Characters per token, for estimating prompt sizes without a tokenizer
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """Rough token count of a prompt"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+class Backend:
+    """Interface for model providers: turn a prompt into reply text"""
+
+    name = "base"
+
+    def generate(self, prompt):
+        raise NotImplementedError
+
+    async def generate_async(self, prompt):
+        """Async generation; backends without a native async API use a thread"""
+        return await asyncio.to_thread(self.generate, prompt)
+
+    def stream(self, prompt):
+        """Yield reply text in chunks as it is produced; by default all at once"""
+        yield self.generate(prompt)
+
+    async def stream_async(self, prompt):
+        """Async streaming; backends without a native async API read stream() on a thread"""
+        chunks = self.stream(prompt)
+        while True:
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def warm_up(self):
+        """Prepare connections ahead of the first request; False when skipped"""
+        return True
+
+
+class GeminiBackend(Backend):
+    """Google Gemini through google-generativeai, with one long-lived model object"""
+
+    name = "gemini"
+
+    def __init__(self, model=LLM_MODEL, api_key=None):
+        import google.generativeai as genai
+        self.api_key = api_key or os.environ.get("GEMINI_API_KEY")
+        genai.configure(api_key=self.api_key)
+        self.model = genai.GenerativeModel(model)
+
+    def generate(self, prompt):
+        return self.model.generate_content(prompt).text
+
+    async def generate_async(self, prompt):
+        return (await self.model.generate_content_async(prompt)).text
+
+    def stream(self, prompt):
+        for chunk in self.model.generate_content(prompt, stream=True):
+            yield chunk.text
+
+    async def stream_async(self, prompt):
+        async for chunk in await self.model.generate_content_async(prompt, stream=True):
+            yield chunk.text
+
+    def warm_up(self):
+        """Open the API channel with a token count, which costs no generation quota"""
+        if not self.api_key:
+            logger.warning("GEMINI_API_KEY not set; skipping LLM warm-up")
+            return False
+        self.model.count_tokens("warm-up", request_options={"timeout": 5})
+        return True
+
+
+# Canned translations used by the fake backend when no mappings file is given
+DEFAULT_FAKE_MAPPINGS = {
+    "top 5 products by sales": "SELECT product_id, SUM(total_sales) AS total_sales FROM total_sales_metrics "
+                               "GROUP BY product_id ORDER BY total_sales DESC LIMIT 5",
+    "daily sales": "SELECT date_key, SUM(total_sales) AS total_sales FROM total_sales_metrics "
+                   "GROUP BY date_key ORDER BY date_key",
+    "ad spend by product": "SELECT product_id, SUM(ad_spend) AS ad_spend FROM ad_sales_metrics "
+                           "GROUP BY product_id ORDER BY ad_spend DESC",
+    "average cpc": "SELECT SUM(ad_spend) / SUM(clicks) AS avg_cpc FROM ad_sales_metrics WHERE clicks > 0",
+    "click through rate by product": "SELECT product_id, 1.0 * SUM(clicks) / SUM(impressions) AS ctr "
+                                     "FROM ad_sales_metrics GROUP BY product_id HAVING SUM(impressions) > 0 "
+                                     "ORDER BY ctr DESC",
+    "units sold": "SELECT SUM(units_sold) AS units_sold FROM total_sales_metrics",
+}
+
+FAKE_DEFAULT_SQL = "SELECT COUNT(*) AS products FROM products"
+
+
+class FakeBackend(Backend):
+    """Deterministic stand-in: canned SQL for translation prompts, templated text otherwise.
+
+    Latency is latency_ms plus a jitter derived from the prompt, so the same
+    prompt always takes the same time.
+    """
+
+    name = "fake"
+
+    def __init__(self, mappings=None, latency_ms=FAKE_LLM_LATENCY_MS, jitter_ms=FAKE_LLM_JITTER_MS,
+                 default_sql=FAKE_DEFAULT_SQL):
+        if mappings is None and FAKE_LLM_MAPPINGS:
+            with open(FAKE_LLM_MAPPINGS) as f:
+                mappings = json.load(f)
+        self.mappings = {normalize_question(q): sql for q, sql in (mappings or DEFAULT_FAKE_MAPPINGS).items()}
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.default_sql = default_sql
+
+    def delay(self, prompt):
+        """Simulated seconds for a prompt"""
+        jitter = 0.0
+        if self.jitter_ms:
+            jitter = (zlib.crc32(prompt.encode("utf-8")) % 2001 - 1000) / 1000 * self.jitter_ms
+        return max(0.0, self.latency_ms + jitter) / 1000
+
+    def translation(self, question):
+        """Canned {"sql", "explanation"} for a question"""
+        sql = self.mappings.get(normalize_question(question), self.default_sql)
+        if isinstance(sql, dict):
+            return sql
+        return {"sql": sql, "explanation": f"Canned translation for: {question}"}
+
+    def reply(self, prompt):
+        """Reply text for a prompt, without the delay"""
+        # Batch prompts number their questions and expect a JSON array back
+        numbered = [q.strip() for q in re.findall(r"^\s*Question \d+: (.*)$", prompt, re.MULTILINE)]
+        if numbered:
+            if "SQLite query" in prompt:
+                return json.dumps([self.translation(q) for q in numbered])
+            return json.dumps([f"Here is the answer to: {q}" for q in numbered])
+
+        match = re.search(r"^\s*Question: (.*)$", prompt, re.MULTILINE)
+        question = match.group(1).strip() if match else ""
+        if "SQLite query" in prompt:
+            return json.dumps(self.translation(question))
+        return f"Here is the answer to: {question}"
+
+    def generate(self, prompt):
+        time.sleep(self.delay(prompt))
+        return self.reply(prompt)
+
+    async def generate_async(self, prompt):
+        await asyncio.sleep(self.delay(prompt))
+        return self.reply(prompt)
+
+    def stream(self, prompt):
+        """The reply word by word, the first word after the simulated latency"""
+        time.sleep(self.delay(prompt))
+        yield from re.findall(r"\S+\s*", self.reply(prompt))
+
+    async def stream_async(self, prompt):
+        await asyncio.sleep(self.delay(prompt))
+        for word in re.findall(r"\S+\s*", self.reply(prompt)):
+            yield word
+
+
+# Backend name -> factory; register_backend adds more providers
+BACKENDS = {
+    "gemini": GeminiBackend,
+    "fake": FakeBackend,
+}
+
+
+def register_backend(name, factory):
+    """Make a backend available under LLM_BACKEND=name"""
+    BACKENDS[name] = factory
+
+
+class LLMClient:
+    """Shared entry point for model calls, with call statistics"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.prompt_tokens = 0
+        self.max_prompt_tokens = 0
+        self.warm_up_seconds = None
+        self._lock = threading.Lock()
+
+    def _measure(self, prompt):
+        """Log and count the estimated size of a prompt"""
+        tokens = estimate_tokens(prompt)
+        logger.info(f"LLM prompt: {len(prompt)} chars, ~{tokens} tokens")
+        with self._lock:
+            self.prompt_tokens += tokens
+            self.max_prompt_tokens = max(self.max_prompt_tokens, tokens)
+
+    def _record(self, started, failed):
+        seconds = time.perf_counter() - started
+        metrics.observe_stage("llm", seconds)
+        with self._lock:
+            self.calls += 1
+            self.errors += failed
+            self.seconds += seconds
+
+    def generate(self, prompt):
+        """Reply text for a prompt"""
+        self._measure(prompt)
+        started = time.perf_counter()
+        try:
+            text = self.backend.generate(prompt)
+        except Exception:
+            self._record(started, True)
+            raise
+        self._record(started, False)
+        return text
+
+    async def generate_async(self, prompt):
+        """Reply text for a prompt, without blocking the event loop"""
+        self._measure(prompt)
+        started = time.perf_counter()
+        try:
+            text = await self.backend.generate_async(prompt)
+        except Exception:
+            self._record(started, True)
+            raise
+        self._record(started, False)
+        return text
+
+    def stream(self, prompt):
+        """Reply text chunks for a prompt as the backend produces them"""
+        self._measure(prompt)
+        started = time.perf_counter()
+        try:
+            yield from self.backend.stream(prompt)
+        except Exception:
+            self._record(started, True)
+            raise
+        self._record(started, False)
+
+    async def stream_async(self, prompt):
+        """Reply text chunks for a prompt, without blocking the event loop"""
+        self._measure(prompt)
+        started = time.perf_counter()
+        try:
+            async for chunk in self.backend.stream_async(prompt):
+                yield chunk
+        except Exception:
+            self._record(started, True)
+            raise
+        self._record(started, False)
+
+    def warm_up(self):
+        """Warm the backend up; failures are logged, not raised"""
+        started = time.perf_counter()
+        try:
+            if self.backend.warm_up() is False:
+                return
+            self.warm_up_seconds = time.perf_counter() - started
+            logger.info(f"LLM backend '{self.backend.name}' warmed up in {self.warm_up_seconds * 1000:.0f} ms")
+        except Exception as e:
+            logger.warning(f"LLM warm-up failed: {e}")
+
+    def stats(self):
+        """Backend name, call counts, mean latency and prompt sizes"""
+        return {
+            "backend": self.backend.name,
+            "calls": self.calls,
+            "errors": self.errors,
+            "mean_ms": round(self.seconds / self.calls * 1000, 2) if self.calls else 0.0,
+            "mean_prompt_tokens": round(self.prompt_tokens / self.calls) if self.calls else 0,
+            "max_prompt_tokens": self.max_prompt_tokens,
+            "warm_up_ms": round(self.warm_up_seconds * 1000, 2) if self.warm_up_seconds is not None else None,
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """The process-wide client for LLM_BACKEND, created on first use"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            if LLM_BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown LLM_BACKEND '{LLM_BACKEND}'; choose from {', '.join(BACKENDS)}")
+            _client = LLMClient(BACKENDS[LLM_BACKEND]())
+        return _client
+
+
+def set_client(client):
+    """Replace the shared client, e.g. with a fake backend in benchmarks"""
+    global _client
+    with _client_lock:
+        _client = client
@@ -0,0 +1,138 @@
+"""
+E-commerce AI Agent - In-process metrics
+Stage latency and row count histograms, Server-Timing headers for the
+current request, and Prometheus text exposition without an external collector
+"""
+
+import time
+import asyncio
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Histogram bucket upper bounds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+ROW_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+PREFIX = "ecommerce"
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label value"""
+
+    def __init__(self, name, help_text, label, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label = label
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value, value):
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self):
+        """Prometheus text lines"""
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_value, series in sorted(self._series.items()):
+                label = f'{self.label}="{label_value}"'
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["counts"]):
+                    cumulative += count
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{label}}} {series['sum']}")
+                lines.append(f"{self.name}_count{{{label}}} {series['count']}")
+        return lines
+
+
+stage_seconds = Histogram(f"{PREFIX}_stage_seconds", "Time spent in each question-answering stage",
+                          "stage", LATENCY_BUCKETS)
+request_seconds = Histogram(f"{PREFIX}_request_seconds", "Time to response headers per endpoint",
+                            "endpoint", LATENCY_BUCKETS)
+rows_returned = Histogram(f"{PREFIX}_rows_returned", "Rows produced by answered queries",
+                          "source", ROW_BUCKETS)
+
+# (stage, seconds) pairs recorded during the current request
+_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+def begin_request():
+    """Start collecting stage timings for the request running in this context"""
+    _timings.set([])
+
+
+def observe_stage(stage, seconds):
+    """Record a stage duration in the histogram and the current request's timings"""
+    stage_seconds.observe(stage, seconds)
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((stage, seconds))
+
+
+@contextmanager
+def stage(name):
+    """Time a block as a stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorator timing every call of a function (or coroutine function) as a stage"""
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def server_timing(total=None):
+    """Server-Timing header value for the current request, summing repeated stages"""
+    totals = {}
+    for name, seconds in _timings.get() or []:
+        totals[name] = totals.get(name, 0.0) + seconds
+    if total is not None:
+        totals["total"] = total
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+
+def _flatten(prefix, values):
+    """Numeric leaves of a nested stats dict as (metric name, value) pairs"""
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
+
+
+def render(component_stats=None):
+    """Prometheus text exposition of the histograms plus component statistics as gauges"""
+    lines = stage_seconds.render() + request_seconds.render() + rows_returned.render()
+    for name, value in _flatten(PREFIX, component_stats or {}):
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,191 @@
+"""
+E-commerce AI Agent - Query result handles
+Cursor-style pagination over query results; large results spill to a
+temporary NDJSON file so memory per request stays bounded
+"""
+
+import os
+import json
+import time
+import uuid
+import atexit
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Rows per page when the caller does not ask for a size, and the largest page allowed
+PAGE_SIZE = int(os.environ.get("RESULT_PAGE_SIZE", "100"))
+MAX_PAGE_SIZE = int(os.environ.get("RESULT_MAX_PAGE_SIZE", "1000"))
+
+# Results with more rows than this are written to a temporary file
+SPILL_ROWS = int(os.environ.get("RESULT_SPILL_ROWS", "1000"))
+
+# Most rows a paged result handle may hold; larger results spill to disk,
+# so this can be far above QUERY_MAX_ROWS (0 disables the limit)
+MAX_ROWS = int(os.environ.get("RESULT_MAX_ROWS", "1000000"))
+
+# NDJSON streams may run past the query limits: rows sent and total duration,
+# including the time the client takes to read them (0 disables a limit)
+STREAM_MAX_ROWS = int(os.environ.get("RESULT_STREAM_MAX_ROWS", "1000000"))
+STREAM_TIMEOUT_MS = int(os.environ.get("RESULT_STREAM_TIMEOUT_MS", "60000"))
+
+# How long handles live, and how many are kept at once
+TTL_SECONDS = int(os.environ.get("RESULT_TTL_SECONDS", "600"))
+MAX_HANDLES = int(os.environ.get("RESULT_MAX_HANDLES", "200"))
+
+# Byte offset of every Nth spilled row is kept to seek to pages quickly
+INDEX_STRIDE = 100
+
+
+def encode_row(row):
+    """Serialize a row as one NDJSON line"""
+    return json.dumps(row, default=str) + "\n"
+
+
+def page_size_from(value):
+    """Validate a requested page size, falling back to PAGE_SIZE"""
+    if value in (None, ""):
+        return PAGE_SIZE
+    size = int(value)
+    if size < 1:
+        raise ValueError("page_size must be at least 1")
+    return min(size, MAX_PAGE_SIZE)
+
+
+class ResultStore:
+    """Short-lived result handles with page tokens.
+
+    Rows stay in memory up to SPILL_ROWS; beyond that the whole result is
+    written to a temporary file and pages are read back from disk.
+    """
+
+    def __init__(self, ttl=TTL_SECONDS, max_handles=MAX_HANDLES):
+        self.ttl = ttl
+        self.max_handles = max_handles
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        atexit.register(self.clear)
+
+    def create(self, batches):
+        """Consume batches of dict rows into a new handle, returning its id"""
+        entry = {"rows": [], "path": None, "offsets": [], "total": 0, "created": time.monotonic()}
+        spill = None
+        try:
+            for batch in batches:
+                if spill is None and entry["total"] + len(batch) > SPILL_ROWS:
+                    spill = tempfile.NamedTemporaryFile("wb", prefix="result-", suffix=".ndjson", delete=False)
+                    entry["path"] = spill.name
+                    buffered, entry["rows"], entry["total"] = entry["rows"], None, 0
+                    self._write_rows(spill, entry, buffered)
+                if spill is not None:
+                    self._write_rows(spill, entry, batch)
+                else:
+                    entry["rows"].extend(batch)
+                    entry["total"] += len(batch)
+            if spill is not None:
+                spill.close()
+                logger.info(f"Spilled {entry['total']} result rows to {entry['path']}")
+        except BaseException:
+            if spill is not None:
+                spill.close()
+                os.unlink(spill.name)
+            raise
+
+        result_id = uuid.uuid4().hex
+        with self._lock:
+            self._results[result_id] = entry
+            expired = self._evict()
+        self._discard(expired)
+        return result_id
+
+    @staticmethod
+    def _write_rows(spill, entry, rows):
+        for row in rows:
+            if entry["total"] % INDEX_STRIDE == 0:
+                entry["offsets"].append(spill.tell())
+            spill.write(encode_row(row).encode("utf-8"))
+            entry["total"] += 1
+
+    def page(self, result_id, page_token=None, page_size=PAGE_SIZE):
+        """Return one page of a result: rows, next_page_token and total_rows.
+
+        Raises KeyError for unknown or expired handles and ValueError for a
+        malformed page token.
+        """
+        with self._lock:
+            expired = self._evict()
+            entry = self._results.get(result_id)
+        self._discard(expired)
+        if entry is None:
+            raise KeyError(result_id)
+
+        try:
+            start = int(page_token) if page_token else 0
+        except ValueError:
+            start = -1
+        if start < 0 or start > entry["total"]:
+            raise ValueError(f"Invalid page token: {page_token}")
+        end = min(start + page_size, entry["total"])
+
+        if entry["path"] is None:
+            rows = entry["rows"][start:end]
+        else:
+            try:
+                rows = self._read_spilled(entry, start, end)
+            except FileNotFoundError:
+                # Evicted by another request after the lookup above
+                raise KeyError(result_id)
+
+        return {
+            "result_id": result_id,
+            "rows": rows,
+            "next_page_token": str(end) if end < entry["total"] else None,
+            "total_rows": entry["total"],
+        }
+
+    @staticmethod
+    def _read_spilled(entry, start, end):
+        rows = []
+        with open(entry["path"], "rb") as f:
+            f.seek(entry["offsets"][start // INDEX_STRIDE])
+            for _ in range(start % INDEX_STRIDE):
+                f.readline()
+            for _ in range(end - start):
+                rows.append(json.loads(f.readline()))
+        return rows
+
+    def _evict(self):
+        """Drop expired handles and the oldest ones over capacity (lock held)"""
+        now = time.monotonic()
+        expired = []
+        while self._results:
+            result_id, entry = next(iter(self._results.items()))
+            if now - entry["created"] <= self.ttl and len(self._results) <= self.max_handles:
+                break
+            expired.append(self._results.pop(result_id))
+        return expired
+
+    @staticmethod
+    def _discard(entries):
+        for entry in entries:
+            if entry["path"]:
+                try:
+                    os.unlink(entry["path"])
+                except OSError:
+                    pass
+
+    def clear(self):
+        """Drop every handle and delete spilled files"""
+        with self._lock:
+            entries = list(self._results.values())
+            self._results.clear()
+        self._discard(entries)
+
+    def stats(self):
+        """Number of live handles and how many of them are on disk"""
+        with self._lock:
+            spilled = sum(1 for entry in self._results.values() if entry["path"])
+            return {"handles": len(self._results), "spilled": spilled}
@@ -0,0 +1,275 @@
+"""
+E-commerce AI Agent - Query plan inspection
+EXPLAIN QUERY PLAN for generated SQL before it runs, a cost estimate from
+the plan and sqlite_stat1, a policy hook that can refuse costly plans, and a
+persistent log of slow or costly queries
+"""
+
+import os
+import re
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from contextlib import contextmanager
+
+import db
+from cache import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+# Plans estimated to visit more rows than this trigger QUERY_PLAN_ACTION; 0 disables
+MAX_COST = int(os.environ.get("QUERY_PLAN_MAX_COST", "10000000"))
+
+# reprompt: ask the model for a cheaper query; reject: refuse it; log: run it anyway
+ACTION = os.environ.get("QUERY_PLAN_ACTION", "reprompt")
+ACTIONS = ("reprompt", "reject", "log")
+
+# Queries slower than this, or estimated above LOG_MIN_COST rows, go to slow_query_log
+SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", "200"))
+LOG_MIN_COST = int(os.environ.get("SLOW_QUERY_MIN_COST", "100000"))
+
+# Rows assumed per lookup when an index has no statistics (e.g. automatic indexes)
+DEFAULT_ROWS_PER_KEY = 10
+
+# FROM t, JOIN t and comma-joined ", t", each with an optional alias
+_TABLE_REFERENCE = re.compile(r"(?:\bFROM|\bJOIN|,)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_SQL_KEYWORDS = {"select", "from", "where", "join", "inner", "left", "cross", "natural", "on", "using",
+                 "group", "order", "limit", "union", "having", "window", "except", "intersect"}
+
+
+class PlanTooExpensive(db.QueryTooExpensive):
+    """Raised before running a query whose plan the policy refused"""
+
+    def __init__(self, summary, action):
+        super().__init__("plan_cost", MAX_COST,
+                         f"Query plan is estimated to visit {summary['cost']:,} rows; "
+                         f"try a rollup table or filtering on product_id or date_key")
+        self.summary = summary
+        self.action = action
+
+    def to_dict(self):
+        return dict(super().to_dict(), plan=self.summary)
+
+
+def default_policy(summary):
+    """QUERY_PLAN_ACTION for plans above QUERY_PLAN_MAX_COST, otherwise None"""
+    if MAX_COST and summary["cost"] > MAX_COST:
+        return ACTION if ACTION in ACTIONS else "reprompt"
+    return None
+
+
+def _aliases(sql):
+    """Alias (or table name) -> table name for the tables a statement reads"""
+    aliases = {}
+    for table, alias in _TABLE_REFERENCE.findall(sql):
+        aliases[table] = table
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+class PlanInspector:
+    """Explains queries before they run and keeps the slow-query log.
+
+    policy(summary) returns None to run a query, or "reprompt", "reject" or
+    "log"; replace it to plug in other rules.
+    """
+
+    def __init__(self, path=None, policy=default_policy):
+        self.path = path or db.DB_PATH
+        self.policy = policy
+        self.checked = 0
+        self.refused = 0
+        self.logged = 0
+        self.reprompts = 0
+        self._stats = None
+        self._stats_version = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _table_stats(self, conn, version=None):
+        """Table row counts and per-index rows-per-key from sqlite_stat1, reloaded per data version"""
+        if self._stats is not None and version == self._stats_version:
+            return self._stats
+        tables, indexes = {}, {}
+        try:
+            for table, index, stat in conn.execute("SELECT tbl, idx, stat FROM sqlite_stat1"):
+                numbers = [int(n) for n in stat.split() if n.isdigit()]
+                if numbers:
+                    tables[table] = numbers[0]
+                    if index:
+                        indexes[index] = numbers
+        except sqlite3.OperationalError:
+            pass  # Not analyzed yet
+        self._stats, self._stats_version = (tables, indexes), version
+        return self._stats
+
+    def _table_rows(self, conn, table, tables):
+        """Row count of a table, or None when it is not a table (e.g. a CTE)"""
+        if table not in tables:
+            try:
+                # MAX(rowid) is a cheap upper bound for tables ANALYZE has not seen
+                tables[table] = conn.execute(f'SELECT COALESCE(MAX(rowid), 0) FROM "{table}"').fetchone()[0]
+            except sqlite3.Error:
+                tables[table] = None
+        return tables[table]
+
+    def _loop_rows(self, conn, detail, aliases, materialized, stats):
+        """Estimated rows one SCAN or SEARCH step visits per execution"""
+        tables, indexes = stats
+        name = detail.split()[1]
+        if name in materialized:
+            return materialized[name]
+        rows = self._table_rows(conn, aliases.get(name, name), tables)
+        if rows is None:
+            return 1
+        if detail.startswith("SCAN"):
+            return rows
+        if "PRIMARY KEY" in detail or "(rowid=" in detail:
+            return 1
+        constraint = re.search(r"\((.*)\)\s*$", detail)
+        terms = constraint.group(1).split(" AND ") if constraint else []
+        equal = sum(1 for term in terms if term.endswith("=?") and not term.endswith((">=?", "<=?")))
+        index = re.search(r"INDEX (\w+)", detail)
+        numbers = indexes.get(index.group(1)) if index else None
+        if equal and numbers and equal < len(numbers):
+            estimate = numbers[equal]
+        elif equal:
+            estimate = DEFAULT_ROWS_PER_KEY
+        else:
+            estimate = rows
+        # A range on the next index column is assumed to keep a quarter of the rows
+        if len(terms) > equal:
+            estimate = max(1, estimate // 4)
+        return estimate
+
+    def explain(self, conn, sql, params=(), version=None):
+        """Plan summary: steps, full scans, temporary B-trees and estimated rows visited"""
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        stats = self._table_stats(conn, version)
+        aliases = _aliases(sql)
+        children = {}
+        for node_id, parent, _, detail in plan:
+            children.setdefault(parent, []).append((node_id, detail))
+        materialized = {}
+
+        def subtree_cost(parent):
+            # Sibling SCAN/SEARCH steps are nested loops: each runs once per outer row
+            cost, loop = 0, 1
+            for node_id, detail in children.get(parent, []):
+                if detail.startswith(("SCAN", "SEARCH")):
+                    loop *= max(1, self._loop_rows(conn, detail, aliases, materialized, stats))
+                    cost += loop
+                elif "TEMP B-TREE" in detail:
+                    cost += loop
+                inner = subtree_cost(node_id)
+                if detail.startswith(("MATERIALIZE", "CO-ROUTINE")):
+                    materialized[detail.split()[1]] = max(1, inner)
+                cost += inner
+            return cost
+
+        cost = subtree_cost(0)
+        full_scans = sorted({aliases.get(detail.split()[1], detail.split()[1])
+                             for _, _, _, detail in plan
+                             if detail.startswith("SCAN") and detail.split()[1] not in materialized
+                             and not detail.split()[1].startswith("(")})
+        return {
+            "cost": cost,
+            "full_scans": full_scans,
+            "temp_btrees": sum(1 for *_, detail in plan if "TEMP B-TREE" in detail),
+            "automatic_indexes": sum(1 for *_, detail in plan if "AUTOMATIC" in detail),
+            "steps": [detail for *_, detail in plan],
+        }
+
+    def check(self, conn, sql, params=(), version=None):
+        """Explain a query and apply the policy, raising PlanTooExpensive when it refuses the plan"""
+        summary = self.explain(conn, sql, params, version)
+        with self._lock:
+            self.checked += 1
+        action = self.policy(summary)
+        if action in ("reprompt", "reject"):
+            with self._lock:
+                self.refused += 1
+            self.record(sql, summary, 0.0, 0, status=f"refused ({action})")
+            raise PlanTooExpensive(summary, action)
+        if action == "log":
+            logger.warning(f"Running a query over the plan cost budget ({summary['cost']:,} rows): {sql}")
+        return summary
+
+    @contextmanager
+    def inspect(self, conn, sql, params=(), version=None):
+        """Check a query's plan, then time the block that runs it and log it if slow or costly.
+
+        The block sets .rows on the yielded object to the number of rows it produced.
+        """
+        summary = self.check(conn, sql, params, version)
+        run = _Run()
+        started = time.perf_counter()
+        try:
+            yield run
+        except db.QueryTooExpensive as e:
+            self.record(sql, summary, time.perf_counter() - started, run.rows, status=f"stopped ({e.reason})")
+            raise
+        self.record(sql, summary, time.perf_counter() - started, run.rows)
+
+    def record(self, sql, summary, seconds, rows, status="ok"):
+        """Add a query to the slow-query log when it was slow, costly or refused"""
+        elapsed_ms = seconds * 1000
+        if status == "ok" and elapsed_ms < SLOW_QUERY_MS and summary["cost"] < LOG_MIN_COST:
+            return
+        normalized = normalize_sql(sql)
+        now = datetime.now().isoformat(timespec="seconds")
+        with self._lock:
+            self.logged += 1
+            try:
+                if self._conn is None:
+                    self._conn = db.connect(self.path, check_same_thread=False)
+                self._conn.execute("""
+                INSERT INTO slow_query_log
+                (sql_hash, sql, plan, full_scans, temp_btrees, cost, calls, total_ms, max_ms,
+                 last_rows, last_status, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (sql_hash) DO UPDATE SET
+                    plan = excluded.plan, full_scans = excluded.full_scans,
+                    temp_btrees = excluded.temp_btrees, cost = excluded.cost,
+                    calls = calls + 1, total_ms = total_ms + excluded.total_ms,
+                    max_ms = MAX(max_ms, excluded.max_ms), last_rows = excluded.last_rows,
+                    last_status = excluded.last_status, last_seen = excluded.last_seen
+                """, (
+                    hashlib.sha256(normalized.encode("utf-8")).hexdigest(), normalized,
+                    json.dumps(summary["steps"]), ",".join(summary["full_scans"]), summary["temp_btrees"],
+                    summary["cost"], elapsed_ms, elapsed_ms, rows, status, now, now,
+                ))
+                self._conn.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not write the slow-query log: {e}")
+        logger.info(f"Slow-query log: {status}, {elapsed_ms:.1f} ms, cost {summary['cost']:,}: {normalized}")
+
+    def slow_queries(self, limit=20):
+        """Logged queries, the most total time first"""
+        conn = db.connect(self.path)
+        try:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("""
+            SELECT sql, calls, total_ms, max_ms, cost, full_scans, temp_btrees, plan,
+                   last_rows, last_status, first_seen, last_seen
+            FROM slow_query_log ORDER BY total_ms DESC, cost DESC LIMIT ?
+            """, (limit,)).fetchall()
+            return [dict(row, plan=json.loads(row["plan"])) for row in rows]
+        finally:
+            conn.close()
+
+    def stats(self):
+        """Plans checked, refused and re-prompted, and queries logged"""
+        return {"checked": self.checked, "refused": self.refused, "reprompts": self.reprompts,
+                "logged": self.logged, "max_cost": MAX_COST, "action": ACTION}
+
+
+class _Run:
+    """What a block run under PlanInspector.inspect reports back"""
+
+    rows = 0
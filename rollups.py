@@ -0,0 +1,140 @@
+"""
+E-commerce AI Agent - Materialized rollups
+Per-product-day, per-product and per-day aggregates of the sales and ad
+metrics, with RoAS/CPC/CTR/ACoS precomputed, refreshed incrementally at ingest
+"""
+
+import time
+import logging
+import ingest
+
+logger = logging.getLogger(__name__)
+
+# Fact tables feeding the rollups
+SOURCES = ("total_sales_metrics", "ad_sales_metrics")
+
+# Summed measures, in rollup column order
+MEASURES = ("total_sales", "units_sold", "revenue", "ad_spend", "ad_sales", "clicks", "impressions")
+
+# Ratio columns computed from the summed measures
+RATIOS = {
+    "roas": "ad_sales / NULLIF(ad_spend, 0)",
+    "cpc": "ad_spend / NULLIF(clicks, 0)",
+    "ctr_percent": "100.0 * clicks / NULLIF(impressions, 0)",
+    "acos_percent": "100.0 * ad_spend / NULLIF(ad_sales, 0)",
+}
+
+# Product-day grain: sales and ad rows for the same product and day, side by side
+_PRODUCT_DAILY = f"""
+INSERT INTO product_daily_metrics (product_id, date_key, date, {', '.join(MEASURES)}, {', '.join(RATIOS)})
+SELECT product_id, date_key, date, {', '.join(MEASURES)}, {', '.join(RATIOS.values())}
+FROM (
+    SELECT product_id, date_key, MIN(date) AS date, {', '.join(f'SUM({m}) AS {m}' for m in MEASURES)}
+    FROM (
+        SELECT product_id, date_key, date, total_sales, units_sold, revenue,
+               0 AS ad_spend, 0 AS ad_sales, 0 AS clicks, 0 AS impressions
+        FROM total_sales_metrics {{where}}
+        UNION ALL
+        SELECT product_id, date_key, date, 0, 0, 0, ad_spend, ad_sales, clicks, impressions
+        FROM ad_sales_metrics {{where}}
+    )
+    GROUP BY product_id, date_key
+)
+"""
+
+_PRODUCT_SUMMARY = f"""
+INSERT INTO product_summary (product_id, days, first_date_key, last_date_key, {', '.join(MEASURES)}, {', '.join(RATIOS)})
+SELECT product_id, days, first_date_key, last_date_key, {', '.join(MEASURES)}, {', '.join(RATIOS.values())}
+FROM (
+    SELECT product_id, COUNT(*) AS days, MIN(date_key) AS first_date_key, MAX(date_key) AS last_date_key,
+           {', '.join(f'SUM({m}) AS {m}' for m in MEASURES)}
+    FROM product_daily_metrics {{where}}
+    GROUP BY product_id
+)
+"""
+
+_DAILY_SUMMARY = f"""
+INSERT INTO daily_summary (date_key, date, products, {', '.join(MEASURES)}, {', '.join(RATIOS)})
+SELECT date_key, date, products, {', '.join(MEASURES)}, {', '.join(RATIOS.values())}
+FROM (
+    SELECT date_key, MIN(date) AS date, COUNT(*) AS products, {', '.join(f'SUM({m}) AS {m}' for m in MEASURES)}
+    FROM product_daily_metrics {{where}}
+    GROUP BY date_key
+)
+"""
+
+_TOUCHED_PAIRS = "WHERE (product_id, date_key) IN (SELECT product_id, date_key FROM temp.rollup_keys)"
+_TOUCHED_PRODUCTS = "WHERE product_id IN (SELECT product_id FROM temp.rollup_keys)"
+_TOUCHED_DAYS = "WHERE date_key IN (SELECT date_key FROM temp.rollup_keys)"
+
+
+def _watermarks(cursor):
+    """Highest source row id already folded into the rollups, per source table"""
+    cursor.execute("SELECT source, max_id FROM rollup_state")
+    return dict(cursor.fetchall())
+
+
+def _record_watermarks(cursor):
+    """Remember the current highest row id of each source table"""
+    for table in SOURCES:
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        cursor.execute("INSERT OR REPLACE INTO rollup_state (source, max_id) VALUES (?, ?)",
+                       (table, cursor.fetchone()[0]))
+
+
+def rebuild(cursor):
+    """Recompute every rollup from the fact tables"""
+    for table in ("product_daily_metrics", "product_summary", "daily_summary"):
+        cursor.execute(f"DELETE FROM {table}")
+    cursor.execute(_PRODUCT_DAILY.format(where=""))
+    cursor.execute(_PRODUCT_SUMMARY.format(where=""))
+    cursor.execute(_DAILY_SUMMARY.format(where=""))
+    _record_watermarks(cursor)
+
+
+def refresh_appended(cursor, watermarks):
+    """Recompute only the products and days that have source rows past the watermarks"""
+    cursor.execute("DROP TABLE IF EXISTS temp.rollup_keys")
+    cursor.execute("CREATE TEMP TABLE rollup_keys (product_id TEXT, date_key INTEGER, PRIMARY KEY (product_id, date_key))")
+    for table in SOURCES:
+        cursor.execute(f"INSERT OR IGNORE INTO temp.rollup_keys SELECT product_id, date_key FROM {table} WHERE id > ?",
+                       (watermarks.get(table, 0),))
+    cursor.execute("SELECT COUNT(*) FROM temp.rollup_keys")
+    touched = cursor.fetchone()[0]
+
+    cursor.execute(f"DELETE FROM product_daily_metrics {_TOUCHED_PAIRS}")
+    cursor.execute(_PRODUCT_DAILY.format(where=_TOUCHED_PAIRS))
+    cursor.execute(f"DELETE FROM product_summary {_TOUCHED_PRODUCTS}")
+    cursor.execute(_PRODUCT_SUMMARY.format(where=_TOUCHED_PRODUCTS))
+    cursor.execute(f"DELETE FROM daily_summary {_TOUCHED_DAYS}")
+    cursor.execute(_DAILY_SUMMARY.format(where=_TOUCHED_DAYS))
+    cursor.execute("DROP TABLE temp.rollup_keys")
+    _record_watermarks(cursor)
+    return touched
+
+
+def refresh(cursor, summary):
+    """Bring the rollups up to date after an ingest, committing the result.
+
+    Appended fact rows (ids past the recorded watermarks) only recompute the
+    product-days, products and days they touch; a reloaded fact table, or
+    rollups that were never built, rebuild everything. Returns the action taken.
+    """
+    changed = {ingest.WORKBOOKS[name]["table"]: result["action"] for name, result in summary.items()
+               if result["action"] in ("appended", "reloaded")}
+    watermarks = _watermarks(cursor)
+    start = time.perf_counter()
+
+    if any(watermarks.get(table) is None for table in SOURCES) or \
+            any(changed.get(table) == "reloaded" for table in SOURCES):
+        rebuild(cursor)
+        action = "rebuilt"
+    elif any(table in changed for table in SOURCES):
+        touched = refresh_appended(cursor, watermarks)
+        action = f"refreshed {touched} product-days"
+    else:
+        return "unchanged"
+
+    cursor.connection.commit()
+    logger.info(f"Rollups {action} in {time.perf_counter() - start:.3f}s")
+    return action
@@ -0,0 +1,371 @@
+"""
+E-commerce AI Agent - Local intent router
+Recognizes metric / dimension / filter / top-N / date-range questions with
+precompiled patterns and answers them from vetted, parameterized SQL
+templates, so common analytical questions need no LLM call
+"""
+
+import os
+import re
+import calendar
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Minimum confidence for answering locally; below it the question goes to the LLM
+MIN_CONFIDENCE = float(os.environ.get("ROUTER_MIN_CONFIDENCE", "0.7"))
+
+# Confidence lost per word the router could not account for; one such word
+# is enough to fall below the default MIN_CONFIDENCE
+UNKNOWN_WORD_PENALTY = 0.35
+
+# Rows returned for "top products" without a number
+DEFAULT_TOP_N = 10
+
+TABLES = {
+    "sales": "total_sales_metrics",
+    "ads": "ad_sales_metrics",
+}
+
+# Metric -> source table, SQL aggregate and result column name
+METRICS = {
+    "sales": ("sales", "SUM(total_sales)", "total_sales"),
+    "units": ("sales", "SUM(units_sold)", "units_sold"),
+    "ad_spend": ("ads", "SUM(ad_spend)", "ad_spend"),
+    "ad_sales": ("ads", "SUM(ad_sales)", "ad_sales"),
+    "clicks": ("ads", "SUM(clicks)", "clicks"),
+    "impressions": ("ads", "SUM(impressions)", "impressions"),
+    "cpc": ("ads", "SUM(ad_spend) / NULLIF(SUM(clicks), 0)", "cpc"),
+    "ctr": ("ads", "100.0 * SUM(clicks) / NULLIF(SUM(impressions), 0)", "ctr_percent"),
+    "roas": ("ads", "SUM(ad_sales) / NULLIF(SUM(ad_spend), 0)", "roas"),
+    "acos": ("ads", "100.0 * SUM(ad_spend) / NULLIF(SUM(ad_sales), 0)", "acos_percent"),
+}
+
+RATIO_METRICS = {"cpc", "ctr", "roas", "acos"}
+
+# Phrases for each metric; longer phrases are tried first so "ad sales" is not read as "sales"
+METRIC_PHRASES = {
+    "roas": ["return on ad spend", "return on advertising spend", "roas"],
+    "acos": ["advertising cost of sales", "acos"],
+    "cpc": ["cost per click", "cpc"],
+    "ctr": ["click through rate", "clickthrough rate", "ctr"],
+    "ad_spend": ["ad spend", "ads spend", "advertising spend", "ad cost", "ad costs", "spend", "spent"],
+    "ad_sales": ["ad sales", "ad revenue", "ads sales", "advertising sales", "attributed sales"],
+    "clicks": ["clicks", "click"],
+    "impressions": ["impressions", "impression", "views"],
+    "units": ["units sold", "units", "unit sales", "quantity sold", "quantity", "sold"],
+    "sales": ["total sales", "sales", "revenue", "turnover"],
+}
+
+# Words that carry no meaning for the router
+FILLER = set("""
+a an the what whats which who is are was were be been my our me we i us you show list give get tell find
+display please of for in on at to from and with by per each all total overall how much many did do does
+have has had there generate generated make made earn earned value values amount number numbers
+result results data across during average avg mean calculate compute see know want like would can could
+need current currently so far up
+""".split())
+
+# Concepts the templates cannot express; any of them sends the question to the LLM
+BLOCKERS = re.compile(
+    r"\b(category|categories|brand|brands|price|prices|name|names|eligib\w*|compare|comparison|versus|vs|"
+    r"growth|grow|change|changes|increase|decrease|why|predict\w*|forecast\w*|correlat\w*|median|"
+    r"percentile|not|no|zero|none|never|except|excluding|without|ratio|share|rank|week|weekly|year over year|"
+    r"yoy|hour\w*)\b")
+
+MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+
+_METRIC_PATTERN = re.compile(r"\b(" + "|".join(sorted(
+    (re.escape(phrase) for phrases in METRIC_PHRASES.values() for phrase in phrases),
+    key=len, reverse=True)) + r")\b")
+_PHRASE_TO_METRIC = {phrase: metric for metric, phrases in METRIC_PHRASES.items() for phrase in phrases}
+
+_DATE = r"(\d{4})-(\d{2})-(\d{2})"
+_NUMBER = r"\$?(\d[\d,]*(?:\.\d+)?)"
+_MONTH = r"(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")"
+
+PATTERNS = {
+    "range": re.compile(rf"\b(?:between|from)\s+{_DATE}\s+(?:and|to|until|through)\s+{_DATE}\b"),
+    "day": re.compile(rf"\b(?:on\s+)?{_DATE}\b"),
+    "month": re.compile(rf"\b(?:in\s+|during\s+)?{_MONTH}(?:\s+(\d{{4}}))?\b"),
+    "last_days": re.compile(r"\b(?:last|past|previous)\s+(\d+)\s+days?\b"),
+    "last_week": re.compile(r"\b(?:last|past|previous)\s+week\b"),
+    "product": re.compile(r"\b(?:for\s+|of\s+)?product(?:\s+id)?\s*(?:#|=)?\s*([a-z]*\d[\w-]*)\b"),
+    "threshold": re.compile(rf"\b(more than|greater than|over|above|at least|exceeding|less than|fewer than|"
+                            rf"under|below|at most)\s+{_NUMBER}"),
+    "top": re.compile(r"\b(top|best|highest|most|largest|biggest|bottom|worst|lowest|least|smallest|fewest)"
+                      r"(?:\s+(\d+))?\b"),
+    "how_many": re.compile(r"\bhow many\s+(products?|items?|skus?|days?|dates?)\b"),
+    "count": re.compile(r"\b(\d+)\s+(?:(?:best|top|worst|bottom|highest|lowest)\s+)?"
+                       r"(products?|items?|skus?|days?|dates?)\b"),
+    "by_product": re.compile(r"\b(?:by|per|for each|each|across)\s+(?:product|products|item|items|sku|skus)\b"
+                             r"|\b(?:products|items|skus|product|item|sku)\b"),
+    "by_month": re.compile(r"\b(?:by|per|each)\s+month\b|\bmonthly\b"),
+    "by_date": re.compile(r"\b(?:by|per|each)\s+(?:day|date)\b|\bdaily\b|\bover time\b|\btrend\b|\bday by day\b"
+                          r"|\b(?:which|what)\s+(?:day|date)\b|\b(?:days|dates)\b"),
+}
+
+# Nouns of the count patterns -> dimension
+NOUNS = {"product": "product", "item": "product", "sku": "product", "day": "date", "date": "date"}
+
+# Result column of "how many <noun>" counts, per dimension
+COUNT_LABELS = {"product": "products", "date": "days"}
+
+OPERATORS = {
+    "more than": ">", "greater than": ">", "over": ">", "above": ">", "exceeding": ">", "at least": ">=",
+    "less than": "<", "fewer than": "<", "under": "<", "below": "<", "at most": "<=",
+}
+
+DESCENDING = {"top", "best", "highest", "most", "largest", "biggest"}
+
+
+def _date_key(year, month, day):
+    return int(year) * 10000 + int(month) * 100 + int(day)
+
+
+def parse(question):
+    """Extract the intent of a question, or None when it names no known metric.
+
+    Returns a dict with metrics, dimension, filters, order, limit, the words
+    left unexplained and a confidence between 0 and 1.
+    """
+    text = " ".join(re.sub(r"[^\w\s$#=.,-]", " ", question.lower().replace("-through", " through")).split())
+    text = re.sub(r"[,.](?!\d)", " ", text)
+    # Ids are matched on the lowercased text but bound as the user wrote them
+    original_case = {word.lower(): word for word in re.findall(r"[\w-]+", question)}
+    consumed = []
+    # Spans of dates, product ids and thresholds, whose words must not also be read as counts or dimensions
+    filters = []
+
+    def take(match, is_filter=False):
+        consumed.append(match.span())
+        if is_filter:
+            filters.append(match.span())
+        return match
+
+    def free(name):
+        return [m for m in PATTERNS[name].finditer(text)
+                if not any(m.start() < end and start < m.end() for start, end in filters)]
+
+    intent = {"metrics": [], "dimension": None, "filters": {}, "order": None, "limit": None,
+              "threshold": None, "count": None}
+
+    # Dates first, so their digits are not read as counts or product ids
+    for match in PATTERNS["range"].finditer(text):
+        take(match, is_filter=True)
+        start, end = _date_key(*match.groups()[:3]), _date_key(*match.groups()[3:])
+        intent["filters"]["date_range"] = (min(start, end), max(start, end))
+    if "date_range" not in intent["filters"]:
+        for match in PATTERNS["day"].finditer(text):
+            take(match, is_filter=True)
+            day = _date_key(*match.groups())
+            intent["filters"]["date_range"] = (day, day)
+    for match in PATTERNS["month"].finditer(text):
+        # "may" is also a verb; only count it with a year or after "in"
+        if match.group(1) == "may" and not (match.group(2) or match.group(0).startswith(("in ", "during "))):
+            continue
+        take(match, is_filter=True)
+        intent["filters"]["month"] = (MONTHS[match.group(1)], int(match.group(2)) if match.group(2) else None)
+    for match in PATTERNS["last_days"].finditer(text):
+        take(match, is_filter=True)
+        intent["filters"]["last_days"] = int(match.group(1))
+    for match in PATTERNS["last_week"].finditer(text):
+        take(match, is_filter=True)
+        intent["filters"]["last_days"] = 7
+    for match in PATTERNS["product"].finditer(text):
+        take(match, is_filter=True)
+        intent["filters"]["product_id"] = original_case.get(match.group(1), match.group(1))
+
+    for match in PATTERNS["threshold"].finditer(text):
+        take(match, is_filter=True)
+        value = float(match.group(2).replace(",", ""))
+        # "more than 100 clicks": a metric right after the number is the one compared
+        following = _METRIC_PATTERN.match(text, match.end() + 1)
+        metric = _PHRASE_TO_METRIC[following.group(1)] if following else None
+        intent["threshold"] = (metric, OPERATORS[match.group(1)], value)
+
+    for match in free("how_many"):
+        take(match)
+        intent["count"] = NOUNS[match.group(1).rstrip("s")]
+    for match in free("count"):
+        take(match)
+        intent["limit"] = int(match.group(1))
+        intent["dimension"] = NOUNS[match.group(2).rstrip("s")]
+    for match in free("top"):
+        take(match)
+        intent["order"] = "desc" if match.group(1) in DESCENDING else "asc"
+        if match.group(2):
+            intent["limit"] = int(match.group(2))
+    if intent["limit"] and intent["order"] is None:
+        intent["order"] = "desc"
+
+    for match in _METRIC_PATTERN.finditer(text):
+        take(match)
+        metric = _PHRASE_TO_METRIC[match.group(1)]
+        if metric not in intent["metrics"]:
+            intent["metrics"].append(metric)
+    if not intent["metrics"]:
+        return None
+
+    if intent["count"]:
+        intent["dimension"] = intent["count"]
+    for name, dimension in (("by_month", "month"), ("by_date", "date"), ("by_product", "product")):
+        matches = free(name)
+        for match in matches:
+            take(match)
+        if matches and intent["dimension"] is None:
+            intent["dimension"] = dimension
+
+    if intent["threshold"] and intent["threshold"][0] is None:
+        intent["threshold"] = (intent["metrics"][0],) + intent["threshold"][1:]
+    # "How many products have sales": count the groups with a positive total
+    if intent["count"]:
+        intent["order"] = intent["limit"] = None
+        if intent["threshold"] is None:
+            intent["threshold"] = (intent["metrics"][0], ">", 0.0)
+
+    # Ranking or thresholds without a dimension rank products
+    if (intent["order"] or intent["threshold"]) and intent["dimension"] is None:
+        intent["dimension"] = "product"
+    if intent["order"] and intent["limit"] is None:
+        singular = re.search(r"\bwhich (?:product|item|sku|day|date)\b", text)
+        intent["limit"] = 1 if singular else DEFAULT_TOP_N
+    if intent["dimension"] == "product" and "product_id" in intent["filters"] and not intent["count"]:
+        intent["dimension"] = None
+
+    # Confidence: every word the patterns did not explain costs confidence
+    leftover = list(text)
+    for start, end in consumed:
+        leftover[start:end] = " " * (end - start)
+    leftover = "".join(leftover)
+    unknown = [w for w in leftover.split() if w not in FILLER and not re.fullmatch(r"[$#=.,-]+", w)]
+    intent["unknown"] = unknown
+    if BLOCKERS.search(leftover) or (re.search(r"\b(average|avg|mean)\b", text)
+                                 and any(m not in RATIO_METRICS for m in intent["metrics"])):
+        intent["confidence"] = 0.0
+    else:
+        intent["confidence"] = round(max(0.0, 1.0 - UNKNOWN_WORD_PENALTY * len(unknown)), 2)
+    return intent
+
+
+def _where(table, filters, params):
+    """WHERE clause for one fact table's filters, appending their parameters"""
+    clauses = []
+    if "product_id" in filters:
+        clauses.append("product_id = ?")
+        params.append(filters["product_id"])
+    if "date_range" in filters:
+        clauses.append("date_key BETWEEN ? AND ?")
+        params.extend(filters["date_range"])
+    if "month" in filters:
+        month, year = filters["month"]
+        if year:
+            clauses.append("date_key BETWEEN ? AND ?")
+            params.extend([_date_key(year, month, 1), _date_key(year, month, 31)])
+        else:
+            clauses.append("date_key / 100 % 100 = ?")
+            params.append(month)
+    if "last_days" in filters:
+        clauses.append(f"date_key >= CAST(strftime('%Y%m%d', (SELECT MAX(date) FROM {table}), ?) AS INTEGER)")
+        params.append(f"-{filters['last_days'] - 1} days")
+    return f" WHERE {' AND '.join(clauses)}" if clauses else ""
+
+
+DIMENSIONS = {
+    "product": ("product_id", "product_id"),
+    "date": ("date_key", "date_key"),
+    "month": ("substr(date, 1, 7)", "month"),
+}
+
+
+def build_sql(intent):
+    """Fill the SQL templates for a parsed intent, returning (sql, params)"""
+    dimension = DIMENSIONS.get(intent["dimension"])
+    by_table = {}
+    for metric in intent["metrics"]:
+        by_table.setdefault(METRICS[metric][0], []).append(metric)
+
+    params = []
+    subqueries = []
+    for source, metrics in by_table.items():
+        table = TABLES[source]
+        columns = [f"{METRICS[m][1]} AS {METRICS[m][2]}" for m in metrics]
+        if dimension:
+            columns.insert(0, dimension[0] if dimension[0] == dimension[1] else f"{dimension[0]} AS {dimension[1]}")
+        sql = f"SELECT {', '.join(columns)} FROM {table}{_where(table, intent['filters'], params)}"
+        if dimension:
+            sql += f" GROUP BY {dimension[0]}"
+        subqueries.append(sql)
+
+    primary = METRICS[intent["metrics"][0]][2]
+    if len(subqueries) == 1:
+        sql = subqueries[0]
+        if intent["threshold"]:
+            metric, operator, value = intent["threshold"]
+            sql += f" HAVING {METRICS[metric][1]} {operator} ?"
+            params.append(value)
+    else:
+        # Metrics from both fact tables: aggregate each, then join on the dimension
+        join = f"JOIN ({subqueries[1]}) AS a USING ({dimension[1]})" if dimension else f"CROSS JOIN ({subqueries[1]}) AS a"
+        sql = f"SELECT * FROM ({subqueries[0]}) AS s {join}"
+        if intent["threshold"]:
+            metric, operator, value = intent["threshold"]
+            sql += f" WHERE {METRICS[metric][2]} {operator} ?"
+            params.append(value)
+
+    if intent["count"]:
+        sql = f"SELECT COUNT(*) AS {COUNT_LABELS[intent['count']]} FROM ({sql})"
+    elif intent["order"] == "desc":
+        sql += f" ORDER BY {primary} DESC LIMIT ?"
+        params.append(intent["limit"])
+    elif intent["order"] == "asc":
+        # Ratios are NULL without a denominator; keep those out of "lowest"
+        sql += f" ORDER BY {primary} IS NULL, {primary} ASC LIMIT ?"
+        params.append(intent["limit"])
+    elif dimension and intent["dimension"] != "product":
+        sql += f" ORDER BY {dimension[1]}"
+    elif dimension:
+        sql += f" ORDER BY {primary} DESC"
+    return sql, params
+
+
+def describe(intent):
+    """Short explanation of what the generated SQL computes"""
+    parts = [", ".join(METRICS[m][2].replace("_", " ") for m in intent["metrics"])]
+    if intent["count"]:
+        parts.insert(0, f"count of {COUNT_LABELS[intent['count']]} with")
+    elif intent["dimension"]:
+        parts.append(f"by {intent['dimension']}")
+    if intent["order"]:
+        parts.append(f"{'top' if intent['order'] == 'desc' else 'bottom'} {intent['limit']}")
+    if intent["threshold"]:
+        metric, operator, value = intent["threshold"]
+        parts.append(f"where {METRICS[metric][2].replace('_', ' ')} {operator} {value:g}")
+    for name, value in intent["filters"].items():
+        parts.append(f"{name.replace('_', ' ')} {value}")
+    return "Local intent: " + ", ".join(parts)
+
+
+def route(question, min_confidence=MIN_CONFIDENCE):
+    """SQL for a question the templates can answer confidently, or None.
+
+    The result looks like an LLM translation ({"sql", "explanation"}) plus
+    "params", "intent" and "confidence".
+    """
+    intent = parse(question)
+    if intent is None:
+        return None
+    if intent["confidence"] < min_confidence:
+        logger.info(f"Intent router not confident ({intent['confidence']}) for: {question}; "
+                    f"unknown words {intent['unknown']}")
+        return None
+    sql, params = build_sql(intent)
+    return {"sql": sql, "params": params, "explanation": describe(intent),
+            "intent": {k: v for k, v in intent.items() if k not in ("unknown", "confidence")}, "confidence": intent["confidence"]}
+
+
+def is_specific(question):
+    """Whether a question asks for more than a plain overall total (a breakdown, ranking or filter)"""
+    intent = parse(question)
+    return bool(intent and (intent["dimension"] or intent["filters"] or intent["order"] or intent["threshold"]))
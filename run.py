@@ -2,28 +2,189 @@
 """
 Simple runner script for VS Code
 Just run: python run.py
+Production: python run.py --production (or SERVER_MODE=production)
 """
 
 import os
-from app import app, init_database
+import sys
+import signal
+import logging
+import argparse
+import threading
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor
 
-# Load environment variables if available
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+# Load environment variables if available, before the app reads its settings
 try:
     from dotenv import load_dotenv
     load_dotenv()
 except ImportError:
     pass
 
-if __name__ == '__main__':
-    # Initialize database
-    init_database()
-    
+import db
+from app import app, startup, SHARED_STARTUP_STEPS
+
+logger = logging.getLogger(__name__)
+
+# development: Flask's debug server with the reloader; production: see serve_production
+SERVER_MODE = os.environ.get('SERVER_MODE', 'development')
+
+HOST = os.environ.get('HOST', '0.0.0.0')
+PORT = int(os.environ.get('PORT', '5000'))
+
+# Production: gunicorn when installed (not on Windows), otherwise the threaded server
+WEB_SERVER = os.environ.get('WEB_SERVER', 'auto')
+
+# Worker processes (gunicorn only; 0 = one per CPU) and request threads per process
+WEB_WORKERS = int(os.environ.get('WEB_WORKERS', '0'))
+WEB_THREADS = int(os.environ.get('WEB_THREADS', str(db.POOL_SIZE)))
+
+# Seconds in-flight requests get to finish on shutdown or restart
+GRACEFUL_TIMEOUT = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', '30'))
+
+
+class SingleRequestHandler(WSGIRequestHandler):
+    # No keep-alive: an idle client connection would otherwise hold a pool thread
+    protocol_version = 'HTTP/1.0'
+
+
+class PooledWSGIServer(BaseWSGIServer):
+    """WSGI server answering requests on a fixed pool of threads"""
+
+    multithread = True
+
+    def __init__(self, host, port, app, threads):
+        super().__init__(host, port, app, handler=SingleRequestHandler)
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.handle_on_thread, request, client_address)
+
+    def handle_on_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+
+def warm_up():
+    """Shared startup work, done once before any worker starts: schema
+    migrations, ingest, and the database file read into the OS page cache"""
+    startup.ensure(only=SHARED_STARTUP_STEPS)
+    loaded = db.prewarm(db.DB_PATH)
+    logger.info(f"Read {loaded / (1024 * 1024):.1f} MB of the database into the page cache")
+
+
+def serve_gunicorn(host, port, workers, threads):
+    """Pre-fork gunicorn with threaded workers; SIGHUP replaces the workers gracefully"""
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('graceful_timeout', GRACEFUL_TIMEOUT)
+            # Workers are forked from this warmed-up process; each then opens
+            # its own connections and model client
+            self.cfg.set('preload_app', True)
+            self.cfg.set('post_worker_init', lambda worker: startup.start())
+
+        def load(self):
+            return app
+
+    Server().run()
+
+
+def serve_threaded(host, port, threads):
+    """One process answering on a pool of threads; SIGTERM drains in-flight
+    requests and exits, SIGHUP drains them and restarts the process"""
+    server = PooledWSGIServer(host, port, app, threads)
+    restart = threading.Event()
+
+    def stop(signum, frame):
+        if signum == getattr(signal, 'SIGHUP', None):
+            restart.set()
+        # shutdown() waits for serve_forever(), which runs on this thread
+        threading.Thread(target=server.shutdown).start()
+
+    for name in ('SIGTERM', 'SIGINT', 'SIGHUP'):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), stop)
+
+    startup.start()
+    logger.info(f"Serving on {host}:{port} with {threads} threads (pid {os.getpid()})")
+    server.serve_forever()
+
+    # The listening socket is closed; let accepted requests finish
+    deadline = threading.Timer(GRACEFUL_TIMEOUT, os._exit, (1,))
+    deadline.daemon = True
+    deadline.start()
+    server.executor.shutdown(wait=True)
+    deadline.cancel()
+
+    if restart.is_set():
+        logger.info("Restarting")
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def serve_production(args):
+    """Warm up once, then serve with gunicorn or the threaded server"""
+    server = args.server
+    if server == 'auto':
+        server = 'gunicorn' if os.name == 'posix' and importlib.util.find_spec('gunicorn') else 'threaded'
+    elif server == 'gunicorn' and not importlib.util.find_spec('gunicorn'):
+        sys.exit("gunicorn is not installed: pip install gunicorn, or use --server threaded")
+    workers = args.workers or os.cpu_count() or 1
+
+    warm_up()
+    if server == 'gunicorn':
+        print(f"🚀 E-commerce AI Agent: gunicorn, {workers} workers x {args.threads} threads")
+        serve_gunicorn(args.host, args.port, workers, args.threads)
+    else:
+        if args.workers > 1:
+            logger.warning("The threaded server runs a single process; --workers is ignored")
+        print(f"🚀 E-commerce AI Agent: threaded server, {args.threads} threads")
+        serve_threaded(args.host, args.port, args.threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the E-commerce AI Agent")
+    parser.add_argument('--production', action='store_true', default=SERVER_MODE == 'production',
+                        help="Serve without the debugger and reloader, with several workers or threads")
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--server', choices=('auto', 'gunicorn', 'threaded'), default=WEB_SERVER,
+                        help="Production server (default: gunicorn when installed)")
+    parser.add_argument('--workers', type=int, default=WEB_WORKERS,
+                        help="Worker processes for gunicorn (default: one per CPU)")
+    parser.add_argument('--threads', type=int, default=WEB_THREADS, help="Request threads per process")
+    args = parser.parse_args()
+
     # Check API key
     if not os.environ.get('GEMINI_API_KEY'):
         print("⚠️  Set GEMINI_API_KEY in .env file for AI features")
-    
+
+    if args.production:
+        serve_production(args)
+        return
+
+    # Initialize in the background while the server starts accepting requests
+    # (only in the reloader's serving process)
+    if os.environ.get('WERKZEUG_RUN_MAIN'):
+        startup.start()
+
     print("🚀 E-commerce AI Agent starting...")
-    print("🌐 Open: http://localhost:5000")
-    
+    print(f"🌐 Open: http://localhost:{args.port}")
+
     # Run the app
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host=args.host, port=args.port, debug=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+E-commerce AI Agent - Paraphrase matching
+Local TF-IDF similarity over previously answered questions, so a reworded
+question can reuse validated SQL without another LLM call
+"""
+
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter, defaultdict
+
+from cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+# Minimum cosine similarity for reusing another question's SQL
+THRESHOLD = float(os.environ.get("PARAPHRASE_THRESHOLD", "0.8"))
+
+# Weight of character trigram features relative to whole words
+CHAR_WEIGHT = 0.3
+
+# Words mapped onto a shared vocabulary before comparison
+SYNONYMS = {
+    "item": "product", "items": "product", "products": "product", "sku": "product", "skus": "product",
+    "sellers": "product sales", "seller": "product sales", "bestsellers": "top product sales",
+    "revenue": "sales", "sale": "sales", "sold": "sales", "selling": "sales", "earned": "sales",
+    "best": "top", "highest": "top", "most": "top", "biggest": "top", "largest": "top", "greatest": "top",
+    "worst": "bottom", "lowest": "bottom", "least": "bottom", "smallest": "bottom",
+    "daily": "date", "day": "date", "days": "date", "dates": "date", "per": "by", "each": "by",
+    "units": "unit", "spent": "spend", "spending": "spend", "cost": "spend",
+    "click": "clicks", "impression": "impressions",
+}
+
+STOPWORDS = {
+    "a", "an", "the", "what", "which", "who", "is", "are", "was", "were", "my", "our", "me", "i", "we",
+    "show", "list", "give", "tell", "find", "get", "display", "please", "can", "you", "do", "did",
+    "of", "for", "in", "on", "to", "with", "by", "and", "have", "has", "all", "that", "this", "there",
+}
+
+# Words that change the meaning of SQL; two questions must agree on them exactly
+CRITICAL = {
+    "top", "bottom", "product", "date", "week", "month", "year",
+    "sales", "unit", "spend", "clicks", "impressions", "cpc", "ctr", "roas", "acos", "ad", "ads",
+    "average", "avg", "total", "count", "many", "not", "without", "no", "zero", "none", "never",
+}
+
+
+def canonical_tokens(question):
+    """Normalized, synonym-mapped tokens without stopwords"""
+    tokens = []
+    for word in normalize_question(question).split():
+        for token in SYNONYMS.get(word, word).split():
+            if token not in STOPWORDS:
+                tokens.append(token)
+    return tokens
+
+
+def critical_terms(tokens):
+    """Numbers and meaning-bearing words that must match for SQL to be reused"""
+    return frozenset(t for t in tokens if t in CRITICAL or re.fullmatch(r"\d+(\.\d+)?", t))
+
+
+def features(tokens):
+    """Word and character trigram counts for a tokenized question"""
+    counts = Counter()
+    for token in tokens:
+        counts["w:" + token] += 1
+        padded = f" {token} "
+        for i in range(len(padded) - 2):
+            counts["c:" + padded[i:i + 3]] += CHAR_WEIGHT
+    return counts
+
+
+class ParaphraseIndex:
+    """In-memory TF-IDF index of answered questions and their validated SQL"""
+
+    def __init__(self, threshold=THRESHOLD):
+        self.threshold = threshold
+        self._entries = []
+        self._keys = {}
+        self._postings = None
+        self._idf = None
+        self._lock = threading.Lock()
+        self.matches = 0
+        self.misses = 0
+
+    def add(self, key, question, sql_info):
+        """Add (or replace) an answered question"""
+        tokens = canonical_tokens(question)
+        entry = {
+            "key": key,
+            "question": question,
+            "sql_info": {"sql": sql_info["sql"], "explanation": sql_info.get("explanation", "")},
+            "features": features(tokens),
+            "critical": critical_terms(tokens),
+        }
+        with self._lock:
+            if key in self._keys:
+                self._entries[self._keys[key]] = entry
+            else:
+                self._keys[key] = len(self._entries)
+                self._entries.append(entry)
+            self._postings = None
+
+    def remove(self, key):
+        """Drop an answered question, if it is indexed"""
+        with self._lock:
+            if self._keys.pop(key, None) is None:
+                return
+            self._entries = [entry for entry in self._entries if entry["key"] != key]
+            self._keys = {entry["key"]: i for i, entry in enumerate(self._entries)}
+            self._postings = None
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def _rebuild(self):
+        """Recompute IDF weights and the inverted index (lock held)"""
+        document_frequency = Counter()
+        for entry in self._entries:
+            document_frequency.update(entry["features"].keys())
+        count = len(self._entries)
+        self._idf = {f: math.log((1 + count) / (1 + df)) + 1 for f, df in document_frequency.items()}
+
+        self._postings = defaultdict(list)
+        for i, entry in enumerate(self._entries):
+            weights = {f: tf * self._idf[f] for f, tf in entry["features"].items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+            for feature, weight in weights.items():
+                self._postings[feature].append((i, weight / norm))
+
+    def match(self, question):
+        """Best validated entry for a paraphrase of question, as (entry, score), or None"""
+        tokens = canonical_tokens(question)
+        if not tokens:
+            return None
+        critical = critical_terms(tokens)
+
+        with self._lock:
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._postings is None:
+                self._rebuild()
+
+            # Unseen features still count towards the query's norm
+            unseen_idf = math.log(1 + len(self._entries)) + 1
+            weights = {f: tf * self._idf.get(f, unseen_idf) for f, tf in features(tokens).items()}
+            norm = math.sqrt(sum(w * w for w in weights.values())) or 1.0
+
+            scores = defaultdict(float)
+            for feature, weight in weights.items():
+                for i, entry_weight in self._postings.get(feature, ()):
+                    scores[i] += weight / norm * entry_weight
+
+            for i, score in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+                if score < self.threshold:
+                    break
+                entry = self._entries[i]
+                if entry["critical"] == critical:
+                    self.matches += 1
+                    return entry, score
+
+            self.misses += 1
+            return None
+
+    def stats(self):
+        """Index size, threshold and match counts"""
+        lookups = self.matches + self.misses
+        return {
+            "entries": len(self._entries),
+            "threshold": self.threshold,
+            "matches": self.matches,
+            "misses": self.misses,
+            "match_rate": round(self.matches / lookups, 4) if lookups else 0.0,
+        }
@@ -0,0 +1,40 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SCHEMA = "Table: total_sales_metrics (date, item_id, total_sales)"
+
+
+@pytest.fixture
+def schema():
+    """The schema text the web fixture reports"""
+    return SCHEMA
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    """An empty database with the app schema"""
+    import db
+
+    path = str(tmp_path / "cache.db")
+    conn = db.connect(path)
+    db.create_schema(conn)
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def web(db_path, monkeypatch):
+    """app with a fresh translation cache and paraphrase index over a fixed schema"""
+    import app
+    import cache
+    import similarity
+
+    monkeypatch.setattr(app, "translation_cache", cache.TranslationCache(db_path))
+    monkeypatch.setattr(app, "paraphrase_index", similarity.ParaphraseIndex())
+    monkeypatch.setattr(app, "get_database_schema", lambda: SCHEMA)
+    return app
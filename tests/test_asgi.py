@@ -0,0 +1,81 @@
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import asgi
+import llm
+
+SQL_INFO = {"sql": "SELECT n FROM numbers", "explanation": "numbers"}
+PAGE = {"result_id": "r1", "rows": [{"n": 1}, {"n": 2}], "next_page_token": None, "total_rows": 2}
+
+
+@pytest.fixture
+def served(monkeypatch):
+    """asgi with startup done, one executor thread, and a model that answers in 0.2s"""
+    web = asgi.web
+    monkeypatch.setattr(web.startup, "state", "ready")
+    monkeypatch.setattr(asgi, "executor", ThreadPoolExecutor(max_workers=1))
+    monkeypatch.setattr(web, "direct_answer", lambda question: None)
+    monkeypatch.setattr(web, "routed_translation", lambda question: None)
+    monkeypatch.setattr(web, "cached_translation", lambda question, schema: None)
+    monkeypatch.setattr(web, "execute_translation", lambda question, sql_info, page_size: (sql_info, PAGE))
+    monkeypatch.setattr(web, "local_answer", lambda *args: None)
+    client = llm.LLMClient(llm.FakeBackend(mappings={"numbers": SQL_INFO["sql"]}, latency_ms=200, jitter_ms=0))
+    monkeypatch.setattr(llm, "get_client", lambda: client)
+    return asgi
+
+
+async def get(app, path, query):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode("ascii"), "headers": []}
+    await app(scope, receive, send)
+    return messages
+
+
+def events(messages):
+    body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body").decode("utf-8")
+    parsed = []
+    for block in body.strip().split("\n\n"):
+        event, data = block.split("\n")
+        parsed.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return parsed
+
+
+def test_stream_events(served):
+    messages = asyncio.run(get(served.app, "/api/ask/stream", "question=numbers"))
+    assert messages[0]["headers"][0] == (b"content-type", b"text/event-stream; charset=utf-8")
+    stream = events(messages)
+    names = [name for name, _ in stream]
+    assert names[:2] == ["sql", "rows"] and names[-2:] == ["answer", "done"]
+    assert set(names[2:-2]) == {"token"}
+    assert stream[0][1]["sql_query"] == SQL_INFO["sql"]
+    assert stream[1][1]["results"] == PAGE["rows"]
+    assert "".join(data["text"] for name, data in stream if name == "token").strip() == stream[-2][1]["formatted_response"]
+
+
+def test_missing_question(served):
+    assert events(asyncio.run(get(served.app, "/api/ask/stream", ""))) == [
+        ("error", {"success": False, "error": "No question provided"})]
+
+
+def test_streams_do_not_hold_executor_threads(served):
+    """Model waits are awaited: 8 streams on one executor thread take about one model round trip each"""
+    async def many():
+        return await asyncio.gather(*(get(served.app, "/api/ask/stream", "question=numbers") for _ in range(8)))
+
+    started = time.perf_counter()
+    results = asyncio.run(many())
+    elapsed = time.perf_counter() - started
+    assert all(events(messages)[-1] == ("done", {"success": True}) for messages in results)
+    # Two model calls per stream (translate, format) at 0.2s each
+    assert elapsed < 1.5
@@ -0,0 +1,31 @@
+import json
+
+import app
+import digest
+
+
+def sales(count):
+    return [{"product_id": str(i), "total_sales": float(i)} for i in range(count)]
+
+
+def test_all_null_column_has_only_a_null_count():
+    rows = [{"date": None, "total_sales": 1.0}, {"date": None, "total_sales": 2.0}]
+    assert digest.column_stats(rows, "date", False) == {"nulls": 2}
+
+
+def test_prompt_digest_covers_the_whole_result():
+    result_id = app.result_store.create([sales(3000)])
+    page = app.result_store.page(result_id, page_size=100)
+    text = app.prompt_results("top products", page["rows"], page["total_rows"], result_id)
+    assert text.startswith("(digest of all 3000 rows")
+    stats = json.loads(text[text.index("{"):])
+    assert stats["rows_summarized"] == 3000
+    assert stats["columns"]["total_sales"]["max"] == 2999.0
+
+
+def test_prompt_digest_names_the_rows_it_covers(monkeypatch):
+    monkeypatch.setattr(digest, "MAX_ROWS", 1000)
+    result_id = app.result_store.create([sales(3000)])
+    page = app.result_store.page(result_id, page_size=100)
+    text = app.prompt_results("top products", page["rows"], page["total_rows"], result_id)
+    assert text.startswith("(digest of the first 1000 of 3000 rows")
@@ -0,0 +1,44 @@
+import pytest
+
+import app
+import cache
+import db
+import queryplan
+
+
+@pytest.fixture
+def web(tmp_path, monkeypatch):
+    path = str(tmp_path / "execute.db")
+    conn = db.connect(path)
+    db.create_schema(conn)
+    conn.execute("CREATE TABLE numbers (n INTEGER)")
+    conn.execute("""
+    INSERT INTO numbers
+    WITH RECURSIVE seq(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM seq WHERE n < 25000)
+    SELECT n FROM seq
+    """)
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(app, "pool", db.ConnectionPool(path))
+    monkeypatch.setattr(app, "result_cache", cache.ResultCache(path))
+    monkeypatch.setattr(app, "plan_inspector", queryplan.PlanInspector(path, policy=lambda summary: None))
+    return app
+
+
+def test_paged_results_may_exceed_the_query_row_limit(web):
+    page = web.execute_sql_paged("SELECT n FROM numbers ORDER BY n", page_size=10)
+    assert page["total_rows"] == 25000 > db.QUERY_MAX_ROWS
+    assert [row["n"] for row in page["rows"]] == list(range(1, 11))
+    assert web.result_store.page(page["result_id"], "24990", 10)["rows"][-1] == {"n": 25000}
+
+
+def test_paged_results_have_their_own_row_limit(web, monkeypatch):
+    monkeypatch.setattr(app.pagination, "MAX_ROWS", 20000)
+    with pytest.raises(db.QueryTooExpensive) as error:
+        web.execute_sql_paged("SELECT n FROM numbers")
+    assert error.value.reason == "row_limit"
+
+
+def test_sql_errors_reach_the_caller(web):
+    with pytest.raises(db.QueryFailed):
+        web.execute_sql_paged("SELECT missing FROM numbers")
@@ -0,0 +1,32 @@
+import pytest
+
+import formatter
+
+
+@pytest.mark.parametrize("row, answer", [
+    ({"products": 337}, "There are 337 products."),
+    ({"days": 1}, "There is 1 day."),
+    ({"COUNT(*)": 3}, "The number of rows is 3."),
+    ({"COUNT(DISTINCT product_id)": 4}, "The number of distinct product IDs is 4."),
+    ({"total_sales": 1234.5}, "The total sales are 1,234.50."),
+    ({"SUM(total_sales)": 99.0}, "The sum of total sales is 99.00."),
+    ({"roas": 2.5}, "The ROAS is 2.50."),
+    ({"ad_spend": 3.0}, "The ad spend is 3.00."),
+])
+def test_scalar_agreement(row, answer):
+    assert formatter.format_locally([row]) == answer
+
+
+def test_count_labels_in_listings():
+    rows = [{"date": "2025-06-01", "COUNT(*)": 3}, {"date": "2025-06-02", "COUNT(*)": 4}]
+    assert formatter.format_locally(rows).startswith("Number of rows from 2025-06-01 to 2025-06-02")
+
+
+@pytest.mark.parametrize("row, answer", [
+    ({"date_key": 20250613, "total_sales": 154927.08},
+     "Here is the result: date key: 2025-06-13; total sales: 154,927.08."),
+    ({"date": "2025-06-13 00:00:00", "product_id": "42", "units_sold": 3},
+     "Here is the result: date: 2025-06-13; product ID: 42; units sold: 3."),
+])
+def test_single_row_dates(row, answer):
+    assert formatter.format_locally([row]) == answer
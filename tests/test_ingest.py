@@ -0,0 +1,122 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+import db
+import ingest
+import workbook_cache
+
+
+SHEETS = {
+    "sales": "Product-Level Total Sales and M",
+    "ads": "Product-Level Ad Sales and Metr",
+    "eligibility": "Product-Level Eligibility Table",
+}
+
+
+def days(start, count):
+    return [datetime(2025, 6, 1) + timedelta(days=day) for day in range(start, start + count)]
+
+
+def sales_rows(start, count):
+    """Rows in the layout of the total sales workbook"""
+    return pd.DataFrame({
+        "date": days(start, count),
+        "item_id": [float(day % 3) for day in range(start, start + count)],
+        "total_sales": [100.0 + day for day in range(start, start + count)],
+        "total_units_ordered": [float(day % 4 + 1) for day in range(start, start + count)],
+    })
+
+
+def ads_rows(start, count):
+    """Rows in the layout of the ad sales workbook"""
+    return pd.DataFrame({
+        "date": days(start, count),
+        "item_id": [float(day % 3) for day in range(start, start + count)],
+        "ad_sales": [50.0 + day for day in range(start, start + count)],
+        "impressions": [1000.0] * count,
+        "ad_spend": [10.0] * count,
+        "clicks": [float(day % 2) * 4 for day in range(start, start + count)],
+        "units_sold": [2.0] * count,
+    })
+
+
+def eligibility_rows():
+    """Rows in the layout of the eligibility workbook: one check per product per day"""
+    return pd.DataFrame({
+        "eligibility_datetime_utc": [datetime(2025, 6, 4, 8, 50), datetime(2025, 6, 4, 8, 50),
+                                     datetime(2025, 6, 5, 8, 50), datetime(2025, 6, 5, 8, 50)],
+        "item_id": [29.0, 30.0, 29.0, 30.0],
+        "eligibility": [False, True, False, True],
+        "message": ["Cost too high", "", "Cost too high", ""],
+    })
+
+
+def write(path, name, rows):
+    rows.to_excel(path, index=False, sheet_name=SHEETS[name])
+
+
+@pytest.fixture
+def workbooks(tmp_path, monkeypatch):
+    """Point every workbook at a small temp file and return their paths and a fresh database cursor"""
+    paths = {}
+    for name, rows in (("sales", sales_rows(0, 5)), ("ads", ads_rows(0, 4)), ("eligibility", eligibility_rows())):
+        paths[name] = tmp_path / f"{name}.xlsx"
+        write(paths[name], name, rows)
+        monkeypatch.setitem(ingest.WORKBOOKS, name, dict(ingest.WORKBOOKS[name], path=str(paths[name])))
+    monkeypatch.setattr(workbook_cache, "CACHE_DIR", "")
+    conn = db.connect(str(tmp_path / "ingest.db"))
+    db.create_schema(conn)
+    yield paths, conn.cursor()
+    conn.close()
+
+
+def count(cursor, table):
+    cursor.execute(f"SELECT COUNT(*) FROM {table}")
+    return cursor.fetchone()[0]
+
+
+@pytest.mark.parametrize("mode", ["bulk", "stream"])
+def test_appended_rows_are_the_only_rows_inserted(workbooks, mode):
+    paths, cursor = workbooks
+    assert ingest.sync_workbook(cursor, "sales", mode=mode) == {"action": "reloaded", "rows": 5}
+
+    write(paths["sales"], "sales", pd.concat([sales_rows(0, 5), sales_rows(5, 3)]))
+    assert ingest.sync_workbook(cursor, "sales", mode=mode) == {"action": "appended", "rows": 3}
+    assert count(cursor, "total_sales_metrics") == 8
+    cursor.execute("SELECT date, total_sales FROM total_sales_metrics ORDER BY date DESC LIMIT 1")
+    assert cursor.fetchone() == ("2025-06-08 00:00:00", 107.0)
+
+    assert ingest.sync_workbook(cursor, "sales", mode=mode) == {"action": "unchanged", "rows": 0}
+
+
+def test_workbooks_map_onto_their_tables(workbooks):
+    paths, cursor = workbooks
+    assert ingest.sync_workbooks(cursor, workers=1) == {
+        "sales": {"action": "reloaded", "rows": 5},
+        "ads": {"action": "reloaded", "rows": 4},
+        "eligibility": {"action": "reloaded", "rows": 2},
+    }
+    cursor.execute("SELECT product_id, total_sales, units_sold, date, date_key FROM total_sales_metrics ORDER BY date")
+    assert cursor.fetchone() == ("0", 100.0, 1, "2025-06-01 00:00:00", 20250601)
+    cursor.execute("SELECT product_id, clicks, cpc FROM ad_sales_metrics ORDER BY date LIMIT 2")
+    assert cursor.fetchall() == [("0", 0, 0.0), ("1", 4, 2.5)]
+    cursor.execute("SELECT product_id, product_name FROM products ORDER BY product_id")
+    assert cursor.fetchall() == [("29", "Product 29"), ("30", "Product 30")]
+
+
+def test_duplicate_products_are_not_counted(workbooks):
+    """The eligibility sheet lists each product once per check; only new products are written"""
+    paths, cursor = workbooks
+    assert ingest.sync_workbook(cursor, "eligibility") == {"action": "reloaded", "rows": 2}
+    assert ingest.sync_workbook(cursor, "eligibility", force=True) == {"action": "reloaded", "rows": 2}
+    assert count(cursor, "products") == 2
+
+
+def test_bulk_insert_counts_across_batches(workbooks, monkeypatch):
+    paths, cursor = workbooks
+    monkeypatch.setattr(ingest, "BATCH_SIZE", 2)
+    frame = ingest.prepare_sales(sales_rows(0, 5))
+    assert ingest.bulk_insert(cursor, "total_sales_metrics", frame) == 5
+    assert count(cursor, "total_sales_metrics") == 5
@@ -0,0 +1,103 @@
+import os
+
+import pytest
+
+import pagination
+
+
+def rows(count):
+    return [{"id": i, "name": f"item {i}"} for i in range(count)]
+
+
+def batches(items, size=7):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def read_all(store, result_id, page_size):
+    collected, token, pages = [], None, 0
+    while True:
+        page = store.page(result_id, token, page_size)
+        collected.extend(page["rows"])
+        pages += 1
+        token = page["next_page_token"]
+        if token is None:
+            return collected, pages, page["total_rows"]
+
+
+@pytest.fixture
+def store():
+    store = pagination.ResultStore()
+    yield store
+    store.clear()
+
+
+def test_page_tokens_walk_an_in_memory_result(store):
+    items = rows(25)
+    result_id = store.create(batches(items))
+    assert store.stats() == {"handles": 1, "spilled": 0}
+    assert read_all(store, result_id, 10) == (items, 3, 25)
+
+
+def test_page_tokens_walk_a_spilled_result(store, monkeypatch):
+    monkeypatch.setattr(pagination, "SPILL_ROWS", 20)
+    monkeypatch.setattr(pagination, "INDEX_STRIDE", 8)
+    items = rows(53)
+    result_id = store.create(batches(items))
+    assert store.stats() == {"handles": 1, "spilled": 1}
+    assert read_all(store, result_id, 10) == (items, 6, 53)
+    assert store.page(result_id, "17", 5)["rows"] == items[17:22]
+
+
+def test_empty_result_has_one_page(store):
+    page = store.page(store.create([]), None, 10)
+    assert page["rows"] == [] and page["next_page_token"] is None and page["total_rows"] == 0
+
+
+@pytest.mark.parametrize("token", ["abc", "-1", "26"])
+def test_invalid_page_token(store, token):
+    result_id = store.create(batches(rows(25)))
+    with pytest.raises(ValueError):
+        store.page(result_id, token, 10)
+
+
+def test_expired_handle_is_gone(store, monkeypatch):
+    monkeypatch.setattr(pagination, "SPILL_ROWS", 5)
+    result_id = store.create(batches(rows(10)))
+    path = store._results[result_id]["path"]
+    store.ttl = -1
+    with pytest.raises(KeyError):
+        store.page(result_id, None, 10)
+    assert not os.path.exists(path)
+
+
+def test_oldest_handles_are_evicted_over_capacity():
+    store = pagination.ResultStore(max_handles=2)
+    first = store.create([rows(1)])
+    store.create([rows(1)])
+    store.create([rows(1)])
+    with pytest.raises(KeyError):
+        store.page(first)
+    assert store.stats()["handles"] == 2
+    store.clear()
+
+
+def test_page_size_from():
+    assert pagination.page_size_from(None) == pagination.PAGE_SIZE
+    assert pagination.page_size_from("25") == 25
+    assert pagination.page_size_from(10 ** 9) == pagination.MAX_PAGE_SIZE
+    with pytest.raises(ValueError):
+        pagination.page_size_from(0)
+
+
+def test_spill_file_removed_after_lookup_reads_as_expired(store, monkeypatch):
+    monkeypatch.setattr(pagination, "SPILL_ROWS", 5)
+    result_id = store.create(batches(rows(10)))
+    read_spilled = store._read_spilled
+
+    def evicted_meanwhile(entry, start, end):
+        os.unlink(entry["path"])
+        return read_spilled(entry, start, end)
+    monkeypatch.setattr(store, "_read_spilled", evicted_meanwhile)
+    with pytest.raises(KeyError):
+        store.page(result_id, None, 10)
@@ -0,0 +1,61 @@
+import pytest
+
+import app
+import queryplan
+
+SUMMARY = {"cost": 10 ** 9, "steps": ["SCAN total_sales_metrics"], "full_scans": ["total_sales_metrics"]}
+PAGE = {"result_id": "r1", "rows": [{"total": 1}], "next_page_token": None, "total_rows": 1}
+
+
+class Model:
+    def __init__(self, reply=None, error=None):
+        self.reply, self.error = reply, error
+
+    def generate(self, prompt):
+        if self.error is not None:
+            raise self.error
+        return self.reply
+
+
+@pytest.fixture
+def web(web, monkeypatch):
+    """The shared web fixture, with SQL starting EXPENSIVE rejected by the plan check"""
+    def execute(sql, page_size=None, params=()):
+        if sql.startswith("EXPENSIVE"):
+            raise queryplan.PlanTooExpensive(SUMMARY, "reprompt")
+        return PAGE
+    monkeypatch.setattr(web, "execute_sql_paged", execute)
+    return web
+
+
+def use_model(monkeypatch, model):
+    monkeypatch.setattr(app.llm, "get_client", lambda: model)
+
+
+@pytest.mark.parametrize("model", [
+    Model(error=RuntimeError("model unavailable")),
+    Model(reply="not json"),
+    Model(reply='["a list"]'),
+    Model(reply='{"sql": null}'),
+])
+def test_failed_replan_raises_the_plan_error(web, monkeypatch, model, schema):
+    use_model(monkeypatch, model)
+    with pytest.raises(queryplan.PlanTooExpensive):
+        web.execute_translation("total sales", {"sql": "EXPENSIVE query"})
+    assert web.translation_cache.get("total sales", schema) is None
+
+
+def test_replanned_sql_is_cached_after_it_runs(web, monkeypatch, schema):
+    use_model(monkeypatch, Model(reply='{"sql": "SELECT cheap", "explanation": "rollup"}'))
+    sql_info, page = web.execute_translation("total sales", {"sql": "EXPENSIVE query"})
+    assert sql_info["sql"] == "SELECT cheap"
+    assert sql_info["replanned_from"] == "EXPENSIVE query"
+    assert page is PAGE
+    assert web.translation_cache.get("total sales", schema)["sql"] == "SELECT cheap"
+
+
+def test_replanned_sql_that_is_still_expensive_is_not_cached(web, monkeypatch, schema):
+    use_model(monkeypatch, Model(reply='{"sql": "EXPENSIVE again"}'))
+    with pytest.raises(queryplan.PlanTooExpensive):
+        web.execute_translation("total sales", {"sql": "EXPENSIVE query"})
+    assert web.translation_cache.get("total sales", schema) is None
@@ -0,0 +1,107 @@
+import pytest
+
+import router
+
+
+def routed(question):
+    result = router.route(question)
+    assert result is not None, f"not routed: {question}"
+    return result["sql"], result["params"]
+
+
+def test_top_products():
+    sql, params = routed("top 5 products by sales")
+    assert "GROUP BY product_id" in sql
+    assert sql.endswith("ORDER BY total_sales DESC LIMIT ?")
+    assert params == [5]
+
+
+def test_count_noun_sets_dimension():
+    sql, params = routed("top 3 days by sales")
+    assert "GROUP BY date_key" in sql
+    assert params == [3]
+
+
+def test_which_day():
+    sql, params = routed("which day had the highest sales")
+    assert "GROUP BY date_key" in sql
+    assert params == [1]
+
+
+def test_bottom_days_ascending():
+    sql, params = routed("bottom 3 days by clicks")
+    assert "GROUP BY date_key" in sql and "ASC LIMIT ?" in sql
+    assert params == [3]
+
+
+def test_last_n_days_is_a_filter_not_a_limit():
+    sql, params = routed("sales for product 27 last 7 days")
+    assert "LIMIT" not in sql and "ORDER BY" not in sql
+    assert "GROUP BY" not in sql
+    assert params == ["27", "-6 days"]
+
+
+def test_product_id_keeps_its_case():
+    sql, params = routed("sales for product B07XYZ123")
+    assert "product_id = ?" in sql
+    assert params == ["B07XYZ123"]
+
+
+def test_how_many_days_counts():
+    sql, params = routed("how many days had sales over 100")
+    assert sql.startswith("SELECT COUNT(*) AS days FROM (")
+    assert "GROUP BY date_key HAVING SUM(total_sales) > ?" in sql
+    assert params == [100.0]
+
+
+def test_how_many_products_counts():
+    sql, params = routed("how many products have sales")
+    assert sql.startswith("SELECT COUNT(*) AS products FROM (")
+    assert "GROUP BY product_id HAVING SUM(total_sales) > ?" in sql
+    assert params == [0.0]
+
+
+def test_threshold_uses_having():
+    sql, params = routed("products with more than 100 clicks")
+    assert "HAVING SUM(clicks) > ?" in sql
+    assert params == [100.0]
+
+
+def test_month_with_year():
+    sql, params = routed("total clicks in june 2025")
+    assert "date_key BETWEEN ? AND ?" in sql
+    assert params == [20250601, 20250631]
+
+
+def test_metrics_from_both_tables_are_joined():
+    sql, _ = routed("sales and ad spend by product")
+    assert "JOIN" in sql and "USING (product_id)" in sql
+
+
+@pytest.mark.parametrize("question", [
+    "products with no sales",
+    "products with zero clicks",
+    "products without clicks",
+    "products that never sold",
+    "sales by category",
+    "why did sales drop",
+    "compare sales this month versus last month",
+])
+def test_blocked_questions_go_to_the_llm(question):
+    assert router.route(question) is None
+
+
+def test_one_unknown_word_is_not_confident():
+    intent = router.parse("sales for the flagship")
+    assert intent["unknown"] == ["flagship"]
+    assert intent["confidence"] < router.MIN_CONFIDENCE
+    assert router.route("sales for the flagship") is None
+
+
+def test_no_metric_is_not_parsed():
+    assert router.parse("how many records do I have") is None
+
+
+def test_is_specific():
+    assert not router.is_specific("what is my total sales?")
+    assert router.is_specific("daily sales")
@@ -0,0 +1,54 @@
+import pytest
+
+import similarity
+
+TOP_5 = {"sql": "SELECT item_id, SUM(total_sales) FROM total_sales_metrics GROUP BY item_id LIMIT 5"}
+
+
+@pytest.fixture
+def index():
+    index = similarity.ParaphraseIndex()
+    index.add("top5", "top 5 products by sales", TOP_5)
+    index.add("spend", "total ad spend by date", {"sql": "SELECT date, SUM(ad_spend) FROM ad_sales_metrics"})
+    return index
+
+
+@pytest.mark.parametrize("question", [
+    "Top 5 products by sales?",
+    "which 5 items sold the most",
+    "show me the best 5 products by revenue",
+])
+def test_paraphrase_matches(index, question):
+    match = index.match(question)
+    assert match is not None
+    entry, score = match
+    assert entry["key"] == "top5"
+    assert entry["sql_info"]["sql"] == TOP_5["sql"]
+    assert score >= index.threshold
+
+
+@pytest.mark.parametrize("question", [
+    "top 10 products by sales",
+    "bottom 5 products by sales",
+    "top 5 products by ad spend",
+    "top 5 products with zero sales",
+    "top 5 products without sales",
+    "how many products are there",
+])
+def test_critical_terms_must_agree(index, question):
+    assert index.match(question) is None
+
+
+def test_remove(index):
+    index.remove("top5")
+    assert "top5" not in index
+    assert index.match("top 5 products by sales") is None
+    assert index.match("total ad spend by date")[0]["key"] == "spend"
+
+
+def test_stats(index):
+    index.match("top 5 products by sales")
+    index.match("something else entirely")
+    assert index.stats()["entries"] == 2
+    assert index.stats()["matches"] == 1
+    assert index.stats()["misses"] == 1
@@ -0,0 +1,83 @@
+import pytest
+
+import cache
+import db
+
+SQL_INFO = {"sql": "SELECT SUM(total_sales) FROM total_sales_metrics", "explanation": "sum"}
+
+
+def test_put_then_get(db_path, schema):
+    translations = cache.TranslationCache(db_path)
+    assert translations.get("What are total sales?", schema) is None
+    translations.put("What are total sales?", schema, SQL_INFO)
+    assert translations.get("what are  total sales", schema) == SQL_INFO
+
+
+def test_entries_survive_a_restart(db_path, schema):
+    cache.TranslationCache(db_path).put("total sales", schema, SQL_INFO)
+    restarted = cache.TranslationCache(db_path)
+    assert restarted.get("total sales", schema) == SQL_INFO
+    assert restarted.db_hits == 1
+
+
+def test_schema_change_misses(db_path, schema):
+    translations = cache.TranslationCache(db_path)
+    translations.put("total sales", schema, SQL_INFO)
+    assert translations.get("total sales", schema + " extra") is None
+
+
+def test_expired_entries_miss(db_path, schema):
+    cache.TranslationCache(db_path, ttl=60).put("total sales", schema, SQL_INFO)
+    conn = db.connect(db_path)
+    conn.execute("UPDATE translation_cache SET created_at = created_at - 120")
+    conn.commit()
+    conn.close()
+    assert cache.TranslationCache(db_path, ttl=60).get("total sales", schema) is None
+
+
+def test_memory_entries_expire():
+    memory = cache.LRUCache(10, ttl=60)
+    memory.set("fresh", 1)
+    memory.set("stale", 2, age=120)
+    assert memory.get("fresh") == 1
+    assert memory.get("stale") is None
+
+
+def test_delete_forgets_memory_and_disk(db_path, schema):
+    translations = cache.TranslationCache(db_path)
+    translations.put("total sales", schema, SQL_INFO)
+    translations.delete("total sales", schema)
+    assert translations.get("total sales", schema) is None
+    assert cache.TranslationCache(db_path).get("total sales", schema) is None
+
+
+def test_translation_is_cached_only_after_it_ran(web, schema):
+    web.record_outcome("total sales", dict(SQL_INFO), succeeded=False)
+    assert web.translation_cache.get("total sales", schema) is None
+
+    web.record_outcome("total sales", dict(SQL_INFO), succeeded=True)
+    assert web.translation_cache.get("total sales", schema) == SQL_INFO
+    assert [key for key, _, _ in web.translation_cache.validated_entries(schema)] == [
+        web.translation_cache.key("total sales", schema)]
+
+
+def test_cached_translation_that_fails_is_dropped(web, schema):
+    web.record_outcome("total sales", dict(SQL_INFO), succeeded=True)
+    cached = web.cached_translation("total sales", schema)
+    assert cached["cached"]
+
+    web.record_outcome("total sales", cached, succeeded=False)
+    assert web.translation_cache.get("total sales", schema) is None
+    assert web.cached_translation("total sales", schema) is None
+
+
+def test_failing_sql_is_not_cached_and_reaches_the_caller(web, monkeypatch, schema):
+    def fail(sql, page_size=None, params=()):
+        raise db.QueryFailed("no such column: missing")
+    monkeypatch.setattr(web, "execute_sql_paged", fail)
+    web.record_outcome("total sales", dict(SQL_INFO), succeeded=True)
+    cached = web.cached_translation("total sales", schema)
+
+    with pytest.raises(db.QueryFailed):
+        web.execute_translation("total sales", cached)
+    assert web.translation_cache.get("total sales", schema) is None
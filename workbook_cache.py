@@ -0,0 +1,117 @@
+"""
+E-commerce AI Agent - Columnar workbook cache
+Parsed Excel sheets stored as NumPy .npy bundles keyed by source hash,
+so a workbook is only parsed through openpyxl once
+"""
+
+import os
+import json
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Set INGEST_CACHE_DIR to an empty string to disable the cache
+CACHE_DIR = os.environ.get("INGEST_CACHE_DIR", ".ingest_cache")
+
+# Bundle layout version, bump when the on-disk format changes
+FORMAT_VERSION = 1
+
+
+def _bundle_dir(name, sha256):
+    """Directory holding the bundle for one version of a workbook"""
+    return os.path.join(CACHE_DIR, f"{name}-{sha256}")
+
+
+def _encode(series):
+    """Turn a column into (kind, array, missing mask) for np.save"""
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return "numeric", series.to_numpy(), None
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return "datetime", series.to_numpy(), None
+    # Text and mixed columns become fixed-width unicode so they can be memory mapped
+    missing = series.isna().to_numpy()
+    values = series.astype(str).where(~missing, "").to_numpy(dtype=str)
+    return "text", values, missing
+
+
+def _decode(kind, values, missing):
+    """Rebuild a pandas column from a cached array"""
+    if kind == "text":
+        series = pd.Series(values.astype(object))
+        return series.where(~missing, np.nan)
+    return pd.Series(values, copy=False)
+
+
+def load(name, sha256):
+    """Return the cached DataFrame for a workbook version, or None on a miss"""
+    if not CACHE_DIR:
+        return None
+    bundle = _bundle_dir(name, sha256)
+    try:
+        with open(os.path.join(bundle, "columns.json")) as f:
+            meta = json.load(f)
+        if meta.get("format") != FORMAT_VERSION:
+            return None
+
+        columns = {}
+        for i, (column, kind) in enumerate(meta["columns"]):
+            values = np.load(os.path.join(bundle, f"{i}.npy"), mmap_mode="r")
+            missing = None
+            if kind == "text":
+                missing = np.load(os.path.join(bundle, f"{i}.mask.npy"), mmap_mode="r")
+            columns[column] = _decode(kind, values, missing)
+        return pd.DataFrame(columns)
+
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable cache bundle {bundle}: {e}")
+        return None
+
+
+def store(name, sha256, df):
+    """Write a parsed workbook to the cache, replacing older versions of it"""
+    if not CACHE_DIR:
+        return
+    bundle = _bundle_dir(name, sha256)
+    staging = bundle + ".tmp"
+    try:
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+
+        meta = {"format": FORMAT_VERSION, "rows": len(df), "columns": []}
+        for i, column in enumerate(df.columns):
+            kind, values, missing = _encode(df[column])
+            np.save(os.path.join(staging, f"{i}.npy"), values, allow_pickle=False)
+            if missing is not None:
+                np.save(os.path.join(staging, f"{i}.mask.npy"), missing, allow_pickle=False)
+            meta["columns"].append([column, kind])
+        with open(os.path.join(staging, "columns.json"), "w") as f:
+            json.dump(meta, f)
+
+        shutil.rmtree(bundle, ignore_errors=True)
+        os.replace(staging, bundle)
+
+        # Drop bundles for previous versions of this workbook
+        for entry in os.listdir(CACHE_DIR):
+            if entry.startswith(f"{name}-") and entry != os.path.basename(bundle):
+                shutil.rmtree(os.path.join(CACHE_DIR, entry), ignore_errors=True)
+
+    except Exception as e:
+        # The cache is an optimisation only; never fail ingestion because of it
+        logger.warning(f"Could not cache {name} workbook: {e}")
+        shutil.rmtree(staging, ignore_errors=True)
+
+
+def read_workbook(name, path, sha256):
+    """Read a workbook through the cache, parsing the xlsx only on a miss"""
+    df = load(name, sha256)
+    if df is not None:
+        logger.info(f"Loaded {name} workbook from cache ({len(df)} rows)")
+        return df
+    df = pd.read_excel(path)
+    store(name, sha256, df)
+    return df